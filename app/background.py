@@ -0,0 +1,371 @@
+import os
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Optional
+
+from sqlalchemy import select, update, delete, func, or_
+from sqlalchemy.ext.asyncio import AsyncConnection
+from dotenv import load_dotenv
+
+from app.data_base.data_base import new_session, init_engine
+from app.dependencies import overdue_condition
+from app.models.models import Project, Task, DeletedItem, RefreshToken, Job, DataVersion
+from app.ranking import RANK_MAX_LENGTH, evenly_spaced_keys
+from app.sync import SYNC_TOMBSTONE_TTL_DAYS
+
+load_dotenv()  # Загружает переменные из .env
+OVERDUE_SWEEP_INTERVAL = float(os.getenv('OVERDUE_SWEEP_INTERVAL', 60))      # раз в сколько секунд искать просроченные (0 - не запускать)
+OVERDUE_SWEEP_BATCH_SIZE = int(os.getenv('OVERDUE_SWEEP_BATCH_SIZE', 1000))  # сколько строк обновлять в одной транзакции
+RANK_REBALANCE_INTERVAL = float(os.getenv('RANK_REBALANCE_INTERVAL', 300))   # раз в сколько секунд перестраивать ключи (ORDERING_MODE=rank)
+RANK_REBALANCE_LOOKBACK = float(os.getenv('RANK_REBALANCE_LOOKBACK', 60))    # за сколько секунд до прошлого перестроения проверять изменения
+TOMBSTONE_CLEANUP_INTERVAL = float(os.getenv('TOMBSTONE_CLEANUP_INTERVAL', 3600))  # раз в сколько секунд удалять старые записи об удалении
+REFRESH_TOKEN_CLEANUP_INTERVAL = float(os.getenv('REFRESH_TOKEN_CLEANUP_INTERVAL', 3600))  # раз в сколько секунд удалять истёкшие refresh токены
+JOB_CLEANUP_INTERVAL = float(os.getenv('JOB_CLEANUP_INTERVAL', 3600))       # раз в сколько секунд удалять старые задания
+JOB_TTL_DAYS = float(os.getenv('JOB_TTL_DAYS', 7))                          # сколько хранить выполненные задания
+BACKGROUND_LOCK_KEY = int(os.getenv('BACKGROUND_LOCK_KEY', 72031))          # ключ pg_advisory_lock процесса с фоновыми задачами
+BACKGROUND_LEADER_INTERVAL = float(os.getenv('BACKGROUND_LEADER_INTERVAL', 10))  # раз в сколько секунд остальные процессы пробуют его заменить
+
+
+class PeriodicJob:
+    """Фоновая задача, которая выполняется в цикле событий приложения через равные промежутки времени"""
+
+    def __init__(self, name: str, func: Callable[[], Awaitable], interval: float):
+        """
+        :param name: имя задачи (для логов)
+        :param func: асинхронная функция без аргументов
+        :param interval: промежуток между запусками в секундах (0 - задача не запускается)
+        """
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run(), name=self.name)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.func()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:  # ошибка не должна останавливать следующие запуски
+                logging.error(f"Background job {self.name} failed: {e}")
+            await asyncio.sleep(self.interval)
+
+
+class BackgroundLeader:
+    """
+    Запускает фоновые задачи только в одном процессе из нескольких (python -m app.serve --workers N):
+    в том, который держит advisory lock PostgreSQL на отдельном соединении. Остальные процессы раз в interval
+    пробуют взять блокировку, поэтому при остановке или падении этого процесса задачи продолжит другой
+    """
+
+    def __init__(self, jobs: list[PeriodicJob], on_start: Optional[Callable[[], Awaitable]] = None,
+                 lock_key: int = BACKGROUND_LOCK_KEY, interval: float = BACKGROUND_LEADER_INTERVAL):
+        """
+        :param jobs: задачи, которые запускаются, пока процесс держит блокировку
+        :param on_start: асинхронная функция, которая выполняется один раз после получения блокировки (до задач)
+        :param lock_key: ключ блокировки (общий для всех процессов приложения)
+        :param interval: раз в сколько секунд пробовать взять блокировку и проверять соединение с ней
+        """
+        self.jobs = jobs
+        self.on_start = on_start
+        self.lock_key = lock_key
+        self.interval = interval
+        self.is_leader = False
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name='background_leader')
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _acquire(self) -> Optional[AsyncConnection]:
+        """:return: соединение, которое держит блокировку, или None если её держит другой процесс"""
+        conn = await init_engine().connect()
+        try:
+            locked = (await conn.execute(select(func.pg_try_advisory_lock(self.lock_key)))).scalar_one()
+            await conn.commit()  # блокировка уровня сессии, транзакцию держать не нужно
+        except BaseException:
+            await conn.close()
+            raise
+        if not locked:
+            await conn.close()
+            return None
+        return conn
+
+    async def _lead(self, conn: AsyncConnection):
+        """Выполняет задачи, пока соединение с блокировкой живо"""
+        self.is_leader = True
+        logging.info("Background jobs are running in this process")
+        try:
+            if self.on_start is not None:
+                await self.on_start()
+            for job in self.jobs:
+                job.start()
+            while True:
+                await asyncio.sleep(self.interval)
+                await conn.execute(select(1))  # при обрыве соединения блокировку уже может взять другой процесс
+                await conn.commit()
+        finally:
+            self.is_leader = False
+            for job in self.jobs:
+                await job.stop()
+            try:  # соединение возвращается в пул, блокировка не должна остаться на нём
+                await conn.execute(select(func.pg_advisory_unlock(self.lock_key)))
+                await conn.commit()
+                await conn.close()
+            except Exception:
+                await conn.invalidate()
+
+    async def _run(self):
+        while True:
+            try:
+                conn = await self._acquire()
+                if conn is not None:
+                    await self._lead(conn)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:  # ошибка не должна останавливать следующие попытки
+                logging.error(f"Background leader failed: {e}")
+            await asyncio.sleep(self.interval)
+
+
+async def _mark_overdue(model, primary_key, batch_size: int, now: datetime) -> int:
+    """
+    Помечает просроченными строки одной таблицы пачками по batch_size (начиная с самых давних сроков).
+    Каждая пачка - отдельная короткая транзакция, строки заблокированные другими транзакциями пропускаются
+    :return: количество обновлённых строк
+    """
+    updated = 0
+    while True:
+        batch = (
+            select(primary_key)
+            .where(overdue_condition(model, now))
+            .order_by(model.desired_completion_date)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        async with new_session() as db:
+            result = await db.execute(
+                update(model)
+                .where(primary_key.in_(batch))
+                # статус просрочен, updated_date - чтобы /sync отдал смену статуса клиентам с курсором
+                .values(status_id=3, updated_date=datetime.now(timezone.utc))
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+
+        updated += result.rowcount
+        if result.rowcount < batch_size:
+            return updated
+
+async def sweep_overdue(batch_size: int = None) -> dict:
+    """
+    Обновляет в БД статус всех просроченных проектов и задач
+    :param batch_size: сколько строк обновлять в одной транзакции
+    :return: dict{'projects', 'tasks'} - количество помеченных просроченными
+    """
+    batch_size = batch_size or OVERDUE_SWEEP_BATCH_SIZE
+    now = datetime.now(timezone.utc)
+
+    result = {
+        'projects': await _mark_overdue(Project, Project.project_id, batch_size, now),
+        'tasks': await _mark_overdue(Task, Task.task_id, batch_size, now),
+    }
+    if result['projects'] or result['tasks']:
+        logging.info(f"Marked overdue: {result['projects']} projects, {result['tasks']} tasks")
+    return result
+
+
+overdue_sweeper = PeriodicJob('overdue_sweeper', sweep_overdue, OVERDUE_SWEEP_INTERVAL)
+
+
+# начало прошлого перестроения по часам БД (None - при следующем запуске проверяются все группы)
+_rebalanced_at: Optional[datetime] = None
+
+
+async def _broken_scopes(db, model, primary_key, scope_column, since: Optional[datetime]) -> list:
+    """
+    Группы, которые нужно перестроить: с пустыми (миграция с position_index или перемещение в режиме index),
+    слишком длинными или одинаковыми ключами, или с position_index не по порядку ключей
+    :param scope_column: столбец группы внутри которой действует порядок (Project.user_id или Task.project_id)
+    :param since: проверять только пользователей, чьи проекты (задачи) менялись после этого времени (data_versions)
+    :return: значения scope_column
+    """
+    active = model.status_id != 4
+    if since is not None:
+        modified = DataVersion.projects_modified if model is Project else DataVersion.tasks_modified
+        active &= model.user_id.in_(select(DataVersion.user_id).where(modified >= since))
+
+    ranked = select(
+        scope_column.label('scope'),
+        model.position_index,
+        (func.row_number().over(partition_by=scope_column, order_by=(model.rank, primary_key)) - 1).label('new_position')
+    ).where(active & model.rank.is_not(None)).subquery()
+
+    result = await db.execute(
+        select(scope_column)
+        .where(active & or_(model.rank.is_(None), func.length(model.rank) > RANK_MAX_LENGTH))
+        .union(
+            select(scope_column).where(active & model.rank.is_not(None))
+            .group_by(scope_column, model.rank).having(func.count() > 1),
+            select(ranked.c.scope).where(ranked.c.position_index != ranked.c.new_position),
+        )
+    )
+    return result.scalars().all()
+
+async def _rebalance_scope(model, primary_key, scope_column, scope) -> Optional[tuple[bool, int]]:
+    """
+    Перестраивает одну группу в отдельной короткой транзакции. Ключи с равным шагом выдаются только если текущие
+    пустые, слишком длинные или повторяются, иначе лишь position_index приводится к порядку ключей.
+    Записываются только строки, у которых что-то изменилось
+    :return: (перестроены ли ключи, количество изменённых position_index) или None, если часть строк группы
+             заблокирована другой транзакцией (группа будет перестроена при следующем запуске)
+    """
+    in_scope = (model.status_id != 4) & (scope_column == scope)
+    async with new_session() as db:
+        total = (await db.execute(select(func.count()).where(in_scope))).scalar_one()
+        rows = (await db.execute(
+            select(primary_key, model.rank, model.position_index).where(in_scope).with_for_update(skip_locked=True)
+        )).all()
+        if len(rows) < total:
+            return None
+
+        has_empty = any(row.rank is None for row in rows)
+        if has_empty:  # ключи ещё не использовались, порядок задаёт position_index
+            rows.sort(key=lambda row: (row.position_index is None, row.position_index or 0, row[0]))
+        else:
+            rows.sort(key=lambda row: (row.rank, row[0]))
+        rebuild = (has_empty or len({row.rank for row in rows}) < len(rows) or
+                   any(len(row.rank) > RANK_MAX_LENGTH for row in rows))
+        keys = evenly_spaced_keys(len(rows)) if rebuild else [row.rank for row in rows]
+
+        # изменение ключа видно клиенту, /sync находит его по updated_date. position_index в режиме rank
+        # вычисляется из ключей, поэтому его пересчёт updated_date не меняет и курсоры /sync не устаревают
+        now = datetime.now(timezone.utc)
+        new_ranks, new_positions = [], []
+        for position, (row, key) in enumerate(zip(rows, keys)):
+            if key != row.rank:
+                new_ranks.append({primary_key.key: row[0], 'rank': key, 'position_index': position, 'updated_date': now})
+            elif position != row.position_index:
+                new_positions.append({primary_key.key: row[0], 'position_index': position})
+        for parameters in (new_ranks, new_positions):
+            if parameters:
+                await db.execute(update(model), parameters)
+        await db.commit()
+    return rebuild, sum(position != row.position_index for position, row in enumerate(rows))
+
+async def rebalance_ranks() -> dict:
+    """
+    Обслуживание режима ORDERING_MODE=rank: заполняет пустые ключи по position_index (миграция),
+    перестраивает слишком длинные и одинаковые ключи и пересчитывает position_index по ключам.
+    Первый запуск проверяет все группы, следующие - только группы пользователей, менявших данные после
+    прошлого запуска (с запасом RANK_REBALANCE_LOOKBACK на ещё не завершённые тогда транзакции)
+    :return: dict{'projects', 'tasks'} - количество перестроенных групп, dict{'positions'} - изменённых позиций
+    """
+    global _rebalanced_at
+    tables = {'projects': (Project, Project.project_id, Project.user_id),
+              'tasks': (Task, Task.task_id, Task.project_id)}
+
+    async with new_session() as db:
+        started = (await db.execute(select(func.now()))).scalar_one()
+        since = None if _rebalanced_at is None else _rebalanced_at - timedelta(seconds=RANK_REBALANCE_LOOKBACK)
+        scopes = {name: await _broken_scopes(db, *table, since) for name, table in tables.items()}
+
+    result = {'projects': 0, 'tasks': 0, 'positions': 0}
+    skipped = 0
+    for name, table in tables.items():
+        for scope in scopes[name]:
+            outcome = await _rebalance_scope(*table, scope)
+            if outcome is None:
+                skipped += 1
+                continue
+            result[name] += outcome[0]
+            result['positions'] += outcome[1]
+
+    if not skipped:  # пропущенные группы должны попасть в следующую проверку
+        _rebalanced_at = started
+    if any(result.values()) or skipped:
+        logging.info(f"Rank rebalance: {result}, skipped {skipped} locked groups")
+    return result
+
+
+rank_rebalancer = PeriodicJob('rank_rebalancer', rebalance_ranks, RANK_REBALANCE_INTERVAL)
+
+
+async def cleanup_tombstones() -> int:
+    """
+    Удаляет записи о полном удалении старше SYNC_TOMBSTONE_TTL_DAYS (клиенты с более старым курсором /sync получат 410)
+    :return: количество удалённых записей
+    """
+    async with new_session() as db:
+        result = await db.execute(
+            delete(DeletedItem).where(
+                DeletedItem.deleted_date < datetime.now(timezone.utc) - timedelta(days=SYNC_TOMBSTONE_TTL_DAYS)
+            )
+        )
+        await db.commit()
+    if result.rowcount:
+        logging.info(f"Removed {result.rowcount} old tombstones")
+    return result.rowcount
+
+
+tombstone_cleaner = PeriodicJob('tombstone_cleaner', cleanup_tombstones, TOMBSTONE_CLEANUP_INTERVAL)
+
+
+async def cleanup_refresh_tokens() -> int:
+    """
+    Удаляет истёкшие refresh токены (отозванные и использованные хранятся до истечения, чтобы распознать их повтор)
+    :return: количество удалённых токенов
+    """
+    async with new_session() as db:
+        result = await db.execute(
+            delete(RefreshToken).where(RefreshToken.expires_date < datetime.now(timezone.utc))
+        )
+        await db.commit()
+    if result.rowcount:
+        logging.info(f"Removed {result.rowcount} expired refresh tokens")
+    return result.rowcount
+
+
+refresh_token_cleaner = PeriodicJob('refresh_token_cleaner', cleanup_refresh_tokens, REFRESH_TOKEN_CLEANUP_INTERVAL)
+
+
+async def cleanup_jobs() -> int:
+    """
+    Удаляет выполненные и завершённые с ошибкой задания старше JOB_TTL_DAYS
+    :return: количество удалённых заданий
+    """
+    async with new_session() as db:
+        result = await db.execute(
+            delete(Job).where(Job.finished_date < datetime.now(timezone.utc) - timedelta(days=JOB_TTL_DAYS))
+        )
+        await db.commit()
+    if result.rowcount:
+        logging.info(f"Removed {result.rowcount} finished jobs")
+    return result.rowcount
+
+
+job_cleaner = PeriodicJob('job_cleaner', cleanup_jobs, JOB_CLEANUP_INTERVAL)
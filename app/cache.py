@@ -0,0 +1,105 @@
+import time
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Optional
+
+
+class CacheBackend(ABC):
+    """
+    Интерфейс хранилища кэша.
+    Локальная реализация живёт в памяти процесса, общая (для нескольких воркеров) должна реализовать эти же методы.
+    """
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[Any]:
+        """:return: значение по ключу или None если его нет (или оно устарело)"""
+
+    @abstractmethod
+    async def set(self, key: str, value: Any):
+        """Сохраняет значение по ключу"""
+
+    @abstractmethod
+    async def delete(self, key: str):
+        """Удаляет значение по ключу (если оно есть)"""
+
+    @abstractmethod
+    async def clear(self):
+        """Удаляет все значения"""
+
+
+class LocalCache(CacheBackend):
+    """Кэш в памяти процесса с ограниченным размером (LRU) и временем жизни записей (TTL)"""
+
+    def __init__(self, max_size: int, ttl: float):
+        """
+        :param max_size: максимальное количество записей (самые давно использованные вытесняются)
+        :param ttl: время жизни записи в секундах
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: OrderedDict[str, tuple[float, Any]] = OrderedDict()  # ключ -> (время устаревания, значение)
+        self._lock = threading.Lock()
+
+    async def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+
+            expires_at, value = item
+            if expires_at < time.monotonic():  # запись устарела
+                del self._data[key]
+                return None
+
+            self._data.move_to_end(key)  # помечаем как недавно использованную
+            return value
+
+    async def set(self, key: str, value: Any):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)  # вытесняем самую давно использованную запись
+
+    async def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    async def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class CacheStats:
+    """Счётчики попаданий и промахов кэша"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def hit(self):
+        with self._lock:
+            self.hits += 1
+
+    def miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def reset(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / total if total else 0.0,
+            }
@@ -0,0 +1,72 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from typing import NamedTuple, Optional
+
+from fastapi import Response, status
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.dependencies import overdue_condition
+from app.jobs import PENDING_STATES
+from app.models import Project, DataVersion, Job
+from app.ranking import rank_mode
+
+
+class VersionStamp(NamedTuple):
+    etag: str
+    last_modified: Optional[datetime]
+
+    def headers(self) -> dict:
+        headers = {'ETag': self.etag}
+        if self.last_modified is not None:
+            headers['Last-Modified'] = format_datetime(self.last_modified.astimezone(timezone.utc), usegmt=True)
+        return headers
+
+
+def _user_version(column, user_id: int):
+    """:return: подзапрос столбца data_versions пользователя"""
+    return select(column).where(DataVersion.user_id == user_id).scalar_subquery()
+
+async def version_stamp(db: AsyncSession, model, user_id: int, scope_condition, query_string: str = '') -> VersionStamp:
+    """
+    Версия проектов (задач) пользователя без обхода его строк: счётчик data_versions, который увеличивает
+    триггер при любой записи, количество просроченных, но ещё не отмеченных фоновой задачей строк группы
+    (просроченность наступает со временем без записи в БД, считается по частичному индексу)
+    и количество невыполненных заданий пользователя
+    :param user_id: владелец строк (версия общая для всех его проектов или всех его задач)
+    :param scope_condition: условие группы (проекты пользователя, задачи пользователя или проекта)
+    :param query_string: параметры запроса (фильтры и курсор), разные страницы получают разный ETag
+    """
+    now = datetime.now(timezone.utc)
+    if model is Project:
+        version_column, modified_column = DataVersion.projects_version, DataVersion.projects_modified
+    else:
+        version_column, modified_column = DataVersion.tasks_version, DataVersion.tasks_modified
+
+    result = await db.execute(select(
+        func.coalesce(_user_version(version_column, user_id), 0),  # строки версии нет, пока пользователь ничего не менял
+        _user_version(modified_column, user_id),
+        select(func.count()).where(scope_condition & overdue_condition(model, now)).scalar_subquery(),
+        # задачи проекта, удаляемого заданием, скрываются сразу, а версия изменится только с удалением строк
+        select(func.count()).where((Job.user_id == user_id) & Job.state.in_(PENDING_STATES)).scalar_subquery(),
+    ))
+    row = result.one()
+    version = '|'.join(str(value) for value in (*row, rank_mode(), query_string))
+    return VersionStamp(etag=f'W/"{hashlib.md5(version.encode()).hexdigest()}"', last_modified=row[1])
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Сравнение If-None-Match с ETag (слабое сравнение: префикс W/ не учитывается)
+    :param if_none_match: значение заголовка If-None-Match (может содержать несколько ETag через запятую или *)
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    opaque = etag.removeprefix('W/')
+    return any(candidate.strip().removeprefix('W/') == opaque for candidate in if_none_match.split(','))
+
+def not_modified(stamp: VersionStamp) -> Response:
+    """:return: ответ 304 без тела"""
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=stamp.headers())
@@ -0,0 +1,80 @@
+import os
+import logging
+
+from sqlalchemy import text
+from dotenv import load_dotenv
+
+load_dotenv()  # Загружает переменные из .env
+# счётчики задач по проектам для /stats/: чтение O(проектов) вместо O(задач), но каждая запись задачи
+# (создание, смена статуса, приоритета или проекта, удаление) дополнительно обновляет строку task_counters
+STATS_COUNTERS = os.getenv('STATS_COUNTERS', 'false').lower() == 'true'
+
+# Триггер вместо обновления счётчиков в роутерах: статус задач меняют и массовые эндпоинты, импорт,
+# архивация проекта и фоновая задача просроченных. Строка счётчика, дошедшая до нуля, удаляется
+TRIGGER_FUNCTION = """
+CREATE OR REPLACE FUNCTION task_counters_apply() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' AND OLD.project_id = NEW.project_id
+            AND coalesce(OLD.status_id, 1) = coalesce(NEW.status_id, 1)
+            AND coalesce(OLD.priority, 1) = coalesce(NEW.priority, 1) THEN
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE task_counters SET task_count = task_count - 1
+        WHERE project_id = OLD.project_id AND status_id = coalesce(OLD.status_id, 1)
+          AND priority = coalesce(OLD.priority, 1);
+        DELETE FROM task_counters
+        WHERE project_id = OLD.project_id AND status_id = coalesce(OLD.status_id, 1)
+          AND priority = coalesce(OLD.priority, 1) AND task_count <= 0;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO task_counters (project_id, status_id, priority, user_id, task_count)
+        VALUES (NEW.project_id, coalesce(NEW.status_id, 1), coalesce(NEW.priority, 1), NEW.user_id, 1)
+        ON CONFLICT (project_id, status_id, priority) DO UPDATE SET task_count = task_counters.task_count + 1;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+# срабатывает только при изменении столбцов, от которых зависят счётчики (не при сдвиге позиций и правке текста)
+CREATE_TRIGGER = """
+CREATE TRIGGER task_counters_apply
+AFTER INSERT OR DELETE OR UPDATE OF project_id, status_id, priority ON tasks
+FOR EACH ROW EXECUTE FUNCTION task_counters_apply()
+"""
+
+REBUILD_COUNTERS = """
+INSERT INTO task_counters (project_id, status_id, priority, user_id, task_count)
+SELECT project_id, coalesce(status_id, 1), coalesce(priority, 1), min(user_id), count(*)
+FROM tasks
+GROUP BY project_id, coalesce(status_id, 1), coalesce(priority, 1)
+"""
+
+
+def install_counters(sync_conn):
+    """
+    Создаёт триггер и заново заполняет task_counters по tasks (при включении счётчики могли устареть).
+    Таблица tasks блокируется от записи до конца транзакции, чтобы пересчёт не разошёлся с триггером
+    """
+    sync_conn.execute(text('LOCK TABLE tasks IN SHARE ROW EXCLUSIVE MODE'))
+    sync_conn.execute(text(TRIGGER_FUNCTION))
+    sync_conn.execute(text('DROP TRIGGER IF EXISTS task_counters_apply ON tasks'))
+    sync_conn.execute(text(CREATE_TRIGGER))
+    sync_conn.execute(text('DELETE FROM task_counters'))
+    sync_conn.execute(text(REBUILD_COUNTERS))
+    logging.info("Task counters installed")
+
+def remove_counters(sync_conn):
+    """Удаляет триггер (записи задач больше не обновляют task_counters), сама таблица остаётся"""
+    sync_conn.execute(text('DROP TRIGGER IF EXISTS task_counters_apply ON tasks'))
+    sync_conn.execute(text('DELETE FROM task_counters'))
+
+def sync_counters(sync_conn):
+    """Включает или выключает счётчики в соответствии с STATS_COUNTERS (при запуске create_database)"""
+    if STATS_COUNTERS:
+        install_counters(sync_conn)
+    else:
+        remove_counters(sync_conn)
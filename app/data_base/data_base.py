@@ -1,11 +1,15 @@
 import os
 import logging
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, AsyncEngine
 from sqlalchemy.orm import sessionmaker, declarative_base
-from sqlalchemy import text, select
+from sqlalchemy import text, select, inspect
 from dotenv import load_dotenv
 
 from app.data_base.base import Base
+from app.data_base.counters import sync_counters
+from app.data_base.pool import MeteredQueuePool, pool_metrics
+from app.data_base.queries import instrument_engine
+from app.data_base.versions import install_versions
 from app.models import Status
 
 load_dotenv()  # Загружает переменные из .env
@@ -19,21 +23,70 @@ POSTGRES_SERVER_URL = f'postgresql+asyncpg://{USER}:{PASSWORD}@{HOST}/postgres'
 # postgresql+asyncpg это означает, что БД работает в асинхронном режиме
 SQL_DB_URL = f'postgresql+asyncpg://{USER}:{PASSWORD}@{HOST}/{DB_NAME}'
 
-engine_for_create = create_async_engine(SQL_DB_URL)
+# Настройки пула соединений
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 10))              # постоянно открытых соединений
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 20))        # сколько можно открыть сверх DB_POOL_SIZE при нагрузке
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 30))      # сколько секунд ждать свободное соединение
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))      # через сколько секунд пересоздавать соединение
+DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true'  # проверять соединение перед выдачей
+DB_STATEMENT_CACHE_SIZE = int(os.getenv('DB_STATEMENT_CACHE_SIZE', 100))    # кэш подготовленных выражений asyncpg (0 для pgbouncer)
 
-async def get_db()->AsyncSession:
-    # это переменная для создания подключения
-    engine = create_async_engine(SQL_DB_URL)
+# один движок (и один пул соединений) на процесс
+engine: AsyncEngine | None = None
+session_local: sessionmaker | None = None
 
-    # bind это какой движок необходимо использовать
-    session_local = sessionmaker(
-        engine,
-        class_=AsyncSession,
-        expire_on_commit=False,
-        autoflush=False
-    )
 
-    db = session_local()
+def init_engine() -> AsyncEngine:
+    """
+    Создаёт движок с пулом соединений и фабрику сессий (если они ещё не созданы).
+    Вызывается при старте приложения, но при необходимости создастся и при первом запросе.
+    :return: движок БД
+    """
+    global engine, session_local
+
+    if engine is None:
+        engine = create_async_engine(
+            SQL_DB_URL,
+            poolclass=MeteredQueuePool,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=DB_POOL_PRE_PING,
+            connect_args={'statement_cache_size': DB_STATEMENT_CACHE_SIZE}
+        )
+        instrument_engine(engine.sync_engine)  # статистика запросов для QueryMetricsMiddleware
+
+        # bind это какой движок необходимо использовать
+        session_local = sessionmaker(
+            engine,
+            class_=AsyncSession,
+            expire_on_commit=False,
+            autoflush=False
+        )
+    return engine
+
+async def dispose_engine():
+    """Закрывает все соединения пула. Вызывается при остановке приложения"""
+    global engine, session_local
+
+    if engine is not None:
+        await engine.dispose()
+        engine = None
+        session_local = None
+
+def get_pool_metrics() -> dict:
+    """:return: метрики пула соединений (занятые соединения, время ожидания, переполнение)"""
+    return pool_metrics.snapshot(engine.pool if engine is not None else None)
+
+def new_session() -> AsyncSession:
+    """:return: новая сессия из общего пула соединений (её необходимо закрыть)"""
+    if session_local is None:
+        init_engine()
+    return session_local()
+
+async def get_db()->AsyncSession:
+    db = new_session()
     try:
         yield db
     finally:
@@ -70,6 +123,12 @@ async def create_database():
         async with engine.begin() as conn:
             logging.info("Creating database tables...")
             await conn.run_sync(Base.metadata.create_all)
+            # create_all создаёт столбцы и индексы только вместе с новой таблицей, поэтому для старых БД досоздаём их
+            await conn.run_sync(add_missing_columns)
+            await conn.run_sync(create_missing_indexes)
+            await conn.run_sync(create_trigram_indexes)
+            await conn.run_sync(sync_counters)  # триггер счётчиков задач для /stats/ (STATS_COUNTERS)
+            await conn.run_sync(install_versions)  # триггеры версий для ETag в /get_projects/ и /get_tasks/
             logging.info("Database tables created successfully")
     except Exception as e:
         logging.error(f"Error creating tables: {e}")
@@ -85,6 +144,59 @@ async def create_database():
     await engine.dispose()
 
 
+def add_missing_columns(sync_conn):
+    """
+    Добавляет в существующие таблицы столбцы, которые появились в моделях позже
+    (все такие столбцы nullable или вычисляемые - их значения для старых строк вычисляет PostgreSQL)
+    """
+    inspector = inspect(sync_conn)
+    preparer = sync_conn.dialect.identifier_preparer
+    for table in Base.metadata.sorted_tables:
+        existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing_columns:
+                definition = column.type.compile(dialect=sync_conn.dialect)
+                if column.computed is not None:
+                    definition += f' GENERATED ALWAYS AS ({column.computed.sqltext}) STORED'
+                sync_conn.execute(text(
+                    f'ALTER TABLE {preparer.quote(table.name)} ADD COLUMN {preparer.quote(column.name)} {definition}'
+                ))
+                logging.info(f"Added column {table.name}.{column.name}")
+
+def create_missing_indexes(sync_conn):
+    """Создаёт индексы из моделей, которых ещё нет в БД (для таблиц созданных до их появления)"""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
+
+# триграммные индексы для поиска по части слова и с опечатками (нужно расширение pg_trgm): имя -> (таблица, столбец)
+TRIGRAM_INDEXES = {
+    'ix_projects_title_trgm': ('projects', 'title'),
+    'ix_tasks_title_trgm': ('tasks', 'title'),
+}
+
+def create_trigram_indexes(sync_conn) -> bool:
+    """
+    Подключает pg_trgm и создаёт TRIGRAM_INDEXES. Если расширение не установлено на сервере (пакет contrib)
+    или нет прав на его подключение, то индексы не создаются и поиск работает без нечёткого совпадения
+    :return: True если pg_trgm подключено
+    """
+    available = sync_conn.execute(text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")).scalar()
+    if not available:
+        logging.warning("Extension pg_trgm is not available, fuzzy search is disabled")
+        return False
+    try:
+        with sync_conn.begin_nested():  # ошибка прав не должна откатывать создание таблиц
+            sync_conn.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+    except Exception as e:
+        logging.warning(f"Could not create extension pg_trgm, fuzzy search is disabled: {e}")
+        return False
+
+    for name, (table, column) in TRIGRAM_INDEXES.items():
+        sync_conn.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin ({column} gin_trgm_ops)'))
+    return True
+
+
 async def create_status_if_not_exists(db: AsyncSession, status_name: str):
     """
     Создаёт запись статуса, если она не существует.
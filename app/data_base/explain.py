@@ -0,0 +1,39 @@
+import json
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Инструменты для проверки планов запросов (используются в тестах индексов)
+
+
+async def explain(db: AsyncSession, statement, analyze: bool = False) -> dict:
+    """
+    :param db: сессия БД
+    :param statement: запрос (select/update/delete). При analyze=True запрос будет выполнен!
+    :param analyze: выполнить запрос и получить реальное время
+    :return: корневой узел плана
+    """
+    conn = await db.connection()  # тот же connection (и транзакция) что и у сессии
+    compiled = statement.compile(dialect=conn.dialect, compile_kwargs={"render_postcompile": True})
+    params = compiled.construct_params()
+    args = tuple(params[name] for name in compiled.positiontup or ())
+
+    options = 'ANALYZE, FORMAT JSON' if analyze else 'FORMAT JSON'
+    result = (await conn.exec_driver_sql(f'EXPLAIN ({options}) {compiled}', args)).scalar_one()
+    if isinstance(result, str):
+        result = json.loads(result)
+    return result[0]['Plan']
+
+def plan_nodes(plan: dict) -> list[dict]:
+    """:return: все узлы плана (включая вложенные)"""
+    nodes = [plan]
+    for child in plan.get('Plans', []):
+        nodes.extend(plan_nodes(child))
+    return nodes
+
+def used_indexes(plan: dict) -> set[str]:
+    """:return: имена индексов которые использует план"""
+    return {node['Index Name'] for node in plan_nodes(plan) if 'Index Name' in node}
+
+def seq_scanned_tables(plan: dict) -> set[str]:
+    """:return: таблицы которые план читает последовательным сканированием"""
+    return {node['Relation Name'] for node in plan_nodes(plan) if node['Node Type'] == 'Seq Scan'}
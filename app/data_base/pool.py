@@ -0,0 +1,78 @@
+import time
+import threading
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+
+class PoolMetrics:
+    """Счётчики работы пула соединений (нужны для подбора размера пула под реальную нагрузку)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Обнуляет все накопленные счётчики"""
+        self.checkouts = 0         # сколько раз соединение выдавалось из пула
+        self.timeouts = 0          # сколько раз не дождались свободного соединения
+        self.wait_time_total = 0.0 # суммарное время ожидания соединения (секунды)
+        self.wait_time_max = 0.0   # максимальное время ожидания соединения (секунды)
+        self.overflow_peak = 0     # максимальное количество соединений сверх pool_size
+
+    def record_checkout(self, wait_time: float, overflow: int):
+        """
+        Фиксирует выдачу соединения из пула
+        :param wait_time: сколько секунд ждали соединение
+        :param overflow: текущее переполнение пула (может быть отрицательным)
+        """
+        with self._lock:
+            self.checkouts += 1
+            self.wait_time_total += wait_time
+            self.wait_time_max = max(self.wait_time_max, wait_time)
+            self.overflow_peak = max(self.overflow_peak, overflow)
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def snapshot(self, pool: AsyncAdaptedQueuePool = None) -> dict:
+        """
+        :param pool: пул, текущее состояние которого необходимо добавить к счётчикам
+        :return: словарь с метриками пула
+        """
+        with self._lock:
+            data = {
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'wait_time_total': self.wait_time_total,
+                'wait_time_avg': self.wait_time_total / self.checkouts if self.checkouts else 0.0,
+                'wait_time_max': self.wait_time_max,
+                'overflow_peak': self.overflow_peak,
+            }
+
+        if pool is not None:
+            data.update({
+                'pool_size': pool.size(),
+                'checked_out': pool.checkedout(),
+                'checked_in': pool.checkedin(),
+                'overflow': max(pool.overflow(), 0),
+            })
+        return data
+
+
+pool_metrics = PoolMetrics()
+
+
+class MeteredQueuePool(AsyncAdaptedQueuePool):
+    """Пул соединений, который замеряет время ожидания свободного соединения и переполнение"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            pool_metrics.record_timeout()
+            raise
+        pool_metrics.record_checkout(time.perf_counter() - start, self.overflow())
+        return connection
@@ -0,0 +1,91 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Подсчёт запросов к БД. Запросы записываются во все активные в текущем контексте сборщики
+# (collect_queries), поэтому статистика одного HTTP запроса не смешивается с соседними
+
+SLOW_STATEMENT_MAX_LENGTH = 200  # сколько символов самого медленного запроса сохранять
+
+
+class QueryStats:
+    """Статистика запросов к БД внутри одного блока collect_queries"""
+
+    def __init__(self, keep_statements: bool = False):
+        """:param keep_statements: сохранять текст всех запросов (для тестов)"""
+        self.count = 0
+        self.total_time = 0.0
+        self.slowest_time = 0.0
+        self.slowest_statement: Optional[str] = None
+        self.rows = 0
+        self.statements: Optional[list[str]] = [] if keep_statements else None
+
+    def record(self, statement: str, duration: float, rows: int):
+        """
+        :param duration: время выполнения в секундах
+        :param rows: количество полученных (SELECT) или изменённых строк
+        """
+        self.count += 1
+        self.total_time += duration
+        self.rows += rows
+        if duration >= self.slowest_time:
+            self.slowest_time = duration
+            self.slowest_statement = statement[:SLOW_STATEMENT_MAX_LENGTH]
+        if self.statements is not None:
+            self.statements.append(statement)
+
+    def server_timing(self) -> str:
+        """:return: значение заголовка Server-Timing"""
+        return (f'db;dur={self.total_time * 1000:.2f};desc="{self.count} queries, {self.rows} rows", '
+                f'db-slowest;dur={self.slowest_time * 1000:.2f}')
+
+    def snapshot(self) -> dict:
+        return {
+            'queries': self.count,
+            'db_ms': round(self.total_time * 1000, 2),
+            'slowest_ms': round(self.slowest_time * 1000, 2),
+            'slowest_statement': self.slowest_statement,
+            'rows': self.rows,
+        }
+
+
+_collectors: ContextVar[tuple[QueryStats, ...]] = ContextVar('query_collectors', default=())
+
+
+@contextmanager
+def collect_queries(keep_statements: bool = False) -> Iterator[QueryStats]:
+    """
+    Собирает статистику всех запросов к БД, выполненных внутри блока в текущем контексте
+    :param keep_statements: сохранять текст всех запросов
+    """
+    stats = QueryStats(keep_statements)
+    token = _collectors.set(_collectors.get() + (stats,))
+    try:
+        yield stats
+    finally:
+        _collectors.reset(token)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info['query_start'] = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    collectors = _collectors.get()
+    if not collectors:
+        return
+
+    duration = time.perf_counter() - conn.info.pop('query_start', time.perf_counter())
+    rows = cursor.rowcount
+    if rows < 0:  # у SELECT asyncpg не заполняет rowcount, строки уже получены в буфер курсора
+        rows = len(getattr(cursor, '_rows', ()))
+    for stats in collectors:
+        stats.record(statement, duration, rows)
+
+def instrument_engine(engine: Engine):
+    """Подключает подсчёт запросов к движку (AsyncEngine.sync_engine)"""
+    if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
@@ -0,0 +1,47 @@
+import logging
+
+from sqlalchemy import text
+
+# Триггер вместо обновления версий в роутерах: проекты и задачи меняют и массовые эндпоинты, импорт, задания,
+# фоновые задачи просроченных и ключей сортировки. Триггер уровня выражения, поэтому массовое изменение
+# увеличивает версию пользователя один раз, а не для каждой строки. Строки пользователей блокируются
+# в порядке user_id, чтобы выражения затрагивающие нескольких пользователей не взаимоблокировались
+TRIGGER_FUNCTION = """
+CREATE OR REPLACE FUNCTION data_versions_bump() RETURNS trigger AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'projects' THEN
+        INSERT INTO data_versions (user_id, projects_version, projects_modified)
+        SELECT DISTINCT user_id, 1, now() FROM changed_rows WHERE user_id IS NOT NULL ORDER BY user_id
+        ON CONFLICT (user_id) DO UPDATE
+        SET projects_version = data_versions.projects_version + 1, projects_modified = now();
+    ELSE
+        INSERT INTO data_versions (user_id, tasks_version, tasks_modified)
+        SELECT DISTINCT user_id, 1, now() FROM changed_rows WHERE user_id IS NOT NULL ORDER BY user_id
+        ON CONFLICT (user_id) DO UPDATE
+        SET tasks_version = data_versions.tasks_version + 1, tasks_modified = now();
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+# таблица переходов допускается только у триггера на одно событие, поэтому по триггеру на каждую операцию
+TRIGGERS = {
+    f'{table}_version_{operation.lower()}': (
+        f'CREATE TRIGGER {table}_version_{operation.lower()} AFTER {operation} ON {table} '
+        f'REFERENCING {"OLD" if operation == "DELETE" else "NEW"} TABLE AS changed_rows '
+        f'FOR EACH STATEMENT EXECUTE FUNCTION data_versions_bump()',
+        table,
+    )
+    for table in ('projects', 'tasks')
+    for operation in ('INSERT', 'UPDATE', 'DELETE')
+}
+
+
+def install_versions(sync_conn):
+    """Создаёт (пересоздаёт) триггеры версий на projects и tasks (при запуске create_database)"""
+    sync_conn.execute(text(TRIGGER_FUNCTION))
+    for name, (create_trigger, table) in TRIGGERS.items():
+        sync_conn.execute(text(f'DROP TRIGGER IF EXISTS {name} ON {table}'))
+        sync_conn.execute(text(create_trigger))
+    logging.info("Data version triggers installed")
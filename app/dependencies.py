@@ -5,14 +5,19 @@ from passlib.context import CryptContext
 from jose import JWTError, jwt
 from fastapi import Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import joinedload
-from sqlalchemy import select, update
+from sqlalchemy import select, update, case, func
 from dotenv import load_dotenv
-from typing import List
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Mapping, NamedTuple, Optional, Type
+from pydantic import BaseModel
 
-from app.data_base.data_base import get_db
-from app.models.models import Project, Task
+from app.cache import CacheBackend, LocalCache, CacheStats
+from app.hashing import PasswordHasher
+from app.data_base.data_base import get_db, new_session
+from app.models.models import Project, Task, Status
 from app.schemas import TokenData
+from app.schemas.response import Status as StatusResponse
 from app.models import User
 
 
@@ -21,10 +26,63 @@ load_dotenv()  # Загружает переменные из .env
 SECRET_KEY = os.getenv('SECRET_KEY')
 ACCESS_TOKEN_EXPIRE_MINUTES = float(os.getenv('ACCESS_TOKEN_EXPIRE_MINUTES'))
 ALGORITHM = "HS256"
+REFRESH_TOKEN_TYPE = 'refresh'  # поле typ refresh токена (такой токен не принимается вместо access токена)
+# lookup - пользователь токена загружается из БД (или кэша пользователей) на каждый запрос,
+# stateless - достаточно подписи токена и проверки версии токенов пользователя по таблице версий в памяти
+AUTH_MODE = os.getenv('AUTH_MODE', 'lookup')
+TOKEN_VERSION_TTL = float(os.getenv('TOKEN_VERSION_TTL', 30))  # через сколько секунд перечитывать версию из БД
+
+# Кэш аутентифицированных пользователей (чтобы не ходить в БД за одной и той же строкой users на каждый запрос)
+USER_CACHE_ENABLED = os.getenv('USER_CACHE_ENABLED', 'true').lower() == 'true'
+USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', 60))               # время жизни записи (секунды)
+USER_CACHE_MAX_SIZE = int(os.getenv('USER_CACHE_MAX_SIZE', 10000))    # максимальное количество пользователей в кэше
+
+# Пул для хеширования паролей (bcrypt не должен блокировать цикл событий)
+PASSWORD_HASH_EXECUTOR = os.getenv('PASSWORD_HASH_EXECUTOR', 'thread')                 # thread или process
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', min(4, os.cpu_count() or 1)))  # 0 - считать прямо в цикле событий
+PASSWORD_HASH_MAX_CONCURRENCY = int(os.getenv('PASSWORD_HASH_MAX_CONCURRENCY', PASSWORD_HASH_WORKERS * 2))
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+password_hasher = PasswordHasher(max_workers=PASSWORD_HASH_WORKERS,
+                                 max_concurrency=PASSWORD_HASH_MAX_CONCURRENCY,
+                                 use_processes=PASSWORD_HASH_EXECUTOR == 'process')
+
+user_cache: CacheBackend = LocalCache(max_size=USER_CACHE_MAX_SIZE, ttl=USER_CACHE_TTL)
+user_cache_stats = CacheStats()
+
+# Версии токенов пользователей (user_id -> users.token_version). Токен с другой версией отозван.
+# В другом воркере отзыв станет виден не позже чем через TOKEN_VERSION_TTL (сразу - с общим хранилищем)
+token_versions: CacheBackend = LocalCache(max_size=USER_CACHE_MAX_SIZE, ttl=TOKEN_VERSION_TTL)
+MISSING_USER_VERSION = -1  # версия несуществующего пользователя (не совпадает ни с одним токеном)
+
+# столбцы пользователя которые хранятся в кэше
+USER_CACHE_FIELDS = ('user_id', 'login', 'password', 'email', 'created_date', 'last_login', 'token_version')
+
+
+class Principal(NamedTuple):
+    """Аутентифицированный пользователь для роутеров. Строку users целиком загружает только get_current_user"""
+    user_id: int
+    login: str
+
+def set_user_cache_backend(backend: CacheBackend):
+    """
+    Заменяет хранилище кэша пользователей (например, на общее для всех воркеров)
+    :param backend: объект реализующий CacheBackend
+    """
+    global user_cache
+    user_cache = backend
+
+def set_token_version_backend(backend: CacheBackend):
+    """Заменяет хранилище версий токенов (общее для всех воркеров делает отзыв токенов мгновенным)"""
+    global token_versions
+    token_versions = backend
+
+async def invalidate_cached_user(login: str):
+    """Удаляет пользователя из кэша. Необходимо вызывать при любом изменении пользователя"""
+    await user_cache.delete(login)
+
 # создание токена для пользователя
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
@@ -36,28 +94,111 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme),
-                           db: AsyncSession = Depends(get_db)):
-    credentials_exception = HTTPException(
+def stateless_auth() -> bool:
+    """:return: True если токены проверяются без загрузки пользователя (AUTH_MODE=stateless)"""
+    return AUTH_MODE == 'stateless'
+
+def token_claims(user_id: int, login: str, token_version: Optional[int]) -> dict:
+    """
+    Данные токена пользователя: sub - логин, uid и ver - для проверки без запроса к БД (AUTH_MODE=stateless)
+    :param token_version: users.token_version
+    """
+    return {"sub": login, "uid": user_id, "ver": token_version or 0}
+
+def credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=401,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def decode_access_token(token: str) -> dict:
+    """
+    :return: данные токена (sub обязателен)
+    :raise HTTPException: 401 если подпись неверна или токен истёк
+    """
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-        token_data = TokenData(username=username)
     except JWTError:
-        raise credentials_exception
+        raise credentials_exception()
+    if payload.get("sub") is None or payload.get("typ") == REFRESH_TOKEN_TYPE:
+        raise credentials_exception()
+    return payload
+
+async def current_token_version(user_id: int, db: AsyncSession) -> int:
+    """:return: версия токенов пользователя (из памяти, из БД только при промахе)"""
+    version = await token_versions.get(str(user_id))
+    if version is None:
+        result = await db.execute(select(User.token_version).where(User.user_id == user_id))
+        row = result.one_or_none()
+        version = MISSING_USER_VERSION if row is None else row.token_version or 0
+        await token_versions.set(str(user_id), version)
+    return version
+
+async def remember_token_version(user_id: int, token_version: Optional[int]):
+    """Сохраняет в памяти версию токенов, прочитанную вместе с пользователем (например, при входе)"""
+    await token_versions.set(str(user_id), token_version or 0)
+
+async def revoke_tokens(db: AsyncSession, user_id: int, login: str):
+    """Отзывает все выданные пользователю токены: увеличивает версию (транзакцию фиксирует вызывающий)"""
+    result = await db.execute(
+        update(User).where(User.user_id == user_id)
+        .values(token_version=func.coalesce(User.token_version, 0) + 1)
+        .returning(User.token_version)
+    )
+    await token_versions.set(str(user_id), result.scalar_one())
+    await invalidate_cached_user(login)
+
+async def load_user(payload: dict, db: AsyncSession) -> User:
+    """
+    Пользователь токена из кэша пользователей или из БД. Если в токене есть версия, то она проверяется
+    :raise HTTPException: 401 если пользователя нет или токен отозван
+    """
+    token_data = TokenData(username=payload["sub"])
+    user = None
+
+    if USER_CACHE_ENABLED:
+        cached = await user_cache.get(token_data.username)
+        if cached is not None:
+            user_cache_stats.hit()
+            user = User(**cached)  # объект не привязан к сессии, в БД ничего не пишется
+        else:
+            user_cache_stats.miss()
 
-    result = await db.execute(select(User).where(User.login == token_data.username))
-    user = result.scalar_one_or_none()
     if user is None:
-        raise credentials_exception
+        result = await db.execute(select(User).where(User.login == token_data.username))
+        user = result.scalar_one_or_none()
+        if user is None:
+            raise credentials_exception()
+
+        if USER_CACHE_ENABLED:
+            await user_cache.set(user.login, {field: getattr(user, field) for field in USER_CACHE_FIELDS})
+
+    if "ver" in payload and payload["ver"] != (user.token_version or 0):
+        raise credentials_exception()
     return user
 
+async def get_current_principal(token: str = Depends(oauth2_scheme),
+                                db: AsyncSession = Depends(get_db)) -> Principal:
+    """
+    Пользователь запроса для роутеров, которым нужен только user_id.
+    При AUTH_MODE=stateless строка users не загружается: проверяются подпись и версия токена.
+    Токены без uid и ver (выданные до их появления) проверяются как при AUTH_MODE=lookup
+    """
+    payload = decode_access_token(token)
+    if stateless_auth() and "uid" in payload and "ver" in payload:
+        if await current_token_version(payload["uid"], db) != payload["ver"]:
+            raise credentials_exception()  # токен отозван (или пользователя нет)
+        return Principal(user_id=payload["uid"], login=payload["sub"])
+
+    user = await load_user(payload, db)
+    return Principal(user_id=user.user_id, login=user.login)
+
+async def get_current_user(token: str = Depends(oauth2_scheme),
+                           db: AsyncSession = Depends(get_db)) -> User:
+    """Строка users пользователя запроса целиком (для /user_me/ и подобных)"""
+    return await load_user(decode_access_token(token), db)
+
 
 def hash_password(password: str) -> str:
     """Преобразует пароль в хеш
@@ -73,6 +214,21 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     """
     return pwd_context.verify(plain_password, hashed_password)
 
+def set_password_hasher(hasher: PasswordHasher):
+    """Заменяет пул для хеширования паролей (старый пул останавливается)"""
+    global password_hasher
+    password_hasher.shutdown()
+    password_hasher = hasher
+
+async def hash_password_async(password: str) -> str:
+    """Как hash_password, но не блокирует цикл событий
+    :return: хэш пароля"""
+    return await password_hasher.run(hash_password, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Как verify_password, но не блокирует цикл событий"""
+    return await password_hasher.run(verify_password, plain_password, hashed_password)
+
 def ensure_utc(dt: datetime) -> datetime:
     """
     :param dt: дата и время в любой временной зоне
@@ -80,79 +236,89 @@ def ensure_utc(dt: datetime) -> datetime:
     """
     return dt.astimezone(timezone.utc)  # преобразуем в UTC
 
-async def check_overdue_projects(user_id: int,
-        projects_id: list[int],
-        db: AsyncSession = Depends(get_db)
-)->List[Project]:
-    """
-    обновляет устаревшие проекты в БД
-    :param user_id: id пользователя
-    :param projects_id: список из id проектов которые необходимо проверить
-    :param db: подключение к БД (его передавать не обязательно)
-    :return обновлённый список проектов:
-    """
-    if not projects_id:
-        return []
+# статусы которые create_database() создаёт в таблице statuses (id -> имя)
+STATUS_NAMES = {1: 'in_progress', 2: 'completed', 3: 'overdue', 4: 'deleted'}
 
-    now = datetime.now(timezone.utc)
+# Таблица statuses не изменяется, поэтому загружается один раз при запуске (load_statuses).
+# До загрузки используются статусы из STATUS_NAMES
+statuses: Mapping[int, StatusResponse] = MappingProxyType(
+    {status_id: StatusResponse(status_id=status_id, name=name) for status_id, name in STATUS_NAMES.items()}
+)
 
-    # обновляем данные в БД
-    await db.execute(
-        update(Project)
-        .where(
-            (Project.user_id == user_id) &
-            (Project.project_id.in_(projects_id)) &
-            (Project.desired_completion_date < now) &
-            (Project.actual_completion_date.is_(None)) &
-            (Project.status_id != 3)
-        ).values(status_id=3)) # Установление статуса - просрочен. Обновлять последнее использование не надо!
-
-    #Получаем обновлённые проекты
-    result = await db.execute(
-        select(Project)
-        .where(Project.project_id.in_(projects_id))
-        .options(joinedload(Project.status))  # Загружаем связанный статус
-    )
-    await db.commit()
-    new_projects = result.scalars().all()
+async def load_statuses():
+    """Загружает таблицу statuses в неизменяемый словарь statuses"""
+    global statuses
+    async with new_session() as db:
+        result = await db.execute(select(Status))
+        statuses = MappingProxyType(
+            {status.status_id: StatusResponse(status_id=status.status_id, name=status.name)
+             for status in result.scalars().all()}
+        )
 
-    return new_projects
+def status_response(status_id: int) -> StatusResponse:
+    """:return: статус для ответа (без запроса к БД)"""
+    return statuses[status_id]
 
+def response_with_status(schema: Type[BaseModel], item) -> BaseModel:
+    """
+    Собирает ответ из строки таблицы, статус берётся из statuses (relationship status не загружается)
+    :param schema: ProjectResponse или TaskResponse
+    :param item: объект Project или Task
+    """
+    return schema.model_validate(
+        {**{column.key: getattr(item, column.key) for column in response_columns(type(item), schema)},
+         'status': status_response(item.status_id)}
+    )
 
-async def check_overdue_tasks(user_id: int,
-        task_id: list[int],
-        db: AsyncSession = Depends(get_db)
-)->List[Task]:
+def overdue_condition(model, now: datetime):
     """
-    обновляет устаревшие проекты в БД
-    :param user_id: id пользователя
-    :param task_id: список из id задач которые необходимо проверить
-    :param db: подключение к БД (его передавать не обязательно)
-    :return обновлённый список задач:
+    SQL условие просроченности (для Project или Task)
+    :param model: Project или Task
+    :param now: текущее время в UTC
     """
-    if not task_id:
-        return []
+    return (
+        (model.desired_completion_date < now) &
+        (model.actual_completion_date.is_(None)) &
+        (model.status_id.notin_([3, 4]))  # уже просроченные и удалённые не трогаем
+    )
 
-    now = datetime.now(timezone.utc)
+def effective_status(model, now: datetime):
+    """
+    SQL выражение статуса с учётом просроченности (которую фоновая задача ещё могла не записать в БД)
+    :param model: Project или Task
+    :param now: текущее время в UTC
+    """
+    return case((overdue_condition(model, now), 3), else_=model.status_id)
 
-    # обновляем данные в БД
-    await db.execute(
-        update(Task)
-        .where(
-            (Task.user_id == user_id) &
-            (Task.task_id.in_(task_id)) &
-            (Task.desired_completion_date < now) &
-            (Task.actual_completion_date.is_(None)) &
-            (Task.status_id != 3)
-        ).values(status_id=3)) # Установление статуса - просрочен. Обновлять последнее использование не надо!
-
-    #Получаем обновлённые проекты
-    result = await db.execute(
-        select(Task)
-        .where(Task.task_id.in_(task_id))
-        .options(joinedload(Task.status))  # Загружаем связанный статус
+def is_overdue(item, now: datetime) -> bool:
+    """То же самое что overdue_condition, но для уже загруженного объекта"""
+    return (
+        item.desired_completion_date is not None and
+        item.desired_completion_date < now and
+        item.actual_completion_date is None and
+        item.status_id not in (3, 4)
     )
-    await db.commit()
-    new_task = result.scalars().all()
 
-    return new_task
+@lru_cache
+def response_columns(model, schema: Type[BaseModel]) -> tuple:
+    """
+    Столбцы таблицы, которые нужны схеме ответа (и status_id для статуса).
+    Запрос по ним возвращает лёгкие строки-кортежи без ORM объектов и identity map
+    :param model: Project или Task
+    :param schema: ProjectResponse или TaskResponse
+    """
+    return tuple(column for column in model.__table__.columns
+                 if column.key in schema.model_fields or column.key == 'status_id')
+
+def rows_with_status(rows) -> list[dict]:
+    """
+    Формирует ответ, вычисляя просроченность по дате (без записи в БД).
+    В БД статус обновит фоновая задача app.background.overdue_sweeper
+    :param rows: строки запроса select(*response_columns(...))
+    :return: словари с полями схемы ответа, статус берётся из statuses
+    """
+    now = datetime.now(timezone.utc)
+    return [
+        {**row._mapping, 'status': status_response(3 if is_overdue(row, now) else row.status_id)}
+        for row in rows
+    ]
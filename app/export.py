@@ -0,0 +1,237 @@
+import os
+import zlib
+from datetime import datetime, timezone
+from typing import Annotated, AsyncIterator, Optional, Union
+
+from dotenv import load_dotenv
+from fastapi import HTTPException, status
+from pydantic import Field, TypeAdapter, ValidationError
+from sqlalchemy import select, func, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.data_base.data_base import new_session
+from app.dependencies import response_columns
+from app.models.models import Project, Task
+from app.ranking import rank_mode, key_after
+from app.schemas.request import ProjectExport, TaskExport
+from app.schemas.response import ImportResponse
+
+load_dotenv()  # Загружает переменные из .env
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', 1000))        # строк за одно чтение из серверного курсора
+EXPORT_GZIP_LEVEL = int(os.getenv('EXPORT_GZIP_LEVEL', 6))           # уровень сжатия gzip (1 - быстрее, 9 - меньше)
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', 1000))        # строк файла в одной транзакции
+IMPORT_MAX_LINE_LENGTH = int(os.getenv('IMPORT_MAX_LINE_LENGTH', 65536))  # максимальная длина строки файла (байт)
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+# строка файла: проект или задача (определяется полем type)
+export_line_adapter = TypeAdapter(Annotated[Union[ProjectExport, TaskExport], Field(discriminator='type')])
+
+
+async def export_lines(user_id: int) -> AsyncIterator[bytes]:
+    """
+    Все проекты и задачи пользователя (включая удалённые) в формате NDJSON: сначала проекты, затем задачи,
+    в порядке их отображения. Строки читаются серверным курсором по EXPORT_BATCH_SIZE, поэтому память
+    не зависит от количества строк. Сессия своя, т.к. ответ отправляется уже после выхода из эндпоинта
+    :return: части файла (одна часть на каждую пачку строк)
+    """
+    async with new_session() as db:
+        for model, schema, order_by in (
+            (Project, ProjectExport, (Project.rank if rank_mode() else Project.position_index, Project.project_id)),
+            (Task, TaskExport, (Task.project_id, Task.rank if rank_mode() else Task.position_index, Task.task_id)),
+        ):
+            result = await db.stream(
+                select(*response_columns(model, schema))
+                .where(model.user_id == user_id)
+                .order_by(*order_by)
+                .execution_options(yield_per=EXPORT_BATCH_SIZE)
+            )
+            async for rows in result.partitions():
+                yield b''.join(schema.model_validate(row._mapping).model_dump_json().encode() + b'\n' for row in rows)
+
+async def gzip_chunks(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Сжимает поток частей в gzip по мере их поступления"""
+    compressor = zlib.compressobj(EXPORT_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # 16 - формат gzip
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _line_too_long():
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"Строка файла импорта длиннее {IMPORT_MAX_LINE_LENGTH} байт"
+    )
+
+async def read_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """
+    Разбивает тело запроса на строки по мере получения. Сжатое gzip тело распаковывается
+    (определяется по первым байтам), распакованные данные никогда не держатся в памяти целиком
+    :param chunks: части тела запроса (request.stream())
+    :return: непустые строки без перевода строки
+    :raise HTTPException: 413 если строка длиннее IMPORT_MAX_LINE_LENGTH, 400 если gzip повреждён
+    """
+    decompressor = None
+    head = b''     # первые байты тела до определения формата
+    buffer = b''   # начало ещё не законченной строки
+
+    async def split(data: bytes):
+        nonlocal buffer
+        *lines, buffer = (buffer + data).split(b'\n')
+        if len(buffer) > IMPORT_MAX_LINE_LENGTH:
+            raise _line_too_long()
+        for line in lines:
+            if len(line) > IMPORT_MAX_LINE_LENGTH:
+                raise _line_too_long()
+            if line.strip():
+                yield line
+
+    async def feed(data: bytes):
+        if decompressor is None:
+            async for line in split(data):
+                yield line
+            return
+        try:
+            while data:
+                # распаковка частями: маленький сжатый фрагмент может развернуться в очень большой
+                async for line in split(decompressor.decompress(data, IMPORT_MAX_LINE_LENGTH)):
+                    yield line
+                data = decompressor.unconsumed_tail
+        except zlib.error:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Повреждённый gzip файл импорта")
+
+    async for chunk in chunks:
+        if head is not None:
+            head += chunk
+            if len(head) < len(GZIP_MAGIC):
+                continue
+            if head.startswith(GZIP_MAGIC):
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            chunk, head = head, None
+        async for line in feed(chunk):
+            yield line
+
+    if head:  # тело короче GZIP_MAGIC
+        async for line in feed(head):
+            yield line
+    if buffer.strip():  # последняя строка без перевода строки
+        yield buffer
+
+
+class UserImport:
+    """
+    Создание проектов и задач пользователя из строк файла экспорта. Каждые IMPORT_BATCH_SIZE строк
+    записываются многострочными INSERT и фиксируются отдельной транзакцией (при ошибке в середине файла
+    уже записанные пачки остаются). Проекты и задачи создаются заново, с новыми ID, после уже существующих
+    """
+
+    def __init__(self, db: AsyncSession, user_id: int):
+        self.db = db
+        self.user_id = user_id
+        self.project_ids: dict[int, int] = {}          # ID проекта в файле -> ID созданного проекта
+        self.task_positions: dict[int, int] = {}       # ID созданного проекта -> последний position_index задач
+        self.task_ranks: dict[int, Optional[str]] = {} # ID созданного проекта -> последний ключ сортировки задач
+        self.project_position: Optional[int] = None    # последний position_index проектов пользователя
+        self.project_rank: Optional[str] = None
+        self.projects: list[ProjectExport] = []
+        self.tasks: list[TaskExport] = []
+        self.summary = ImportResponse(projects=0, tasks=0, skipped_tasks=0)
+
+    async def run(self, lines: AsyncIterator[bytes]) -> ImportResponse:
+        """
+        :param lines: строки файла (read_lines)
+        :raise HTTPException: 422 если строка не является проектом или задачей
+        """
+        result = await self.db.execute(
+            select(func.max(Project.position_index), func.max(Project.rank))
+            .where((Project.user_id == self.user_id) & (Project.status_id != 4))
+        )
+        self.project_position, self.project_rank = result.one()
+        if self.project_position is None:
+            self.project_position = -1  # у пользователя ещё нет проектов
+
+        number = 0
+        async for line in lines:
+            number += 1
+            try:
+                item = export_line_adapter.validate_json(line)
+            except ValidationError as e:
+                raise HTTPException(
+                    status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                    detail=f"Некорректная строка {number}: {e.errors()[0]['msg']}"
+                )
+            (self.projects if isinstance(item, ProjectExport) else self.tasks).append(item)
+            if len(self.projects) + len(self.tasks) >= IMPORT_BATCH_SIZE:
+                await self.flush()
+
+        await self.flush()
+        return self.summary
+
+    async def flush(self):
+        """Записывает накопленные строки одной транзакцией"""
+        if self.projects:
+            await self._insert_projects()
+        if self.tasks:
+            await self._insert_tasks()
+        await self.db.commit()
+
+    def _position(self, item, last_position: int, last_rank: Optional[str]) -> tuple[int, int, Optional[str]]:
+        """:return: (position_index, новая последняя позиция, ключ сортировки); удалённые не занимают позицию"""
+        if item.status_id == 4:
+            return -1, last_position, None
+        return last_position + 1, last_position + 1, key_after(last_rank) if rank_mode() else None
+
+    async def _insert_projects(self):
+        now = datetime.now(timezone.utc)
+        rows = []
+        for project in self.projects:
+            position, self.project_position, rank = self._position(project, self.project_position, self.project_rank)
+            if rank is not None:
+                self.project_rank = rank
+            rows.append({
+                'user_id': self.user_id,
+                'position_index': position,
+                'rank': rank,
+                **project.model_dump(exclude={'type', 'project_id', 'position_index', 'updated_date'}),
+                'updated_date': now,  # дата из файла старше курсоров /sync, созданные строки должны в него попасть
+            })
+
+        # многострочный INSERT ... RETURNING, ID возвращаются в порядке rows
+        inserted = await self.db.execute(
+            insert(Project).returning(Project.project_id, sort_by_parameter_order=True), rows
+        )
+        for project, project_id in zip(self.projects, inserted.scalars().all()):
+            self.project_ids[project.project_id] = project_id
+            self.task_positions[project_id] = -1
+        self.summary.projects += len(rows)
+        self.projects = []
+
+    async def _insert_tasks(self):
+        now = datetime.now(timezone.utc)
+        rows = []
+        for task in self.tasks:
+            project_id = self.project_ids.get(task.project_id)
+            if project_id is None:  # проекта нет выше в файле
+                self.summary.skipped_tasks += 1
+                continue
+
+            position, self.task_positions[project_id], rank = self._position(
+                task, self.task_positions[project_id], self.task_ranks.get(project_id)
+            )
+            if rank is not None:
+                self.task_ranks[project_id] = rank
+            rows.append({
+                'user_id': self.user_id,
+                'project_id': project_id,
+                'position_index': position,
+                'rank': rank,
+                **task.model_dump(exclude={'type', 'task_id', 'project_id', 'position_index', 'updated_date'}),
+                'updated_date': now,  # дата из файла старше курсоров /sync, созданные строки должны в него попасть
+            })
+
+        if rows:
+            await self.db.execute(insert(Task), rows)
+        self.summary.tasks += len(rows)
+        self.tasks = []
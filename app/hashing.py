@@ -0,0 +1,55 @@
+import asyncio
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Any, Callable, Optional
+
+
+class PasswordHasher:
+    """
+    Выполняет хеширование и проверку паролей (bcrypt) вне цикла событий.
+    bcrypt занимает десятки миллисекунд процессорного времени, поэтому при вызове прямо в обработчике
+    он останавливает обработку всех остальных запросов воркера.
+    """
+
+    def __init__(self, max_workers: int, max_concurrency: int, use_processes: bool = False):
+        """
+        :param max_workers: размер пула потоков/процессов. При 0 вычисления выполняются прямо в цикле событий
+        :param max_concurrency: сколько вычислений одновременно может находиться в пуле (остальные ждут своей очереди)
+        :param use_processes: использовать пул процессов вместо пула потоков
+        """
+        self.max_workers = max_workers
+        self.max_concurrency = max(max_concurrency, 1)
+        self.use_processes = use_processes
+        self._executor: Optional[Executor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.use_processes:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='password_hasher')
+        return self._executor
+
+    async def run(self, func: Callable[..., Any], *args) -> Any:
+        """
+        Выполняет функцию в пуле, не блокируя цикл событий
+        :param func: функция модульного уровня (для пула процессов она должна сериализоваться через pickle)
+        :param args: аргументы функции
+        :return: результат функции
+        """
+        if self.max_workers == 0:
+            return func(*args)
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), func, *args)
+
+    def shutdown(self):
+        """Останавливает пул. Вызывается при остановке приложения"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        self._semaphore = None
@@ -0,0 +1,333 @@
+import os
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import select, update, delete, func, case, literal, exists
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.data_base.data_base import new_session
+from app.models.models import Project, Task, Job
+from app.schemas.response import JobResponse
+from app.ranking import rank_mode, key_after, evenly_spaced_key_sql
+from app.stats import build_stats
+from app.sync import deletions_insert, record_deletions
+
+load_dotenv()  # Загружает переменные из .env
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 2))                    # воркеров в каждом процессе (0 - не запускать)
+JOB_BATCH_SIZE = int(os.getenv('JOB_BATCH_SIZE', 1000))           # сколько задач обрабатывать в одной транзакции
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', 5))      # раз в сколько секунд искать задания других процессов
+JOB_LEASE_SECONDS = float(os.getenv('JOB_LEASE_SECONDS', 60))     # без пачек дольше этого воркер считается упавшим
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 3))          # после стольких ошибок задание завершается с failed
+
+PENDING_STATES = ('queued', 'running')
+
+
+def project_has_pending_job(project_id):
+    """SQL условие: над проектом есть невыполненное задание (проект нельзя менять до его завершения)"""
+    return exists().where((Job.project_id == project_id) & Job.state.in_(PENDING_STATES))
+
+def project_pending_deletion(project_id):
+    """SQL условие: проект удаляется фоновым заданием (его ещё не удалённые задачи не показываются)"""
+    return exists().where(
+        (Job.project_id == project_id) & (Job.kind == 'delete_project') & Job.state.in_(PENDING_STATES)
+    )
+
+def job_response(job: Job) -> JobResponse:
+    """Ответ о задании (данные незавершённого задания в result не показываются)"""
+    return JobResponse.model_validate(
+        {**{field: getattr(job, field) for field in JobResponse.model_fields},
+         'result': job.result if job.state == 'done' else None}
+    )
+
+def restored_status(item, now: datetime) -> int:
+    """
+    Статус восстановленного из архива проекта или задачи по датам (то же, что case в recover_project_tasks)
+    :param item: объект Project или Task
+    """
+    if item.actual_completion_date:  # если есть дата завершения
+        return 2  # завершён
+    if item.desired_completion_date is not None and item.desired_completion_date < now:
+        return 3  # просрочен
+    return 1  # активный
+
+async def restore_project(db: AsyncSession, project: Project, now: datetime):
+    """
+    Возвращает архивированный проект в конец списка проектов пользователя, статус - по датам (как у задач)
+    :param project: загруженный объект Project (изменения запишутся при commit)
+    """
+    # максимальные position_index и ключ сортировки среди активных проектов пользователя
+    result = await db.execute(
+        select(func.max(Project.position_index), func.max(Project.rank))
+        .where((Project.user_id == project.user_id) & (Project.status_id != 4))
+    )
+    max_position, max_rank = result.one()
+
+    project.status_id = restored_status(project, now)
+    project.position_index = (max_position or 0) + 1  # Ставим в конец списка
+    project.rank = key_after(max_rank) if rank_mode() else None
+    project.updated_date = now
+
+async def recover_project_tasks(db: AsyncSession, project_id: int, now: datetime, limit: Optional[int] = None,
+                                start: int = 0, total: Optional[int] = None) -> list:
+    """
+    Восстанавливает архивированные задачи проекта одним UPDATE ... FROM: статус пересчитывается по датам
+    (завершена, просрочена или в работе), позиции и ключи сортировки - по прежнему порядку ключей (затем по id).
+    Строки задач в Python не загружаются
+    :param limit: восстановить только первые limit задач (пачка задания), None - все
+    :param start: сколько задач проекта уже восстановлено предыдущими пачками (с этой позиции продолжается нумерация)
+    :param total: всего задач для ключей сортировки (None - количество задач в этом запросе)
+    :return: строки (project_id, status_id, priority, task_count) для build_stats
+    """
+    number = func.row_number().over(order_by=(Task.rank, Task.task_id)) + start
+    ordered = (
+        select(
+            Task.task_id,
+            (number - 1).label('position_index'),
+            evenly_spaced_key_sql(number, total if total is not None else func.count().over()).label('rank'),
+        )
+        .where((Task.project_id == project_id) & (Task.status_id == 4))
+        .order_by(Task.rank, Task.task_id)
+        .limit(limit)
+        .subquery()
+    )
+
+    recovered = (
+        update(Task)
+        .where(Task.task_id == ordered.c.task_id)
+        .values(
+            status_id=case((Task.actual_completion_date.is_not(None), 2),  # завершена
+                           (Task.desired_completion_date < now, 3),        # просрочена
+                           else_=1),
+            position_index=ordered.c.position_index,
+            rank=ordered.c.rank,  # порядок ключей совпадает с новыми position_index
+            updated_date=now,
+        )
+        .returning(Task.project_id, Task.status_id, func.coalesce(Task.priority, 1).label('priority'))
+        .cte('recovered')
+    )
+    result = await db.execute(
+        select(recovered.c.project_id, recovered.c.status_id, recovered.c.priority, func.count())
+        .group_by(recovered.c.project_id, recovered.c.status_id, recovered.c.priority)
+    )
+    return result.all()
+
+async def remove_project_tasks(db: AsyncSession, user_id: int, project_id: int, limit: int) -> int:
+    """
+    Полностью удаляет до limit задач проекта и записывает их удаление для /sync (одним запросом)
+    :return: количество удалённых задач
+    """
+    batch = select(Task.task_id).where(Task.project_id == project_id).limit(limit).scalar_subquery()
+    removed = delete(Task).where(Task.task_id.in_(batch)).returning(Task.task_id).cte('removed')
+    result = await db.execute(deletions_insert(user_id, 'task', select(removed.c.task_id)).add_cte(removed))
+    return result.rowcount
+
+
+async def delete_project_step(db: AsyncSession, job: Job, now: datetime) -> bool:
+    """Пачка полного удаления проекта, последняя удаляет сам проект. :return: True если задание выполнено"""
+    removed = await remove_project_tasks(db, job.user_id, job.project_id, JOB_BATCH_SIZE)
+    job.processed += removed
+    if removed == JOB_BATCH_SIZE:
+        return False
+
+    await record_deletions(db, job.user_id, 'project', select(literal(job.project_id)))
+    await db.execute(delete(Project).where(Project.project_id == job.project_id))
+    job.result = {'deleted_tasks': job.processed}
+    return True
+
+async def recover_project_step(db: AsyncSession, job: Job, now: datetime) -> bool:
+    """
+    Пачка восстановления задач проекта, последняя восстанавливает сам проект (до этого он остаётся в архиве).
+    Количество по статусам накапливается в job.result
+    :return: True если задание выполнено
+    """
+    rows = await recover_project_tasks(db, job.project_id, now, JOB_BATCH_SIZE, job.processed, job.total)
+    recovered = sum(row[3] for row in rows)
+    job.processed += recovered
+    job.result = {'rows': (job.result or {}).get('rows', []) + [list(row) for row in rows]}
+    if recovered == JOB_BATCH_SIZE:
+        return False
+
+    project = await db.get(Project, job.project_id)
+    await restore_project(db, project, now)
+    job.result = {'recovered_tasks': build_stats(job.result['rows'])['totals']}
+    return True
+
+
+# вид задания -> функция одной пачки
+JOB_KINDS = {
+    'delete_project': delete_project_step,
+    'recover_project': recover_project_step,
+}
+
+
+async def enqueue_job(db: AsyncSession, user_id: int, kind: str, project_id: int) -> Job:
+    """
+    Ставит задание в очередь (в транзакции запроса, commit делает вызывающий, затем job_workers.notify())
+    :param kind: ключ JOB_KINDS
+    """
+    if kind == 'recover_project':
+        tasks = (Task.project_id == project_id) & (Task.status_id == 4)
+    else:
+        tasks = Task.project_id == project_id
+    total = (await db.execute(select(func.count()).where(tasks))).scalar_one()
+
+    job = Job(user_id=user_id, kind=kind, project_id=project_id, state='queued', total=total, processed=0,
+              attempts=0, created_date=datetime.now(timezone.utc))
+    db.add(job)
+    await db.flush()  # job_id для ответа
+    return job
+
+async def claim_job(worker_id: str) -> Optional[int]:
+    """
+    Берёт самое старое задание из очереди или задание упавшего воркера (нет пачек дольше JOB_LEASE_SECONDS)
+    :return: id задания или None если заданий нет
+    """
+    now = datetime.now(timezone.utc)
+    candidate = (
+        select(Job.job_id)
+        .where((Job.state == 'queued') |
+               ((Job.state == 'running') & (Job.heartbeat_date < now - timedelta(seconds=JOB_LEASE_SECONDS))))
+        .order_by(Job.job_id)
+        .limit(1)
+        .with_for_update(skip_locked=True)  # другие воркеры берут следующие задания
+        .scalar_subquery()
+    )
+    async with new_session() as db:
+        result = await db.execute(
+            update(Job)
+            .where(Job.job_id == candidate)
+            .values(state='running', worker_id=worker_id, attempts=Job.attempts + 1,
+                    started_date=func.coalesce(Job.started_date, now), heartbeat_date=now)
+            .returning(Job.job_id)
+        )
+        job_id = result.scalar_one_or_none()
+        await db.commit()
+    return job_id
+
+async def job_step(job_id: int, worker_id: str) -> bool:
+    """
+    Выполняет одну пачку задания в отдельной транзакции вместе с записью прогресса
+    :return: True если нужно продолжать (задание не выполнено и всё ещё принадлежит worker_id)
+    """
+    now = datetime.now(timezone.utc)
+    async with new_session() as db:
+        # строка задания заблокирована до конца пачки: claim_job не заберёт его как задание упавшего воркера
+        job = (await db.execute(select(Job).where(Job.job_id == job_id).with_for_update())).scalar_one()
+        if job.state != 'running' or job.worker_id != worker_id:
+            return False  # задание забрал другой воркер (эта пачка шла дольше JOB_LEASE_SECONDS)
+
+        if job.attempts > JOB_MAX_ATTEMPTS:
+            job.state, job.error, job.finished_date = 'failed', "Превышено количество попыток", now
+            await db.commit()
+            return False
+
+        done = await JOB_KINDS[job.kind](db, job, now)
+        job.heartbeat_date = now
+        if done:
+            job.state, job.worker_id, job.finished_date = 'done', None, now
+        await db.commit()
+        return not done
+
+async def fail_job(job_id: int, worker_id: str, error: Exception):
+    """После ошибки пачки задание возвращается в очередь, после JOB_MAX_ATTEMPTS попыток - failed"""
+    async with new_session() as db:
+        await db.execute(
+            update(Job)
+            .where((Job.job_id == job_id) & (Job.worker_id == worker_id))
+            .values(state=case((Job.attempts >= JOB_MAX_ATTEMPTS, 'failed'), else_='queued'), worker_id=None,
+                    error=str(error)[:500],
+                    finished_date=case((Job.attempts >= JOB_MAX_ATTEMPTS, datetime.now(timezone.utc)), else_=None))
+        )
+        await db.commit()
+
+async def run_job(job_id: int, worker_id: str):
+    """Выполняет задание пачками до конца"""
+    try:
+        while await job_step(job_id, worker_id):
+            pass
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logging.error(f"Job {job_id} failed: {e}")
+        await fail_job(job_id, worker_id, e)
+
+async def process_jobs(worker_id: str) -> int:
+    """
+    Выполняет задания, пока очередь не опустеет
+    :return: количество выполненных заданий
+    """
+    count = 0
+    while (job_id := await claim_job(worker_id)) is not None:
+        await run_job(job_id, worker_id)
+        count += 1
+    return count
+
+async def release_jobs(worker_ids: list[str]):
+    """Возвращает в очередь задания остановленных воркеров (остановка сервера не считается попыткой)"""
+    async with new_session() as db:
+        await db.execute(
+            update(Job)
+            .where((Job.state == 'running') & Job.worker_id.in_(worker_ids))
+            .values(state='queued', worker_id=None, attempts=Job.attempts - 1)
+        )
+        await db.commit()
+
+
+class JobWorkerPool:
+    """
+    Воркеры заданий в цикле событий приложения. Новое задание этого процесса будит их сразу (notify),
+    задания других процессов и упавших воркеров находятся раз в poll_interval секунд
+    """
+
+    def __init__(self, workers: int, poll_interval: float):
+        """
+        :param workers: количество воркеров (0 - не запускаются)
+        :param poll_interval: промежуток между проверками очереди в секундах
+        """
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.worker_ids: list[str] = []
+        self._tasks: list[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def start(self):
+        if self.workers > 0 and not self._tasks:
+            self._wakeup = asyncio.Event()
+            self.worker_ids = [f'{os.getpid()}-{uuid.uuid4().hex[:12]}' for _ in range(self.workers)]
+            self._tasks = [asyncio.create_task(self._run(worker_id), name=f'job_worker_{number}')
+                           for number, worker_id in enumerate(self.worker_ids)]
+
+    async def stop(self):
+        if not self._tasks:
+            return
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await release_jobs(self.worker_ids)
+        self._tasks, self._wakeup = [], None
+
+    def notify(self):
+        """Будит воркеры (вызывается после commit транзакции, в которой поставлено задание)"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self, worker_id: str):
+        while True:
+            try:
+                await process_jobs(worker_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:  # ошибка БД не должна останавливать воркер
+                logging.error(f"Job worker {worker_id} failed: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+
+job_workers = JobWorkerPool(JOB_WORKERS, JOB_POLL_INTERVAL)
@@ -0,0 +1,130 @@
+import os
+import json
+import math
+import time
+import asyncio
+import logging
+from typing import Optional
+
+from dotenv import load_dotenv
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Receive, Scope, Send, Message
+
+import app.rate_limit as rate_limit
+from app.data_base.queries import collect_queries
+
+load_dotenv()  # Загружает переменные из .env
+QUERY_METRICS_ENABLED = os.getenv('QUERY_METRICS_ENABLED', 'true').lower() == 'true'  # заголовок Server-Timing
+QUERY_METRICS_LOG = os.getenv('QUERY_METRICS_LOG', 'true').lower() == 'true'          # строка лога на каждый запрос
+
+query_logger = logging.getLogger('app.queries')
+
+
+class QueryMetricsMiddleware:
+    """
+    Считает запросы к БД каждого HTTP запроса: количество, общее время, самый медленный запрос, количество строк.
+    Результат добавляется в заголовок Server-Timing и пишется в лог app.queries одной JSON строкой
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http' or not QUERY_METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+        with collect_queries() as stats:
+            async def send_with_timing(message: Message):
+                nonlocal status_code
+                if message['type'] == 'http.response.start':
+                    status_code = message['status']
+                    headers = MutableHeaders(scope=message)
+                    headers.append('Server-Timing', f'{stats.server_timing()}, '
+                                                    f'app;dur={(time.perf_counter() - start) * 1000:.2f}')
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_timing)
+            finally:
+                if QUERY_METRICS_LOG:
+                    query_logger.info(json.dumps({
+                        'method': scope['method'],
+                        'path': scope['path'],
+                        'status': status_code,
+                        'duration_ms': round((time.perf_counter() - start) * 1000, 2),
+                        **stats.snapshot(),
+                    }, ensure_ascii=False))
+
+
+async def send_error(send: Send, status_code: int, detail: str, retry_after: float):
+    """Отправляет JSON ответ с ошибкой и заголовком Retry-After (целые секунды, не меньше 1)"""
+    body = json.dumps({'detail': detail}, ensure_ascii=False).encode()
+    await send({
+        'type': 'http.response.start',
+        'status': status_code,
+        'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode()),
+            (b'retry-after', str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+class RateLimitMiddleware:
+    """
+    Защита от перегрузки до того, как запрос займёт соединение с БД:
+    - корзина жетонов на пользователя (или IP), запрос стоит route_cost жетонов, при нехватке - 429 с Retry-After;
+    - не больше MAX_CONCURRENT_REQUESTS одновременных запросов, если место не освободилось за ADMISSION_TIMEOUT - 503.
+    Без ограничения очередь ожидающих соединение из пула растёт неограниченно и время ответа растёт у всех
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._semaphore_size = 0
+
+    def semaphore(self) -> Optional[asyncio.Semaphore]:
+        """:return: ограничитель одновременных запросов (пересоздаётся при изменении MAX_CONCURRENT_REQUESTS)"""
+        if rate_limit.MAX_CONCURRENT_REQUESTS <= 0:
+            return None
+        if self._semaphore is None or self._semaphore_size != rate_limit.MAX_CONCURRENT_REQUESTS:
+            self._semaphore = asyncio.Semaphore(rate_limit.MAX_CONCURRENT_REQUESTS)
+            self._semaphore_size = rate_limit.MAX_CONCURRENT_REQUESTS
+        return self._semaphore
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http' or not rate_limit.RATE_LIMIT_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        headers = {name.decode('latin-1'): value.decode('latin-1') for name, value in scope['headers']}
+        key, cost = rate_limit.client_key(headers, scope.get('client')), rate_limit.route_cost(scope['path'])
+        retry_after = await rate_limit.rate_limit_store.consume(
+            key, cost, rate_limit.RATE_LIMIT_CAPACITY, rate_limit.RATE_LIMIT_REFILL_RATE,
+        )
+        if retry_after > 0:
+            await send_error(send, 429, "Слишком много запросов, повторите позже", retry_after)
+            return
+
+        semaphore = self.semaphore()
+        if semaphore is None:
+            await self.app(scope, receive, send)
+            return
+        if semaphore.locked():  # свободных мест нет, ждём не дольше ADMISSION_TIMEOUT
+            try:
+                await asyncio.wait_for(semaphore.acquire(), timeout=rate_limit.ADMISSION_TIMEOUT)
+            except asyncio.TimeoutError:
+                # запрос не обработан - жетоны возвращаются, иначе повтор после 503 получил бы ещё и 429
+                await rate_limit.rate_limit_store.refund(key, cost, rate_limit.RATE_LIMIT_CAPACITY)
+                await send_error(send, 503, "Сервер перегружен, повторите позже", 1)
+                return
+        else:
+            await semaphore.acquire()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            semaphore.release()
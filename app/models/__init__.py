@@ -1,3 +1,3 @@
-from .models import User, Status, Project, Task
+from .models import User, Status, Project, Task, DeletedItem, RefreshToken, TaskCounter, Job, DataVersion
 
-__all__ = ['User', 'Project', 'Task', 'Status']  # явный экспорт
\ No newline at end of file
+__all__ = ['User', 'Project', 'Task', 'Status', 'DeletedItem', 'RefreshToken', 'TaskCounter', 'Job', 'DataVersion']  # явный экспорт
\ No newline at end of file
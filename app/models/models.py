@@ -1,10 +1,25 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, BigInteger, String, ForeignKey, DateTime, Index, Computed, text
+from sqlalchemy.dialects.postgresql import TSVECTOR, JSONB
+from sqlalchemy.orm import relationship, deferred
 
 from app.data_base.base import Base
 
 # этот файл описывает каждую таблицу в БД
 
+# конфигурация полнотекстового поиска: русские слова со стеммингом, латиница - английский стемминг
+SEARCH_TEXT_CONFIG = 'russian'
+
+def search_vector_column():
+    """
+    Вычисляемый столбец для полнотекстового поиска: заголовок (вес A) важнее описания (вес B).
+    Загружается ORM только при явном обращении (deferred)
+    """
+    return deferred(Column(TSVECTOR, Computed(
+        f"setweight(to_tsvector('{SEARCH_TEXT_CONFIG}'::regconfig, coalesce(title, '')), 'A') || "
+        f"setweight(to_tsvector('{SEARCH_TEXT_CONFIG}'::regconfig, coalesce(description, '')), 'B')",
+        persisted=True
+    )))
+
 class User(Base): # Создание таблицы
     __tablename__  = 'users' # имя таблицы
     user_id = Column(Integer, primary_key=True, autoincrement=True)
@@ -13,6 +28,7 @@ class User(Base): # Создание таблицы
     email = Column(String(100), unique=True)
     created_date= Column(DateTime(timezone=True), nullable=False)
     last_login= Column(DateTime(timezone=True), nullable=False)
+    token_version = Column(Integer, default=0) # увеличивается при отзыве всех токенов пользователя
 
     # Связи
     projects = relationship("Project", back_populates="user")
@@ -32,6 +48,7 @@ class Project(Base):
     project_id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey("users.user_id"), nullable=False)
     position_index = Column(Integer)
+    rank = Column(String(255, collation='C')) # ключ сортировки для ORDERING_MODE=rank (сравнивается побайтово)
     title = Column(String(100), nullable=False)
     description = Column(String(500))
     status_id = Column(Integer, ForeignKey("statuses.status_id"), default=1)
@@ -39,12 +56,35 @@ class Project(Base):
     desired_completion_date = Column(DateTime(timezone=True))
     actual_completion_date = Column(DateTime(timezone=True))
     updated_date = Column(DateTime(timezone=True))
+    search_vector = search_vector_column()
 
     # Связи
     user = relationship("User", back_populates="projects")
     status = relationship("Status", back_populates="projects")
     tasks = relationship("Task", back_populates="project")
 
+    # Индексы под запросы из роутеров
+    __table_args__ = (
+        # все проекты пользователя / фильтр по статусу
+        Index('ix_projects_user_status', 'user_id', 'status_id'),
+        # активные проекты: max(position_index) и сдвиг позиций
+        Index('ix_projects_user_position_active', 'user_id', 'position_index',
+              postgresql_where=text('status_id != 4')),
+        # порядок активных проектов в режиме ORDERING_MODE=rank
+        Index('ix_projects_user_rank_active', 'user_id', 'rank',
+              postgresql_where=text('status_id != 4')),
+        # изменения после курсора синхронизации (/sync)
+        Index('ix_projects_user_updated', 'user_id', 'updated_date', 'project_id'),
+        # поиск просроченных фоновой задачей
+        Index('ix_projects_overdue_candidates', 'desired_completion_date',
+              postgresql_where=text('actual_completion_date IS NULL AND status_id NOT IN (3, 4)')),
+        # просроченные, но ещё не отмеченные фоновой задачей, у пользователя (версия для ETag)
+        Index('ix_projects_user_overdue_candidates', 'user_id', 'desired_completion_date',
+              postgresql_where=text('actual_completion_date IS NULL AND status_id NOT IN (3, 4)')),
+        # полнотекстовый поиск (/search/), триграммный индекс по title создаёт create_trigram_indexes
+        Index('ix_projects_search', 'search_vector', postgresql_using='gin'),
+    )
+
 class Task(Base):
     __tablename__  = 'tasks'
     task_id = Column(Integer, primary_key=True, autoincrement=True)
@@ -52,6 +92,7 @@ class Task(Base):
     status_id = Column(Integer, ForeignKey("statuses.status_id"), default=1)
     project_id = Column(Integer, ForeignKey("projects.project_id"), nullable=False)
     position_index = Column(Integer, nullable=False)
+    rank = Column(String(255, collation='C')) # ключ сортировки для ORDERING_MODE=rank (сравнивается побайтово)
     priority = Column(Integer, default=1) # приоритет от 1 до 3 (низкий, средний, высокий)
     title = Column(String(200), nullable=False)
     description = Column(String(1000))
@@ -59,9 +100,134 @@ class Task(Base):
     desired_completion_date = Column(DateTime(timezone=True))
     actual_completion_date = Column(DateTime(timezone=True))
     updated_date = Column(DateTime(timezone=True))
+    search_vector = search_vector_column()
 
     # Связи
     user = relationship("User", back_populates="tasks")
     status = relationship("Status", back_populates="tasks")
     project = relationship("Project", back_populates="tasks")
 
+    # Индексы под запросы из роутеров
+    __table_args__ = (
+        # все задачи пользователя / фильтр по статусу
+        Index('ix_tasks_user_status', 'user_id', 'status_id'),
+        # активные задачи проекта: список, max(position_index) и сдвиг позиций после удаления
+        Index('ix_tasks_user_project_position_active', 'user_id', 'project_id', 'position_index',
+              postgresql_where=text('status_id != 4')),
+        # активные задачи пользователя: max(position_index) и сдвиг позиций при перемещении
+        Index('ix_tasks_user_position_active', 'user_id', 'position_index',
+              postgresql_where=text('status_id != 4')),
+        # архивация, восстановление и удаление всех задач проекта
+        Index('ix_tasks_project', 'project_id'),
+        # порядок активных задач в режиме ORDERING_MODE=rank (внутри проекта и у пользователя)
+        Index('ix_tasks_project_rank_active', 'project_id', 'rank',
+              postgresql_where=text('status_id != 4')),
+        Index('ix_tasks_user_rank_active', 'user_id', 'rank',
+              postgresql_where=text('status_id != 4')),
+        # изменения после курсора синхронизации (/sync)
+        Index('ix_tasks_user_updated', 'user_id', 'updated_date', 'task_id'),
+        # поиск просроченных фоновой задачей
+        Index('ix_tasks_overdue_candidates', 'desired_completion_date',
+              postgresql_where=text('actual_completion_date IS NULL AND status_id NOT IN (3, 4)')),
+        # просроченные, но ещё не отмеченные фоновой задачей, у пользователя (версия для ETag)
+        Index('ix_tasks_user_overdue_candidates', 'user_id', 'desired_completion_date',
+              postgresql_where=text('actual_completion_date IS NULL AND status_id NOT IN (3, 4)')),
+        # полнотекстовый поиск (/search/), триграммный индекс по title создаёт create_trigram_indexes
+        Index('ix_tasks_search', 'search_vector', postgresql_using='gin'),
+    )
+
+
+class TaskCounter(Base):
+    """
+    Количество задач проекта по сохранённому статусу и приоритету для /stats/ (при STATS_COUNTERS=true).
+    Поддерживается триггером на tasks (app/data_base/counters.py), поэтому учитывает все пути записи
+    """
+    __tablename__ = 'task_counters'
+    project_id = Column(Integer, primary_key=True)
+    status_id = Column(Integer, primary_key=True)
+    priority = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    task_count = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        # счётчики всех проектов пользователя
+        Index('ix_task_counters_user', 'user_id'),
+    )
+
+
+class DataVersion(Base):
+    """
+    Версия проектов и задач пользователя для ETag в /get_projects/ и /get_tasks/.
+    Увеличивается триггером на projects и tasks (app/data_base/versions.py) при любой записи
+    """
+    __tablename__ = 'data_versions'
+    user_id = Column(Integer, primary_key=True)
+    projects_version = Column(BigInteger, nullable=False, server_default=text('0'))
+    projects_modified = Column(DateTime(timezone=True))
+    tasks_version = Column(BigInteger, nullable=False, server_default=text('0'))
+    tasks_modified = Column(DateTime(timezone=True))
+
+
+class DeletedItem(Base):
+    """Запись о полностью удалённом (complete_remove) проекте или задаче, чтобы /sync мог сообщить об удалении"""
+    __tablename__ = 'deleted_items'
+    deleted_item_id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey("users.user_id"), nullable=False)
+    item_type = Column(String(10), nullable=False) # project или task
+    item_id = Column(Integer, nullable=False)
+    deleted_date = Column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        # удаления после курсора синхронизации и очистка старых записей
+        Index('ix_deleted_items_user_date', 'user_id', 'deleted_date', 'deleted_item_id'),
+        Index('ix_deleted_items_date', 'deleted_date'),
+    )
+
+class RefreshToken(Base):
+    """Выданный refresh токен. Хранится только хеш его id (jti), цепочка ротаций одного входа - family_id"""
+    __tablename__ = 'refresh_tokens'
+    token_hash = Column(String(64), primary_key=True) # sha256 от jti
+    user_id = Column(Integer, ForeignKey("users.user_id"), nullable=False)
+    family_id = Column(String(32), nullable=False)     # общий для всех токенов, полученных ротацией после одного входа
+    created_date = Column(DateTime(timezone=True), nullable=False)
+    expires_date = Column(DateTime(timezone=True), nullable=False)
+    revoked_date = Column(DateTime(timezone=True))     # время ротации или отзыва (NULL - токен действует)
+    replaced_by = Column(String(64))                   # хеш токена выданного взамен при ротации
+
+    __table_args__ = (
+        # отзыв всех токенов входа (повторное использование, выход) и всех токенов пользователя
+        Index('ix_refresh_tokens_family', 'family_id'),
+        Index('ix_refresh_tokens_user', 'user_id'),
+        # очистка истёкших фоновой задачей
+        Index('ix_refresh_tokens_expires', 'expires_date'),
+    )
+
+class Job(Base):
+    """
+    Фоновое задание над проектом (app/jobs.py). Выполняется пачками, прогресс сохраняется в той же транзакции,
+    что и пачка, поэтому задание упавшего воркера продолжается с места остановки
+    """
+    __tablename__ = 'jobs'
+    job_id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey("users.user_id"), nullable=False)
+    kind = Column(String(30), nullable=False)        # delete_project или recover_project
+    project_id = Column(Integer, nullable=False)
+    state = Column(String(10), nullable=False)       # queued, running, done или failed
+    total = Column(Integer, nullable=False)          # задач на момент постановки в очередь
+    processed = Column(Integer, nullable=False, default=0)
+    attempts = Column(Integer, nullable=False, default=0)  # сколько раз задание брал воркер
+    worker_id = Column(String(64))                   # воркер, выполняющий задание (running)
+    result = Column(JSONB)                           # итог (done) или накопленные данные пачек
+    error = Column(String(500))                      # причина ошибки (failed)
+    created_date = Column(DateTime(timezone=True), nullable=False)
+    started_date = Column(DateTime(timezone=True))
+    heartbeat_date = Column(DateTime(timezone=True)) # время последней пачки, устаревшее - воркер упал
+    finished_date = Column(DateTime(timezone=True))
+
+    __table_args__ = (
+        # выбор следующего задания воркером и проверка, что над проектом не выполняется другое задание
+        Index('ix_jobs_pending', 'job_id', postgresql_where=text("state IN ('queued', 'running')")),
+        Index('ix_jobs_project_pending', 'project_id', postgresql_where=text("state IN ('queued', 'running')")),
+        # очистка завершённых фоновой задачей
+        Index('ix_jobs_finished', 'finished_date'),
+    )
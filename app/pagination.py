@@ -0,0 +1,70 @@
+import base64
+import binascii
+import json
+
+from fastapi import HTTPException, status
+from sqlalchemy import Select, tuple_
+from typing import Optional, Union
+
+# Размер страницы для списков проектов и задач
+PAGE_SIZE_DEFAULT = 100
+PAGE_SIZE_MAX = 1000
+
+# заголовок ответа в котором передаётся курсор следующей страницы (его нет если страница последняя)
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+
+def encode_cursor(sort_key: Union[int, str], item_id: int) -> str:
+    """
+    Курсор указывает на последний элемент страницы. Для клиента это непрозрачная строка
+    :param sort_key: позиция (position_index) или ключ сортировки (rank) последнего элемента
+    :param item_id: id последнего элемента
+    """
+    raw = json.dumps([sort_key, item_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor: str, key_type: type = int) -> tuple[Union[int, str], int]:
+    """
+    :param key_type: тип ключа сортировки (int - position_index, str - rank)
+    :return: (ключ сортировки, id) последнего элемента предыдущей страницы
+    :raise HTTPException: 400 если курсор повреждён
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        sort_key, item_id = json.loads(raw)
+        if type(sort_key) is not key_type or type(item_id) is not int:
+            raise ValueError
+    except (binascii.Error, ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Некорректный cursor"
+        )
+    return sort_key, item_id
+
+def keyset_page(query: Select, position_column, id_column, cursor: Optional[str], limit: int) -> Select:
+    """
+    Добавляет к запросу сортировку по (position_index, id) и выборку страницы после курсора.
+    Выбирается limit + 1 строка, чтобы понять есть ли следующая страница
+    :param query: запрос с уже применёнными фильтрами
+    :param position_column: Project.position_index или Task.position_index (в режиме rank - столбец rank)
+    :param id_column: Project.project_id или Task.task_id
+    :param cursor: курсор из заголовка X-Next-Cursor предыдущей страницы
+    :param limit: размер страницы
+    """
+    if cursor is not None:
+        sort_key, item_id = decode_cursor(cursor, position_column.type.python_type)
+        query = query.where(tuple_(position_column, id_column) > tuple_(sort_key, item_id))
+    return query.order_by(position_column, id_column).limit(limit + 1)
+
+def split_page(items: list, limit: int, id_field: str, key_field: str = 'position_index') -> tuple[list, Optional[str]]:
+    """
+    :param items: результат запроса из keyset_page
+    :param limit: размер страницы
+    :param id_field: 'project_id' или 'task_id'
+    :param key_field: 'position_index' или 'rank' (столбец сортировки из keyset_page)
+    :return: (элементы страницы, курсор следующей страницы или None)
+    """
+    if len(items) <= limit:
+        return list(items), None
+    page = list(items[:limit])
+    return page, encode_cursor(getattr(page[-1], key_field), getattr(page[-1], id_field))
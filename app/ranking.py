@@ -0,0 +1,106 @@
+import os
+from typing import Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import func, cast, literal, BigInteger, Integer
+
+# Ключи сортировки (lexorank) для режима ORDERING_MODE=rank.
+# Ключ - строка из цифр base62, порядок элементов - лексикографический порядок ключей (collation "C").
+# Между любыми двумя ключами всегда есть третий, поэтому перемещение элемента меняет только его собственный ключ.
+
+load_dotenv()  # Загружает переменные из .env
+ORDERING_MODE = os.getenv('ORDERING_MODE', 'index')          # index - сдвиг position_index, rank - ключи сортировки
+RANK_MAX_LENGTH = int(os.getenv('RANK_MAX_LENGTH', 24))      # при более длинных ключах фоновая задача перестраивает ключи
+
+DIGITS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+BASE = len(DIGITS)
+_DIGIT_VALUES = {digit: value for value, digit in enumerate(DIGITS)}
+
+RANK_WIDTH = 6           # количество цифр "целой" части ключа, по которой идёт добавление в конец
+RANK_STEP = BASE ** 3    # шаг между ключами при добавлении в конец и при перестроении
+
+
+def rank_mode() -> bool:
+    """:return: True если порядок хранится в ключах сортировки, а не в position_index"""
+    return ORDERING_MODE == 'rank'
+
+def _encode(number: int) -> str:
+    """Число в ключ из RANK_WIDTH цифр (без нулей в конце, иначе между ключами может не найтись промежуточного)"""
+    digits = []
+    for _ in range(RANK_WIDTH):
+        number, digit = divmod(number, BASE)
+        digits.append(DIGITS[digit])
+    return ''.join(reversed(digits)).rstrip(DIGITS[0])
+
+def _decode_head(key: str) -> int:
+    """:return: первые RANK_WIDTH цифр ключа как число"""
+    number = 0
+    for digit in key[:RANK_WIDTH].ljust(RANK_WIDTH, DIGITS[0]):
+        number = number * BASE + _DIGIT_VALUES[digit]
+    return number
+
+def _midpoint(before: str, after: Optional[str]) -> str:
+    """
+    :param before: меньший ключ ('' - начало)
+    :param after: больший ключ (None - конец)
+    :return: ключ строго между before и after
+    """
+    if after is not None:
+        # общий префикс переносим как есть
+        prefix = 0
+        while prefix < len(after) and (before[prefix] if prefix < len(before) else DIGITS[0]) == after[prefix]:
+            prefix += 1
+        if prefix > 0:
+            return after[:prefix] + _midpoint(before[prefix:], after[prefix:])
+
+    digit_before = _DIGIT_VALUES[before[0]] if before else 0
+    digit_after = _DIGIT_VALUES[after[0]] if after is not None else BASE
+    if digit_after - digit_before > 1:
+        return DIGITS[(digit_before + digit_after + 1) // 2]
+
+    # соседние цифры: ключ станет на одну цифру длиннее
+    if after is not None and len(after) > 1:
+        return after[:1]
+    return DIGITS[digit_before] + _midpoint(before[1:], None)
+
+def key_between(before: Optional[str], after: Optional[str]) -> str:
+    """
+    :param before: ключ предыдущего элемента (None - элемент будет первым)
+    :param after: ключ следующего элемента (None - элемент будет последним)
+    :return: ключ для элемента между ними
+    """
+    if before is not None and after is not None and before >= after:
+        # одинаковые ключи (одновременная вставка). Порядок восстановит перестроение ключей
+        return key_between(before, None)
+    return _midpoint(before or '', after)
+
+def key_after(last: Optional[str]) -> str:
+    """
+    Ключ для добавления в конец. В отличие от key_between длина ключа не растёт
+    :param last: максимальный ключ (None если элементов нет)
+    """
+    if last is None:
+        return _encode(RANK_STEP)
+
+    head = _decode_head(last) + RANK_STEP
+    if head < BASE ** RANK_WIDTH:
+        return _encode(head)
+    return key_between(last, None)  # "целая" часть закончилась
+
+def evenly_spaced_keys(count: int) -> list[str]:
+    """:return: count возрастающих ключей с одинаковым шагом (для миграции и перестроения)"""
+    step = max(min(RANK_STEP, BASE ** RANK_WIDTH // (count + 1)), 1)
+    return [_encode((index + 1) * step) for index in range(count)]
+
+def evenly_spaced_key_sql(number, count):
+    """
+    SQL выражение ключа evenly_spaced_keys(count)[number - 1] (для пересчёта ключей одним UPDATE)
+    :param number: SQL выражение номера элемента, начиная с 1 (например row_number())
+    :param count: SQL выражение количества элементов
+    """
+    step = func.greatest(func.least(RANK_STEP, literal(BASE ** RANK_WIDTH, BigInteger) // (count + 1)), 1,
+                         type_=BigInteger)
+    value = number * step
+    digits = [func.substr(DIGITS, cast(value // BASE ** power % BASE + 1, Integer), 1)
+              for power in reversed(range(RANK_WIDTH))]
+    return func.rtrim(func.concat(*digits), DIGITS[0])
@@ -0,0 +1,135 @@
+import os
+import time
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+
+from app.dependencies import decode_access_token
+
+load_dotenv()  # Загружает переменные из .env
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+RATE_LIMIT_CAPACITY = float(os.getenv('RATE_LIMIT_CAPACITY', 100))           # размер корзины (допустимый всплеск)
+RATE_LIMIT_REFILL_RATE = float(os.getenv('RATE_LIMIT_REFILL_RATE', 20))      # сколько жетонов добавляется в секунду
+RATE_LIMIT_MAX_KEYS = int(os.getenv('RATE_LIMIT_MAX_KEYS', 100000))          # сколько корзин держать в памяти
+# сколько запросов обрабатывается одновременно (остальные получают 503, 0 - без ограничения)
+MAX_CONCURRENT_REQUESTS = int(os.getenv('MAX_CONCURRENT_REQUESTS', 64))
+ADMISSION_TIMEOUT = float(os.getenv('ADMISSION_TIMEOUT', 0.5))               # сколько секунд ждать свободного места
+
+# стоимость запроса в жетонах (по умолчанию 1): bcrypt, чтение больших списков и файлов стоят дороже
+ROUTE_COSTS = {
+    '/token': 10,
+    '/new_user': 10,
+    '/refresh_token': 2,
+    '/get_tasks/': 5,
+    '/get_projects/': 2,
+    '/sync': 2,
+    '/export': 20,
+    '/import': 20,
+    '/create_tasks_bulk': 5,
+    '/update_tasks_bulk': 5,
+    '/delete_tasks_bulk': 5,
+}
+
+
+class RateLimitStore(ABC):
+    """
+    Хранилище корзин жетонов (token bucket).
+    Локальная реализация живёт в памяти процесса, общая (для нескольких воркеров) должна реализовать эти же методы
+    и выполнять consume атомарно
+    """
+
+    @abstractmethod
+    async def consume(self, key: str, cost: float, capacity: float, refill_rate: float) -> float:
+        """
+        Забирает cost жетонов из корзины key (новая корзина полная).
+        Стоимость больше capacity считается равной capacity, иначе такой запрос не прошёл бы никогда
+        :return: 0 если жетонов хватило, иначе через сколько секунд их станет достаточно (жетоны не забираются)
+        """
+
+    @abstractmethod
+    async def refund(self, key: str, cost: float, capacity: float):
+        """Возвращает в корзину key жетоны запроса, который не был обработан (не больше capacity)"""
+
+    @abstractmethod
+    async def clear(self):
+        """Удаляет все корзины"""
+
+
+class LocalRateLimitStore(RateLimitStore):
+    """Корзины в памяти процесса, самые давно использованные вытесняются (вытесненная корзина снова полная)"""
+
+    def __init__(self, max_keys: int, clock: Callable[[], float] = time.monotonic):
+        """
+        :param max_keys: максимальное количество корзин
+        :param clock: источник времени в секундах
+        """
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()  # ключ -> (жетоны, время пересчёта)
+        self._lock = threading.Lock()
+
+    async def consume(self, key: str, cost: float, capacity: float, refill_rate: float) -> float:
+        with self._lock:
+            now = self.clock()
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * refill_rate)
+            cost = min(cost, capacity)
+
+            retry_after = 0.0
+            if tokens >= cost:
+                tokens -= cost
+            else:
+                retry_after = (cost - tokens) / refill_rate
+
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return retry_after
+
+    async def refund(self, key: str, cost: float, capacity: float):
+        with self._lock:
+            if key in self._buckets:  # вытесненная корзина и так полная
+                tokens, updated = self._buckets[key]
+                self._buckets[key] = (min(capacity, tokens + min(cost, capacity)), updated)
+
+    async def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+rate_limit_store: RateLimitStore = LocalRateLimitStore(max_keys=RATE_LIMIT_MAX_KEYS)
+
+def set_rate_limit_store(store: RateLimitStore):
+    """
+    Заменяет хранилище корзин (например, на общее для всех воркеров)
+    :param store: объект реализующий RateLimitStore
+    """
+    global rate_limit_store
+    rate_limit_store = store
+
+def route_cost(path: str) -> float:
+    return ROUTE_COSTS.get(path, 1)
+
+def client_key(headers: dict, client: Optional[tuple]) -> str:
+    """
+    Ключ корзины: пользователь из действительного access токена (без запроса к БД), иначе IP адрес.
+    Подпись проверяется, чтобы подставленный в токен чужой id не давал новую корзину
+    :param headers: заголовки запроса (имена в нижнем регистре)
+    :param client: (host, port) из ASGI scope
+    """
+    authorization = headers.get('authorization', '')
+    if authorization.lower().startswith('bearer '):
+        try:
+            payload = decode_access_token(authorization[7:])
+            return f"user:{payload.get('uid') or payload['sub']}"
+        except HTTPException:
+            pass
+    return f"ip:{client[0] if client else 'unknown'}"
@@ -0,0 +1,148 @@
+import hashlib
+import os
+import secrets
+from datetime import datetime, timedelta, timezone
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from sqlalchemy import select, insert, update, literal, DateTime, String
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.cache import CacheBackend, LocalCache
+from app.dependencies import (SECRET_KEY, ALGORITHM, REFRESH_TOKEN_TYPE, JWTError, jwt, token_claims,
+                              current_token_version)
+from app.models.models import RefreshToken
+
+load_dotenv()  # Загружает переменные из .env
+REFRESH_TOKEN_EXPIRE_DAYS = float(os.getenv('REFRESH_TOKEN_EXPIRE_DAYS', 30))          # время жизни refresh токена
+REVOKED_REFRESH_CACHE_SIZE = int(os.getenv('REVOKED_REFRESH_CACHE_SIZE', 100000))     # сколько отозванных id держать в памяти
+
+# Отозванные и уже использованные refresh токены (хеш jti -> family_id) и отозванные входы (family_id -> True).
+# Повтор такого токена отклоняется без запроса к БД. Источник истины - таблица refresh_tokens:
+# после вытеснения из памяти (или в другом воркере) повтор всё равно будет найден запросом ротации
+revoked_refresh_tokens: CacheBackend = LocalCache(max_size=REVOKED_REFRESH_CACHE_SIZE,
+                                                  ttl=REFRESH_TOKEN_EXPIRE_DAYS * 86400)
+revoked_families: CacheBackend = LocalCache(max_size=REVOKED_REFRESH_CACHE_SIZE,
+                                            ttl=REFRESH_TOKEN_EXPIRE_DAYS * 86400)
+
+
+def set_revoked_refresh_backend(tokens: CacheBackend, families: CacheBackend):
+    """Заменяет хранилища отозванных refresh токенов и входов (например, на общие для всех воркеров)"""
+    global revoked_refresh_tokens, revoked_families
+    revoked_refresh_tokens = tokens
+    revoked_families = families
+
+def hash_token_id(token_id: str) -> str:
+    """:return: sha256 от jti (в БД сам id токена не хранится)"""
+    return hashlib.sha256(token_id.encode()).hexdigest()
+
+def invalid_refresh_token() -> HTTPException:
+    return HTTPException(status_code=401, detail="Invalid refresh token")
+
+def encode_refresh_token(claims: dict, token_id: str, family_id: str, expires: datetime) -> str:
+    """
+    :param claims: token_claims пользователя
+    :param token_id: случайный id токена (jti)
+    :param family_id: id входа, общий для всех токенов полученных ротацией
+    """
+    return jwt.encode({**claims, "jti": token_id, "fam": family_id, "typ": REFRESH_TOKEN_TYPE, "exp": expires},
+                      SECRET_KEY, algorithm=ALGORITHM)
+
+def decode_refresh_token(token: str) -> dict:
+    """
+    :return: данные refresh токена
+    :raise HTTPException: 401 если подпись неверна, токен истёк или это не refresh токен (например, access токен)
+    """
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        raise HTTPException(status_code=401, detail="Refresh token expired or invalid")
+    if payload.get("typ") != REFRESH_TOKEN_TYPE or not all(key in payload for key in ("sub", "uid", "ver", "jti", "fam")):
+        raise invalid_refresh_token()
+    return payload
+
+async def issue_refresh_token(db: AsyncSession, user_id: int, login: str, token_version: int) -> str:
+    """Выдаёт refresh token для нового входа (транзакцию фиксирует вызывающий)"""
+    now = datetime.now(timezone.utc)
+    token_id, family_id = secrets.token_urlsafe(32), secrets.token_hex(16)
+    expires = now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    await db.execute(
+        insert(RefreshToken).values(token_hash=hash_token_id(token_id), user_id=user_id, family_id=family_id,
+                                    created_date=now, expires_date=expires)
+    )
+    return encode_refresh_token(token_claims(user_id, login, token_version), token_id, family_id, expires)
+
+async def revoke_family(db: AsyncSession, family_id: str):
+    """Отзывает все токены одного входа (транзакцию фиксирует вызывающий)"""
+    await db.execute(
+        update(RefreshToken)
+        .where((RefreshToken.family_id == family_id) & RefreshToken.revoked_date.is_(None))
+        .values(revoked_date=datetime.now(timezone.utc))
+    )
+    await revoked_families.set(family_id, True)
+
+async def revoke_user_refresh_tokens(db: AsyncSession, user_id: int):
+    """
+    Отзывает все refresh токены пользователя (транзакцию фиксирует вызывающий).
+    Память не обновляется: такие токены отклоняет и проверка версии токенов пользователя
+    """
+    await db.execute(
+        update(RefreshToken)
+        .where((RefreshToken.user_id == user_id) & RefreshToken.revoked_date.is_(None))
+        .values(revoked_date=datetime.now(timezone.utc))
+    )
+
+async def rotate_refresh_token(db: AsyncSession, payload: dict) -> str:
+    """
+    Обменивает refresh токен на новый того же входа. Старый помечается использованным и новый
+    записывается одним запросом (UPDATE ... RETURNING в CTE и INSERT ... SELECT из него).
+    Повторное предъявление использованного токена означает его утечку: отзывается весь вход
+    :param payload: данные токена (decode_refresh_token)
+    :return: новый refresh token
+    :raise HTTPException: 401 если токен отозван, уже использован или версия токенов пользователя сменилась
+    """
+    token_hash, family_id = hash_token_id(payload["jti"]), payload["fam"]
+
+    if await revoked_refresh_tokens.get(token_hash) is not None:  # повтор, известный этому процессу
+        if await revoked_families.get(family_id) is None:
+            await revoke_family(db, family_id)
+            await db.commit()
+        raise invalid_refresh_token()
+    if await revoked_families.get(family_id) is not None:
+        raise invalid_refresh_token()
+    if await current_token_version(payload["uid"], db) != payload["ver"]:
+        raise invalid_refresh_token()  # пользователь отозвал все токены
+
+    now = datetime.now(timezone.utc)
+    new_id = secrets.token_urlsafe(32)
+    new_hash = hash_token_id(new_id)
+    expires = now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+
+    used = (
+        update(RefreshToken)
+        .where((RefreshToken.token_hash == token_hash) & RefreshToken.revoked_date.is_(None) &
+               (RefreshToken.expires_date > now))
+        .values(revoked_date=now, replaced_by=new_hash)
+        .returning(RefreshToken.user_id, RefreshToken.family_id)
+        .cte('used')
+    )
+    result = await db.execute(
+        insert(RefreshToken)
+        .from_select(
+            ['token_hash', 'user_id', 'family_id', 'created_date', 'expires_date'],
+            select(literal(new_hash, String), used.c.user_id, used.c.family_id,
+                   literal(now, DateTime(timezone=True)), literal(expires, DateTime(timezone=True)))
+        )
+        .returning(RefreshToken.token_hash)
+        .add_cte(used)
+    )
+    rotated = result.scalar_one_or_none() is not None
+    if not rotated:  # токен уже использован (повтор) или отозван
+        await revoke_family(db, family_id)
+    await db.commit()
+    await revoked_refresh_tokens.set(token_hash, family_id)
+    if not rotated:
+        raise invalid_refresh_token()
+
+    claims = token_claims(payload["uid"], payload["sub"], payload["ver"])
+    return encode_refresh_token(claims, new_id, family_id, expires)
@@ -0,0 +1,25 @@
+from typing import List, Optional
+
+from fastapi import Response
+from pydantic import TypeAdapter
+
+from app.schemas.response import ProjectResponse, TaskResponse
+
+# Списки проверяются и сериализуются в JSON одним вызовом pydantic-core на весь список,
+# вместо model_validate каждого элемента и повторной проверки и сериализации через response_model FastAPI
+project_list_adapter = TypeAdapter(List[ProjectResponse])
+task_list_adapter = TypeAdapter(List[TaskResponse])
+
+
+def list_json_response(adapter: TypeAdapter, items: list[dict], headers: Optional[dict] = None) -> Response:
+    """
+    :param adapter: project_list_adapter или task_list_adapter
+    :param items: словари с полями схемы ответа (например из rows_with_status)
+    :param headers: дополнительные заголовки ответа
+    :return: готовый JSON ответ (FastAPI не обрабатывает его через response_model)
+    """
+    return Response(
+        content=adapter.dump_json(adapter.validate_python(items)),
+        media_type='application/json',
+        headers=headers
+    )
@@ -1,14 +1,28 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from datetime import datetime, timezone
+
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Header, Request
+from fastapi.responses import Response, StreamingResponse
 
 from sqlalchemy import select, cast, Boolean
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from typing import List, Optional
+from typing import List, Literal, Optional, Union
 
-from app.data_base.data_base import get_db
-from app.dependencies import get_current_user, check_overdue_projects, check_overdue_tasks
-from app.models.models import User, Project, Task
-from app.schemas.response import ProjectResponse, TaskResponse, UserResponse
+from app.data_base.data_base import get_db, get_pool_metrics
+from app.dependencies import (get_current_user, get_current_principal, Principal, user_cache_stats, effective_status,
+                              ensure_utc, rows_with_status, response_columns)
+from app.conditional import version_stamp, etag_matches, not_modified
+from app.export import export_lines, gzip_chunks
+from app.pagination import PAGE_SIZE_DEFAULT, PAGE_SIZE_MAX, NEXT_CURSOR_HEADER, keyset_page, split_page
+from app.jobs import job_response, project_pending_deletion
+from app.models.models import User, Project, Task, Job
+from app.ranking import rank_mode
+from app.search import search_page
+from app.stats import collect_stats
+from app.sync import collect_changes
+from app.responses import list_json_response, project_list_adapter, task_list_adapter
+from app.schemas.response import (ProjectResponse, TaskResponse, UserResponse, PoolMetricsResponse, CacheMetricsResponse,
+                                  SyncResponse, StatsResponse, JobResponse)
 
 router = APIRouter()
 
@@ -16,24 +30,80 @@ router = APIRouter()
 async def get_me(current_user: User = Depends(get_current_user)):
     return current_user
 
+@router.get("/db_pool_metrics/", response_model=PoolMetricsResponse)
+async def db_pool_metrics(current_user: Principal = Depends(get_current_principal)):
+    """Состояние пула соединений с БД: занятые соединения, время ожидания, переполнение"""
+    return get_pool_metrics()
+
+@router.get("/user_cache_metrics/", response_model=CacheMetricsResponse)
+async def user_cache_metrics(current_user: Principal = Depends(get_current_principal)):
+    """Попадания и промахи кэша пользователей (каждое попадание - сэкономленный запрос к БД)"""
+    return user_cache_stats.snapshot()
+
+def apply_common_filters(query, model, status_id: Optional[List[int]],
+                         due_from: Optional[datetime], due_to: Optional[datetime]):
+    """
+    Фильтры общие для проектов и задач
+    :param model: Project или Task
+    :param status_id: статусы (с учётом просроченности). Если не переданы, то вернутся все кроме удалённых
+    :param due_from: desired_completion_date не раньше
+    :param due_to: desired_completion_date не позже
+    """
+    if status_id:
+        query = query.where(effective_status(model, datetime.now(timezone.utc)).in_(status_id))
+    else:
+        query = query.where(model.status_id != 4)  # удалённые только по явному запросу
+    if due_from is not None:
+        query = query.where(model.desired_completion_date >= ensure_utc(due_from))
+    if due_to is not None:
+        query = query.where(model.desired_completion_date <= ensure_utc(due_to))
+    return query
+
 @router.get('/get_projects/', response_model= List[ProjectResponse])
 async def get_project(
+        request: Request,
         project_id: Optional[int] = Query(None, description="ID проекта"),
-        current_user: User = Depends(get_current_user),
+        status_id: Optional[List[int]] = Query(None, description="Фильтр по статусу (можно несколько)"),
+        due_from: Optional[datetime] = Query(None, description="Желаемая дата завершения не раньше"),
+        due_to: Optional[datetime] = Query(None, description="Желаемая дата завершения не позже"),
+        limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX, description="Размер страницы"),
+        cursor: Optional[str] = Query(None, description=f"Курсор из заголовка {NEXT_CURSOR_HEADER}"),
+        if_none_match: Optional[str] = Header(None, description="ETag из предыдущего ответа"),
+        current_user: Principal = Depends(get_current_principal),
         db: AsyncSession = Depends(get_db)
 ):
+    """
+    Без project_id вернёт страницу проектов отсортированных по position_index (в режиме ORDERING_MODE=rank - по rank).
+    Если есть следующая страница, то её курсор будет в заголовке X-Next-Cursor.
+    Если проекты не изменились с ответа, ETag которого передан в If-None-Match, то вернётся 304 без тела
+    """
+    scope = Project.user_id == current_user.user_id
+    if project_id is not None:
+        scope &= Project.project_id == project_id
+    stamp = await version_stamp(db, Project, current_user.user_id, scope, request.url.query)
+    if etag_matches(if_none_match, stamp.etag):
+        return not_modified(stamp)  # проекты не загружаются и не сериализуются
+
+    # только нужные ответу столбцы (без ORM объектов), статус берётся из statuses
+    columns = response_columns(Project, ProjectResponse)
+    headers = stamp.headers()
+
     if project_id is None: # если необходимо вернуть все проекты
-        result = await db.execute(select(Project).where(cast(
-            (Project.user_id == current_user.user_id)
-            & (Project.status_id != 4), Boolean
-        )))
-        projects = result.scalars().all()
+        query = select(*columns).where(Project.user_id == current_user.user_id)
+        query = apply_common_filters(query, Project, status_id, due_from, due_to)
+        sort_column = Project.rank if rank_mode() else Project.position_index
+        query = keyset_page(query, sort_column, Project.project_id, cursor, limit)
+
+        result = await db.execute(query)
+        rows, next_cursor = split_page(result.all(), limit, 'project_id', sort_column.key)
+        if next_cursor is not None:
+            headers[NEXT_CURSOR_HEADER] = next_cursor
     else:
-        result = await db.execute(select(Project).where(cast(
+        result = await db.execute(select(*columns).where(cast(
             (Project.user_id == current_user.user_id) &
             (Project.project_id == project_id), Boolean
         )))
-        project = result.scalars().one_or_none()
+        project = result.one_or_none()
 
         if project is None:
             raise HTTPException(
@@ -46,32 +116,58 @@ async def get_project(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Проект с ID {project_id} удалён"
         )
-        projects = [project]  # Заворачиваем в список для соответствия response_model
+        rows = [project]  # Заворачиваем в список для соответствия response_model
 
-    # Проверка просроченности
-    update_projects = await check_overdue_projects(current_user.user_id, [p.project_id for p in projects], db)
-
-    return update_projects
+    # Просроченность вычисляется по дате и только для возвращаемой страницы, статус в БД обновляет фоновая задача
+    return list_json_response(project_list_adapter, rows_with_status(rows), headers)
 
 @router.get('/get_tasks/', response_model=List[TaskResponse])
 async def get_tasks(
+        request: Request,
         project_id: Optional[int] = Query(None, description="ID проекта"),
         task_id: Optional[int] = Query(None, description="ID задачи"),
-        current_user: User = Depends(get_current_user),
+        status_id: Optional[List[int]] = Query(None, description="Фильтр по статусу (можно несколько)"),
+        priority: Optional[List[int]] = Query(None, description="Фильтр по приоритету (можно несколько)"),
+        due_from: Optional[datetime] = Query(None, description="Желаемая дата завершения не раньше"),
+        due_to: Optional[datetime] = Query(None, description="Желаемая дата завершения не позже"),
+        limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX, description="Размер страницы"),
+        cursor: Optional[str] = Query(None, description=f"Курсор из заголовка {NEXT_CURSOR_HEADER}"),
+        if_none_match: Optional[str] = Header(None, description="ETag из предыдущего ответа"),
+        current_user: Principal = Depends(get_current_principal),
         db: AsyncSession = Depends(get_db)
 ):
-    """Если передать id проекта, то вернутся все задачи по этому проекту. """
+    """
+    Если передать id проекта, то вернутся задачи по этому проекту, без параметров - задачи из всех проектов.
+    Задачи возвращаются страницами отсортированными по position_index (в режиме ORDERING_MODE=rank - по rank).
+    Если есть следующая страница, то её курсор будет в заголовке X-Next-Cursor.
+    Если задачи не изменились с ответа, ETag которого передан в If-None-Match, то вернётся 304 без тела
+    """
     if (not task_id is None) and (not project_id is None): # если передали два параметра
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Необходимо указать либо project_id, либо task_id"
         )
-    elif not task_id is None: # если передали только task_id -> вернём эту задачу
-        result = await db.execute(select(Task).where(cast(
+
+    scope = Task.user_id == current_user.user_id
+    if task_id is not None:
+        scope &= Task.task_id == task_id
+    elif project_id is not None:
+        scope &= Task.project_id == project_id
+    stamp = await version_stamp(db, Task, current_user.user_id, scope, request.url.query)
+    if etag_matches(if_none_match, stamp.etag):
+        return not_modified(stamp)  # задачи не загружаются и не сериализуются
+
+    # только нужные ответу столбцы (без ORM объектов), статус берётся из statuses
+    columns = response_columns(Task, TaskResponse)
+    headers = stamp.headers()
+
+    if not task_id is None: # если передали только task_id -> вернём эту задачу
+        result = await db.execute(select(*columns).where(cast(
             (Task.user_id == current_user.user_id) &
-            (Task.task_id == task_id),Boolean
+            (Task.task_id == task_id) &
+            ~project_pending_deletion(Task.project_id), Boolean  # задачи удаляемого в задании проекта скрыты
         )))
-        task = result.scalars().one_or_none()
+        task = result.one_or_none()
         if task is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -83,22 +179,121 @@ async def get_tasks(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Задача с ID {task_id} удалён"
         )
-        tasks = [task]  # Заворачиваем в список для соответствия response_model
-    elif not project_id is None: # если передали только project_id -> вернём эту все задачи в этом проекте
-        result = await db.execute(select(Task).where(cast(
+        rows = [task]  # Заворачиваем в список для соответствия response_model
+    else: # вернём страницу задач проекта (если передали project_id) или всех задач пользователя
+        query = select(*columns).where(
             (Task.user_id == current_user.user_id) &
-            (Task.project_id == project_id) &
-            (Task.status_id != 4), Boolean # если не удален
-        )))
-        tasks = result.scalars().all()
-    else: # ничего не передали -> необходимо вернуть все задачи
-        result = await db.execute(select(Task).where(cast(
-            Task.user_id == current_user.user_id, Boolean
-        )))
-        tasks = result.scalars().all()
+            ~project_pending_deletion(Task.project_id)  # проект уже скрыт, его задачи удаляет фоновое задание
+        )
+        if project_id is not None:
+            query = query.where(Task.project_id == project_id)
+        if priority:
+            query = query.where(Task.priority.in_(priority))
+        query = apply_common_filters(query, Task, status_id, due_from, due_to)
+        sort_column = Task.rank if rank_mode() else Task.position_index
+        query = keyset_page(query, sort_column, Task.task_id, cursor, limit)
 
-    # Проверка просроченности
-    update_tasks = await check_overdue_tasks(current_user.user_id, [p.task_id for p in tasks], db)
+        result = await db.execute(query)
+        rows, next_cursor = split_page(result.all(), limit, 'task_id', sort_column.key)
+        if next_cursor is not None:
+            headers[NEXT_CURSOR_HEADER] = next_cursor
 
-    return update_tasks
+    # Просроченность вычисляется по дате и только для возвращаемой страницы, статус в БД обновляет фоновая задача
+    return list_json_response(task_list_adapter, rows_with_status(rows), headers)
+
+
+@router.get('/search/', response_model=Union[List[TaskResponse], List[ProjectResponse]])
+async def search(
+        q: str = Query(..., min_length=1, max_length=200, description="Слова для поиска в названии и описании"),
+        kind: Literal['tasks', 'projects'] = Query('tasks', description="Искать задачи или проекты"),
+        project_id: Optional[int] = Query(None, description="Искать только задачи этого проекта"),
+        limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX, description="Размер страницы"),
+        cursor: Optional[str] = Query(None, description=f"Курсор из заголовка {NEXT_CURSOR_HEADER}"),
+        current_user: Principal = Depends(get_current_principal),
+        db: AsyncSession = Depends(get_db)
+):
+    """
+    Поиск задач или проектов (кроме удалённых) по словам в названии и описании, каждое слово может быть началом слова.
+    Результаты отсортированы по релевантности (совпадение в названии важнее), следующая страница - по курсору
+    из заголовка X-Next-Cursor
+    """
+    if project_id is not None and kind != 'tasks':
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="project_id можно указать только при поиске задач"
+        )
+
+    rows, next_cursor = await search_page(db, kind, current_user.user_id, q, project_id, limit, cursor)
+    headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor is not None else None
+    adapter = task_list_adapter if kind == 'tasks' else project_list_adapter
+    return list_json_response(adapter, rows_with_status(rows), headers)
+
+
+@router.get('/stats/', response_model=StatsResponse)
+async def stats(current_user: Principal = Depends(get_current_principal),
+                db: AsyncSession = Depends(get_db)):
+    """
+    Количество задач по статусам (с учётом просроченности) и приоритетам для каждого проекта и в сумме.
+    Считается одним запросом в БД, задачи не загружаются
+    """
+    return await collect_stats(db, current_user.user_id)
+
+
+@router.get('/jobs/', response_model=JobResponse)
+async def get_job(job_id: int = Query(..., description="ID задания"),
+                  current_user: Principal = Depends(get_current_principal),
+                  db: AsyncSession = Depends(get_db)):
+    """Состояние фонового задания (delete_project и recover_project с background=true) и количество обработанных задач"""
+    result = await db.execute(select(Job).where((Job.job_id == job_id) & (Job.user_id == current_user.user_id)))
+    job = result.scalar_one_or_none()
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Задание с ID {job_id} не найдено"
+        )
+    return job_response(job)
+
+
+@router.get('/sync', response_model=SyncResponse)
+async def sync_changes(
+        cursor: Optional[str] = Query(None, description="Курсор из предыдущего ответа"),
+        since: Optional[datetime] = Query(None, description="Изменения после этого времени (если нет курсора)"),
+        limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX, description="Максимум изменений каждого вида"),
+        current_user: Principal = Depends(get_current_principal),
+        db: AsyncSession = Depends(get_db)
+):
+    """
+    Проекты и задачи (включая архивированные), созданные или изменённые после курсора, и id полностью удалённых.
+    Без cursor и since вернёт все проекты и задачи. Изменения отдаются с задержкой SYNC_LAG_SECONDS,
+    одно и то же изменение может прийти повторно (клиент заменяет элемент по id).
+    Если has_more, то запрос нужно сразу повторить с новым cursor. 410 - курсор устарел, нужна полная синхронизация
+    """
+    if cursor is not None and since is not None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Необходимо указать либо cursor, либо since"
+        )
+
+    changes = await collect_changes(db, current_user.user_id, cursor, since, limit)
+    return Response(content=SyncResponse.model_validate(changes).model_dump_json(), media_type='application/json')
+
+@router.get('/export', response_class=StreamingResponse)
+async def export_data(
+        compress: bool = Query(False, description="Сжать файл gzip"),
+        current_user: Principal = Depends(get_current_principal)
+):
+    """
+    Выгрузка всех проектов и задач пользователя (включая удалённые) в формате NDJSON: одна строка - один проект
+    или задача. Файл отправляется по частям по мере чтения из БД, его можно загрузить обратно через /import
+    """
+    chunks = export_lines(current_user.user_id)
+    filename = 'export.ndjson'
+    if compress:
+        chunks = gzip_chunks(chunks)
+        filename += '.gz'
 
+    return StreamingResponse(
+        chunks,
+        media_type='application/gzip' if compress else 'application/x-ndjson',
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
@@ -1,18 +1,32 @@
 from datetime import datetime, timedelta, timezone
+from typing import Optional, Union
 
-from sqlalchemy import select, update, func, cast, Boolean, delete
+from sqlalchemy import select, update, func, cast, Boolean, delete, insert, literal, String, DateTime
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from fastapi import Depends, HTTPException, status, APIRouter, Query
+from fastapi import Depends, HTTPException, status, APIRouter, Query, Request, Response
 from fastapi.security import OAuth2PasswordRequestForm
 
 from app.data_base.data_base import get_db
-from app.dependencies import check_overdue_projects, check_overdue_tasks
-from app.models.models import User, Project, Status, Task
-from app.schemas.request import RefreshTokenRequest, ProjectCreate, TaskCreate, UserCreate, UpdateProject, UpdateTask
-from app.schemas.response import TaskResponse, Token, ProjectResponse, UserResponse, DeleteProjectResponse, DeleteTaskResponse
-from app.dependencies import (hash_password, verify_password, get_current_user, ACCESS_TOKEN_EXPIRE_MINUTES,
-                              create_access_token, SECRET_KEY, ALGORITHM, ensure_utc, JWTError, jwt)
+from app.export import UserImport, read_lines
+from app.jobs import (enqueue_job, job_response, job_workers, project_has_pending_job, recover_project_tasks,
+                      restore_project, restored_status)
+from app.sync import record_deletions
+from app.refresh_tokens import (issue_refresh_token, decode_refresh_token, rotate_refresh_token, revoke_family,
+                                revoke_user_refresh_tokens)
+from app.models.models import User, Project, Task
+from app.pagination import keyset_page, split_page, NEXT_CURSOR_HEADER, PAGE_SIZE_MAX
+from app.ranking import rank_mode, key_after, key_between, evenly_spaced_keys, RANK_MAX_LENGTH
+from app.stats import build_stats
+from app.schemas.request import (RefreshTokenRequest, ProjectCreate, TaskCreate, UserCreate, UpdateProject, UpdateTask,
+                                 TaskBulkCreate, TaskBulkUpdate, TaskBulkDelete)
+from app.schemas.response import (TaskResponse, Token, ProjectResponse, UserResponse, DeleteProjectResponse, DeleteTaskResponse,
+                                  BulkTaskResult, BulkTaskResponse, ImportResponse, RecoverProjectResponse,
+                                  JobResponse)
+from app.dependencies import (hash_password_async, verify_password_async, get_current_principal, Principal,
+                              ACCESS_TOKEN_EXPIRE_MINUTES, create_access_token, token_claims, revoke_tokens,
+                              remember_token_version, ensure_utc, invalidate_cached_user, status_response, response_with_status,
+                              response_columns, rows_with_status)
 
 router = APIRouter()
 
@@ -31,7 +45,7 @@ async def create_user(user: UserCreate,
         raise HTTPException(status_code=400, detail="Email already registered")
 
     # Создание нового пользователя
-    hashed_password = hash_password(user.password)
+    hashed_password = await hash_password_async(user.password)
     db_user = User(
         login=user.login,
         password=hashed_password,
@@ -43,6 +57,7 @@ async def create_user(user: UserCreate,
     db.add(db_user)
     await db.commit()
     await db.refresh(db_user)
+    await invalidate_cached_user(db_user.login)
     return db_user
 
 @router.post('/token', response_model=Token)
@@ -52,7 +67,7 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
         select(User).where(cast(User.login == form_data.username, Boolean)))
     db_user = user.scalar_one_or_none()
 
-    if not db_user or not verify_password(form_data.password, db_user.password):
+    if not db_user or not await verify_password_async(form_data.password, db_user.password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Некорректный user_name или пароль",
@@ -61,130 +76,207 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
 
     # Обновляем время последнего входа
     db_user.last_login = datetime.now()
+    new_refresh_token = await issue_refresh_token(db, db_user.user_id, db_user.login, db_user.token_version)
     await db.commit()
+    await invalidate_cached_user(db_user.login)  # в кэше остался старый last_login
+    await remember_token_version(db_user.user_id, db_user.token_version)  # первый /refresh_token без чтения users
 
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": form_data.username}, expires_delta=access_token_expires
+        data=token_claims(db_user.user_id, db_user.login, db_user.token_version), expires_delta=access_token_expires
     )
-    return {"access_token": access_token, "token_type": "bearer"}
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": new_refresh_token}
 
 
-# для обновления токена (со стороны клиента посылается старый токен)
+# для обновления токена (со стороны клиента посылается refresh token из /token или прошлого /refresh_token)
 @router.post('/refresh_token', response_model=Token)
 async def refresh_token(request: RefreshTokenRequest,
                         db: AsyncSession = Depends(get_db)):
-    try:
-        payload = jwt.decode(request.refresh_token, SECRET_KEY, algorithms=[ALGORITHM])
-        username = payload.get("sub")
-
-        # Проверяем, что пользователь существует
-        user = await db.execute(select(User).where(cast(User.login == username, Boolean)))
-        user = user.scalar_one_or_none()
-        if not user:
-            raise HTTPException(status_code=401, detail="Invalid refresh token")
+    """
+    Выдаёт новый access token и новый refresh token (ротация: присланный refresh token больше не действует).
+    Повторное использование refresh token отзывает все токены этого входа
+    """
+    payload = decode_refresh_token(request.refresh_token)
+    new_refresh_token = await rotate_refresh_token(db, payload)
+
+    # Генерируем новый Access Token
+    new_access_token = create_access_token(data=token_claims(payload["uid"], payload["sub"], payload["ver"]))
+    return {"access_token": new_access_token, "token_type": "bearer", "refresh_token": new_refresh_token}
+
+@router.post('/logout', status_code=status.HTTP_204_NO_CONTENT)
+async def logout(request: RefreshTokenRequest,
+                 db: AsyncSession = Depends(get_db)):
+    """Выход на этом устройстве: refresh token этого входа перестаёт действовать (access token - по истечении)"""
+    payload = decode_refresh_token(request.refresh_token)
+    await revoke_family(db, payload["fam"])
+    await db.commit()
 
-        # Генерируем новый Access Token
-        new_access_token = create_access_token(data={"sub": username})
-        return {"access_token": new_access_token, "token_type": "bearer"}
+@router.post('/revoke_tokens', status_code=status.HTTP_204_NO_CONTENT)
+async def revoke_all_tokens(current_user: Principal = Depends(get_current_principal),
+                            db: AsyncSession = Depends(get_db)):
+    """Выход на всех устройствах: все выданные пользователю токены (включая текущий) перестают действовать"""
+    await revoke_tokens(db, current_user.user_id, current_user.login)
+    await revoke_user_refresh_tokens(db, current_user.user_id)
+    await db.commit()
 
-    except JWTError:
-        raise HTTPException(status_code=401, detail="Refresh token expired or invalid")
+async def last_rank(db: AsyncSession, model, scope_condition) -> Optional[str]:
+    """
+    :param scope_condition: условие группы (проекты пользователя или задачи проекта)
+    :return: максимальный ключ сортировки среди активных элементов группы (None если их нет)
+    """
+    result = await db.execute(select(func.max(model.rank)).where(scope_condition & (model.status_id != 4)))
+    return result.scalar_one_or_none()
+
+async def rank_for_position(db: AsyncSession, model, primary_key, scope_condition, new_index: int) -> str:
+    """
+    Ключ сортировки для перемещения элемента на позицию new_index (режим ORDERING_MODE=rank).
+    Читаются только соседи новой позиции, остальные элементы группы не изменяются
+    :param scope_condition: условие группы без самого перемещаемого элемента
+    :param new_index: новая позиция (если больше количества элементов, то элемент станет последним)
+    """
+    await db.flush()  # ключи перемещённых ранее в этой транзакции элементов (сессии создаются с autoflush=False)
+    neighbours = (
+        select(model.rank)
+        .where(scope_condition & (model.status_id != 4))
+        .order_by(model.rank, primary_key)
+    )
+    if new_index == 0:
+        first = (await db.execute(neighbours.limit(1))).scalar_one_or_none()
+        key = key_between(None, first)
+    else:
+        keys = (await db.execute(neighbours.offset(new_index - 1).limit(2))).scalars().all()
+        if len(keys) == 2:
+            key = key_between(keys[0], keys[1])
+        elif len(keys) == 1:  # новая позиция сразу после последнего элемента
+            key = key_after(keys[0])
+        else:
+            key = key_after(await last_rank(db, model, scope_condition))
+
+    if len(key) > RANK_MAX_LENGTH:  # частые перемещения в одно место: не ждём rank_rebalancer
+        return await rebuild_group_ranks(db, model, primary_key, scope_condition, new_index)
+    return key
+
+async def rebuild_group_ranks(db: AsyncSession, model, primary_key, scope_condition, new_index: int) -> str:
+    """
+    Перестраивает ключи группы с равным шагом в текущей транзакции, оставляя место на позиции new_index
+    (когда ключ между соседями стал бы длиннее RANK_MAX_LENGTH)
+    :param scope_condition: условие группы без самого перемещаемого элемента
+    :return: ключ для перемещаемого элемента
+    """
+    result = await db.execute(
+        select(model).where(scope_condition & (model.status_id != 4))
+        .order_by(model.rank, primary_key).with_for_update()
+    )
+    items = result.scalars().all()
+    new_index = min(new_index, len(items))
+    keys = evenly_spaced_keys(len(items) + 1)
+
+    now = datetime.now(timezone.utc)  # изменение ключа видно клиенту, /sync находит его по updated_date
+    for position, item in enumerate(items):
+        slot = position if position < new_index else position + 1
+        item.rank, item.position_index, item.updated_date = keys[slot], slot, now
+    return keys[new_index]
+
+def next_position(model, scope_condition):
+    """
+    Подзапрос позиции нового элемента в конце группы (вычисляется в самом INSERT, без отдельного запроса)
+    :param scope_condition: условие группы (проекты пользователя или задачи проекта)
+    """
+    return (
+        select(func.coalesce(func.max(model.position_index) + 1, 0))  # 0 если ранее в группе не было элементов
+        .where(scope_condition & (model.status_id != 4))  # если не удалён
+        .scalar_subquery()
+    )
 
 @router.post("/create_project", response_model=ProjectResponse)
 async def create_project(
     project_data: ProjectCreate,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: AsyncSession = Depends(get_db)
 ):
-
-    query = select(func.max(Project.position_index)).where(cast((
-        Project.user_id == current_user.user_id) & (Project.status_id != 4), Boolean
-    ))
-    result = await db.execute(query)
-    max_position = result.scalar_one_or_none()
-    if not max_position is None:
-        new_position = max_position + 1
-    else:  # если ранее в БД не было задач у этого проекта
-        new_position = 0
-
-    status_result = await db.execute(select(Status).where(cast(Status.status_id == 1, Boolean)))
-    status_from_db = status_result.scalar_one_or_none()
-
     if project_data.desired_completion_date is None:
         dt_completion = None
     else:
         dt_completion = ensure_utc(project_data.desired_completion_date)
 
-    new_project = Project(user_id=current_user.user_id,
-                          status_id=status_from_db.status_id,
-                          position_index=new_position,
-                          title=project_data.title,
-                          description=project_data.description,
-                          created_date=datetime.now(timezone.utc),
-                          desired_completion_date=dt_completion,
-                          updated_date=datetime.now(timezone.utc))
-    db.add(new_project)
+    new_rank = None  # в режиме index ключ заполнит rebalance_ranks при переходе на режим rank
+    if rank_mode():
+        new_rank = key_after(await last_rank(db, Project, Project.user_id == current_user.user_id))
+
+    now = datetime.now(timezone.utc)
+    # позиция, вставка и чтение созданной строки (id и значения по умолчанию) - один запрос
+    result = await db.execute(
+        insert(Project)
+        .values(user_id=current_user.user_id,
+                status_id=1,  # в работе
+                position_index=next_position(Project, Project.user_id == current_user.user_id),
+                rank=new_rank,
+                title=project_data.title,
+                description=project_data.description,
+                created_date=now,
+                desired_completion_date=dt_completion,
+                updated_date=now)
+        .returning(*response_columns(Project, ProjectResponse))
+    )
+    new_project = result.one()
     await db.commit()
-    await db.refresh(new_project)
-    new_project.status = status_from_db  # Устанавливаем уже загруженный статус через relationship. ЭТО ДЕЛАЕТСЯ ЧЕРЕЗ ПОЛЕ status
-    return new_project
+    return {**new_project._mapping, 'status': status_response(new_project.status_id)}  # статус из загруженных при запуске
 
 @router.post('/create_task', response_model=TaskResponse)
 async def create_task(
     task_data: TaskCreate,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: AsyncSession = Depends(get_db)
 ):
-    # Проверяем существование проекта
-    project = await db.get(Project, task_data.project_id)
-    if project is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Проект с ID {task_data.project_id} не найден"
-        )
-
-    result = await db.execute(select(func.max(Task.position_index)).where(cast(
-        (Task.user_id == current_user.user_id) &
-        (Task.status_id != 4) &                   # если не удалён
-        (Task.project_id == task_data.project_id),# ищем по tasks который так же находятся в этом проекте
-        Boolean
-    )))
-
-    max_position = result.scalar_one_or_none()
-    if not max_position is None:
-        new_position = max_position + 1
-    else:  # если ранее в БД не было задач у этого проекта
-        new_position = 0
-
-    status_result = await db.execute(select(Status).where(cast(Status.status_id == 1, Boolean)))
-    status_from_db = status_result.scalar_one_or_none()
-
     if task_data.desired_completion_date is None:
         dt_completion = None
     else:
         dt_completion = ensure_utc(task_data.desired_completion_date)
 
-    new_task = Task(user_id=current_user.user_id,
-                    project_id=task_data.project_id,
-                    status_id=status_from_db.status_id,
-                    position_index=new_position,
-                    title=task_data.title,
-                    description=task_data.description,
-                    created_date=datetime.now(timezone.utc),
-                    desired_completion_date=dt_completion,
-                    updated_date=datetime.now(timezone.utc))
-    db.add(new_task)
-    await db.commit()
-    await db.refresh(new_task)
+    new_rank = None  # в режиме index ключ заполнит rebalance_ranks при переходе на режим rank
+    if rank_mode():
+        new_rank = key_after(await last_rank(db, Task, Task.project_id == task_data.project_id))
+
+    now = datetime.now(timezone.utc)
+    values = {
+        'user_id': literal(current_user.user_id),
+        'project_id': Project.project_id,
+        'status_id': literal(1),  # в работе
+        'position_index': next_position(Task, (Task.user_id == current_user.user_id) &
+                                        (Task.project_id == task_data.project_id)),
+        'rank': literal(new_rank, String),
+        'priority': literal(task_data.priority or 1),  # null в запросе - приоритет по умолчанию
+        'title': literal(task_data.title, String),
+        'description': literal(task_data.description, String),
+        'created_date': literal(now, DateTime(timezone=True)),
+        'desired_completion_date': literal(dt_completion, DateTime(timezone=True)),
+        'updated_date': literal(now, DateTime(timezone=True)),
+    }
+    # строка вставляется только если проект существует и принадлежит пользователю (проверка в том же запросе)
+    result = await db.execute(
+        insert(Task)
+        .from_select(list(values), select(*values.values()).where(
+            (Project.project_id == task_data.project_id) & (Project.user_id == current_user.user_id) &
+            ~project_has_pending_job(Project.project_id)  # задание может удалить проект вместе с новой задачей
+        ))
+        .returning(*response_columns(Task, TaskResponse))
+    )
+    new_task = result.one_or_none()
+    if new_task is None:
+        if (await db.execute(select(project_has_pending_job(task_data.project_id)))).scalar():
+            raise project_busy(task_data.project_id)
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Проект с ID {task_data.project_id} не найден"
+        )
 
-    new_task.status = status_from_db
-    return new_task
+    await db.commit()
+    return {**new_task._mapping, 'status': status_response(new_task.status_id)}
 
 @router.post('/update_project', response_model=ProjectResponse)
 async def update_project(
     project_data: UpdateProject,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: AsyncSession = Depends(get_db)
 ):
     query = await db.execute(select(Project).where(cast(
@@ -200,7 +292,14 @@ async def update_project(
             detail=f"Проект с ID {project_data.project_id} не найден"
         )
 
-    if project_data.position_index is not None:
+    if project_data.position_index is not None and rank_mode():
+        # меняется только ключ самого проекта, position_index остальных пересчитает rank_rebalancer
+        project.rank = await rank_for_position(
+            db, Project, Project.project_id,
+            (Project.user_id == current_user.user_id) & (Project.project_id != project.project_id),
+            project_data.position_index
+        )
+    elif project_data.position_index is not None:
         query = await db.execute(select(func.max(Project.position_index)).where(cast(
             (Project.user_id == current_user.user_id) &
             (Project.status_id != 4), Boolean
@@ -214,6 +313,7 @@ async def update_project(
         new_index = project_data.position_index
 
         if new_index != old_index:
+            project.rank = None  # порядок теперь задаёт position_index, ключи группы пересчитает rebalance_ranks
             # Сдвигаем проекты между старым и новым индексом
             if new_index > old_index:
                 # Двигаем ВСЕ проекты между старым и новым индексом ВНИЗ на 1
@@ -225,7 +325,7 @@ async def update_project(
                         (Project.position_index > old_index) &  # > old_index (исключаем сам элемент)
                         (Project.position_index <= new_index)   # <= new_index (включаем новую позицию)
                     )
-                    .values(position_index=Project.position_index - 1) # Сдвиг вниз
+                    .values(position_index=Project.position_index - 1, updated_date=datetime.now(timezone.utc)) # Сдвиг вниз
                 )
             else:
                 # Двигаем ВСЕ проекты между новым и старым индексом ВВЕРХ на 1
@@ -237,7 +337,7 @@ async def update_project(
                         (Project.position_index >= new_index) & # >= new_index (включаем новую позицию)
                         (Project.position_index < old_index)    # < old_index (исключаем сам элемент)
                     )
-                    .values(position_index=Project.position_index + 1) # Сдвиг вверх
+                    .values(position_index=Project.position_index + 1, updated_date=datetime.now(timezone.utc)) # Сдвиг вверх
                 )
 
     # Обновляем только переданные поля
@@ -257,27 +357,117 @@ async def update_project(
 
     await db.commit()
     await db.refresh(project)
+    return response_with_status(ProjectResponse, project)
+
+
+async def move_task_position(db: AsyncSession, user_id: int, task: Task, new_index: int):
+    """
+    Перемещает задачу на позицию new_index, сдвигая задачи между старой и новой позицией.
+    В режиме ORDERING_MODE=rank вместо сдвига изменяется только ключ сортировки задачи
+    :param task: задача из БД (её position_index будет изменён)
+    :param new_index: новая позиция (уже ограниченная максимальной)
+    """
+    if rank_mode():
+        # меняется только ключ самой задачи, position_index остальных пересчитает rank_rebalancer
+        task.rank = await rank_for_position(
+            db, Task, Task.task_id,
+            (Task.project_id == task.project_id) & (Task.task_id != task.task_id),
+            new_index
+        )
+        task.position_index = new_index
+        return
+
+    old_index = task.position_index
+
+    if new_index != old_index:
+        task.rank = None  # порядок теперь задаёт position_index, ключи группы пересчитает rebalance_ranks
+        # Сдвигаем задачи между старым и новым индексом
+        if new_index > old_index:
+            # Двигаем ВСЕ задачи между старым и новым индексом ВНИЗ на 1
+            await db.execute(
+                update(Task)
+                .where(
+                    (Task.user_id == user_id) &
+                    (Task.status_id != 4) &              # если не удалён
+                    (Task.position_index > old_index) &  # > old_index (исключаем сам элемент)
+                    (Task.position_index <= new_index)   # <= new_index (включаем новую позицию)
+                ).values(position_index=Task.position_index - 1, updated_date=datetime.now(timezone.utc)) # Сдвиг вниз
+            )
+        else:
+            # Двигаем ВСЕ задачи между новым и старым индексом ВВЕРХ на 1
+            await db.execute(
+                update(Task)
+                .where(
+                    (Task.user_id == user_id) &
+                    (Task.status_id != 4) &              # если не удалён
+                    (Task.position_index >= new_index) & # >= new_index (включаем новую позицию)
+                    (Task.position_index < old_index)    # < old_index (исключаем сам элемент)
+                ).values(position_index=Task.position_index + 1, updated_date=datetime.now(timezone.utc)) # Сдвиг вверх
+            )
+
+    task.position_index = new_index
+
+def apply_task_changes(task: Task, task_data: UpdateTask):
+    """Устанавливает задаче переданные поля, дату изменения и пересчитывает статус"""
+    # Обновляем только переданные поля
+    update_data = task_data.model_dump(exclude_unset=True)
+    for field, value in update_data.items(): # получаем словарь из переданных данных
+        if field != 'task_id' and hasattr(task, field): # войдём если в БД есть такой столбец как ключ у field
+            setattr(task, field, value) # Устанавливаем новое значение для атрибута объекта
 
-    status_result = await db.execute(select(Status).where(cast(
-        Status.status_id == project.status_id, Boolean
-    )))
-    status_from_db = status_result.scalar_one_or_none()
-    project.status = status_from_db
-    return project
+    # Обновляем дату изменения
+    task.updated_date = datetime.now(timezone.utc)
+
+    if task.desired_completion_date and task.desired_completion_date < datetime.now(timezone.utc):
+        task.status_id = 3  # Просрочен
 
+    if task.actual_completion_date:
+        task.status_id = 2 # Завершен
+
+async def max_task_position(db: AsyncSession, user_id: int) -> int:
+    """:return: максимальный position_index среди активных задач пользователя"""
+    query = await db.execute(select(func.max(Task.position_index)).where(cast(
+        (Task.user_id == user_id) &
+        (Task.status_id != 4), Boolean
+    )))
+    return query.scalar_one_or_none() or 0    # будет 0 если задач нет (такого не должно произойти )
+
+async def renumber_task_positions(db: AsyncSession, user_id: int, project_ids: set[int]):
+    """
+    Нумерует активные задачи проектов подряд с нуля (сохраняя их порядок) одним запросом.
+    Используется после удаления сразу нескольких задач вместо сдвига позиций после каждой
+    """
+    if not project_ids:
+        return
+
+    ranked = select(
+        Task.task_id,
+        (func.row_number().over(partition_by=Task.project_id,
+                                order_by=(Task.position_index, Task.task_id)) - 1).label('new_position')
+    ).where(
+        (Task.user_id == user_id) &
+        (Task.project_id.in_(project_ids)) &
+        (Task.status_id != 4)
+    ).subquery()
+
+    await db.execute(
+        update(Task)
+        .where((Task.task_id == ranked.c.task_id) & (Task.position_index != ranked.c.new_position))
+        .values(position_index=ranked.c.new_position, updated_date=datetime.now(timezone.utc))
+        .execution_options(synchronize_session=False)
+    )
 
 @router.post('/update_task', response_model=TaskResponse)
 async def update_task(
     task_data: UpdateTask,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: AsyncSession = Depends(get_db)
 ):
-    query = await db.execute(select(Task).where(cast(
+    task = await task_for_change(db,
         (Task.status_id != 4) &    # если не удалён
         (Task.user_id == current_user.user_id) &
-        (Task.task_id == task_data.task_id), Boolean
-    )))
-    task = query.scalar_one_or_none()
+        (Task.task_id == task_data.task_id)
+    )
 
     if task is None:
         raise HTTPException(
@@ -286,92 +476,96 @@ async def update_task(
         )
 
     if task_data.position_index is not None:
-        query = await db.execute(select(func.max(Task.position_index)).where(cast(
-            (Task.user_id == current_user.user_id) &
-            (Task.status_id != 4), Boolean
-        ))) or 0    # будет 0 если задач нет (такого не должно произойти )
-        max_index = query.scalar_one_or_none()
+        max_index = await max_task_position(db, current_user.user_id)
 
         if task_data.position_index > max_index:
             task_data.position_index = max_index
 
-        old_index = task.position_index
-        new_index = task_data.position_index
+        await move_task_position(db, current_user.user_id, task, task_data.position_index)
 
-        if new_index != old_index:
-            # Сдвигаем задачи между старым и новым индексом
-            if new_index > old_index:
-                # Двигаем ВСЕ задачи между старым и новым индексом ВНИЗ на 1
-                await db.execute(
-                    update(Task)
-                    .where(
-                        (Task.user_id == current_user.user_id) &
-                        (Task.status_id != 4) &              # если не удалён
-                        (Task.position_index > old_index) &  # > old_index (исключаем сам элемент)
-                        (Task.position_index <= new_index)   # <= new_index (включаем новую позицию)
-                    ).values(position_index=Task.position_index - 1) # Сдвиг вниз
-                )
-            else:
-                # Двигаем ВСЕ задачи между новым и старым индексом ВВЕРХ на 1
-                await db.execute(
-                    update(Task)
-                    .where(
-                        (Task.user_id == current_user.user_id) &
-                        (Task.status_id != 4) &              # если не удалён
-                        (Task.position_index >= new_index) & # >= new_index (включаем новую позицию)
-                        (Task.position_index < old_index)    # < old_index (исключаем сам элемент)
-                    ).values(position_index=Task.position_index + 1) # Сдвиг вверх
-                )
-
-    # Обновляем только переданные поля
-    update_data = task_data.model_dump(exclude_unset=True)
-    for field, value in update_data.items(): # получаем словарь из переданных данных
-        if field != 'task_id' and hasattr(task, field): # войдём если в БД есть такой столбец как ключ у field
-            setattr(task, field, value) # Устанавливаем новое значение для атрибута объекта
+    apply_task_changes(task, task_data)
 
-    # Обновляем дату изменения
-    task.updated_date = datetime.now(timezone.utc)
+    await db.commit()
+    await db.refresh(task)
+    return response_with_status(TaskResponse, task)
 
-    if task.desired_completion_date and task.desired_completion_date < datetime.now(timezone.utc):
-        task.status_id = 3  # Просрочен
 
-    if task.actual_completion_date:
-        task.status_id = 2 # Завершен
+def project_busy(project_id: int) -> HTTPException:
+    """:return: ошибка 409 - над проектом выполняется фоновое задание"""
+    return HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail=f"Над проектом с ID {project_id} выполняется фоновое задание"
+    )
 
-    await db.commit()
-    await db.refresh(task)
+async def task_for_change(db: AsyncSession, condition) -> Optional[Task]:
+    """
+    :param condition: условие выбора задачи пользователя
+    :return: задача или None, если её нет
+    :raise HTTPException: 409 если над проектом задачи выполняется фоновое задание
+    """
+    result = await db.execute(select(Task, project_has_pending_job(Task.project_id)).where(cast(condition, Boolean)))
+    row = result.one_or_none()
+    if row is None:
+        return None
+
+    task, has_job = row
+    if has_job:
+        raise project_busy(task.project_id)
+    return task
 
-    status_result = await db.execute(select(Status).where(cast(
-        Status.status_id == task.status_id, Boolean
+async def project_for_change(db: AsyncSession, user_id: int, project_id: int) -> Project:
+    """
+    :return: проект пользователя
+    :raise HTTPException: 404 если проекта нет, 409 если над ним выполняется фоновое задание
+    """
+    result = await db.execute(select(Project, project_has_pending_job(project_id)).where(cast(
+        (Project.user_id == user_id) &
+        (Project.project_id == project_id), Boolean
     )))
-    status_from_db = status_result.scalar_one_or_none()
-    task.status = status_from_db
-    return task
 
+    row = result.one_or_none()
+    if row is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Проект с ID {project_id} не найден"
+        )
+
+    project, has_job = row
+    if has_job:
+        raise project_busy(project_id)
+    return project
 
-@router.post('/delete_project', response_model=DeleteProjectResponse)
+@router.post('/delete_project', response_model=Union[DeleteProjectResponse, JobResponse])
 async def delete_project(
+        response: Response,
         project_id: int = Query(..., description="ID проекта"),
         complete_remove: bool = Query(False, description="Флаг полного удаления с БД"),
-        current_user: User = Depends(get_current_user),
+        background: bool = Query(False, description="Удалить задачи в фоновом задании (только с complete_remove, ответ 202)"),
+        current_user: Principal = Depends(get_current_principal),
         db: AsyncSession = Depends(get_db)
 ):
-    result = await db.execute(select(Project).where(cast(
-        (Project.user_id == current_user.user_id) &
-        (Project.project_id == project_id), Boolean
-    )))
-
-    project = result.scalar_one_or_none()
-    if project is None:
+    if background and not complete_remove:
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Проект с ID {project_id} не найден"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="background можно указать только вместе с complete_remove"
         )
 
+    project = await project_for_change(db, current_user.user_id, project_id)
+
     old_position_index = project.position_index
     old_status_id = project.status_id
 
-    if complete_remove: # если необходимо полностью удалить (удаляем с БД)
+    job = None
+    if background:  # проект сразу пропадает из списков (как при архивации), задачи и сам проект удалит задание
+        await db.execute(update(Project).where(cast(
+            (Project.project_id == project_id), Boolean)
+        ).values(status_id=4, position_index= -1, updated_date=datetime.now(timezone.utc)) # статус = удалённый
+        )
+        job = await enqueue_job(db, current_user.user_id, 'delete_project', project_id)
+    elif complete_remove: # если необходимо полностью удалить (удаляем с БД)
+        # для /sync: удаление нельзя найти по updated_date
+        await record_deletions(db, current_user.user_id, 'task', select(Task.task_id).where(Task.project_id == project_id))
+        await record_deletions(db, current_user.user_id, 'project', select(literal(project_id)))
         # удаление всех задач у этого проекта
         task_delete = await db.execute(delete(Task).where(cast((Task.project_id == project_id), Boolean)))
         # удаление проекта
@@ -380,24 +574,29 @@ async def delete_project(
     else: # Архивация
         task_update = await db.execute(update(Task).where(cast(
             (Task.project_id == project_id), Boolean)
-        ).values(status_id=4, position_index= -1)  # статус = удалённый
+        ).values(status_id=4, position_index= -1, updated_date=datetime.now(timezone.utc))  # статус = удалённый
         )  # помечаем в БД, что все задач у этого проекта удалены
 
         await db.execute(update(Project).where(cast(
             (Project.project_id == project_id), Boolean)
-        ).values(status_id=4, position_index= -1) # статус = удалённый
+        ).values(status_id=4, position_index= -1, updated_date=datetime.now(timezone.utc)) # статус = удалённый
         )  # помечаем в БД, что проект удалён
         msg = "Проект и задачи перемещены в архив"
 
-    # Обновление позиций только для активных проектов
-    if old_status_id != 4: # если не удалён (иначе нет необходимости двигать индексы)
+    # Обновление позиций только для активных проектов (в режиме rank их пересчитает rank_rebalancer)
+    if old_status_id != 4 and not rank_mode(): # если не удалён (иначе нет необходимости двигать индексы)
         await db.execute(update(Project).where(cast(
             (Project.user_id == current_user.user_id) &
             (Project.position_index > old_position_index), Boolean # проверять на удалённый статус не надо, ибо проекты с ним имеют позицию -1
-        )).values(position_index= Project.position_index - 1)
+        )).values(position_index= Project.position_index - 1, updated_date=datetime.now(timezone.utc))
         )  # каждое значение в бд которое идёт после удалённого индекса, сдвигаем к нулю на одно значение (-1)
 
     await db.commit()
+    if job is not None:
+        job_workers.notify()
+        response.status_code = status.HTTP_202_ACCEPTED
+        return job_response(job)
+
     new_delete_project = DeleteProjectResponse(
         message=msg,
         project_id=project_id,
@@ -410,15 +609,10 @@ async def delete_project(
 async def delete_task(
         task_id: int = Query(..., description="ID задачи"),
         complete_remove: bool = Query(False, description="Флаг полного удаления с БД"),
-        current_user: User = Depends(get_current_user),
+        current_user: Principal = Depends(get_current_principal),
         db: AsyncSession = Depends(get_db)
 ):
-    result = await db.execute(select(Task).where(cast(
-        (Task.user_id == current_user.user_id) &
-        (Task.task_id == task_id), Boolean
-    )))
-
-    task = result.scalar_one_or_none()
+    task = await task_for_change(db, (Task.user_id == current_user.user_id) & (Task.task_id == task_id))
     if task is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -430,22 +624,23 @@ async def delete_task(
     old_project_id = task.project_id
 
     if complete_remove:  # если необходимо полностью удалить (удаляем с БД)
+        await record_deletions(db, current_user.user_id, 'task', select(literal(task_id)))  # для /sync
         await db.execute(delete(Task).where(cast((Task.task_id == task_id), Boolean)))
         msg = "Задача полностью удалена"
     else:  # Архивация
         await db.execute(update(Task).where(cast(
             (Task.task_id == task_id), Boolean)
-        ).values(status_id=4, position_index=-1)  # статус = удалённый
+        ).values(status_id=4, position_index=-1, updated_date=datetime.now(timezone.utc))  # статус = удалённый
         )  # помечаем в БД, что задача удалена
         msg = "Задача перемещена в архив"
 
-    # Обновление позиций только для активных задач
-    if old_status_id != 4:  # если не удалён (иначе нет необходимости двигать индексы)
+    # Обновление позиций только для активных задач (в режиме rank их пересчитает rank_rebalancer)
+    if old_status_id != 4 and not rank_mode():  # если не удалён (иначе нет необходимости двигать индексы)
         await db.execute(update(Task).where(cast(
             (Task.user_id == current_user.user_id) &
             (Task.project_id == old_project_id) &
             (Task.position_index > old_position_index), Boolean # проверять на удалённый статус не надо, ибо задачи с ним имеют позицию -1
-        )).values(position_index=Task.position_index - 1)
+        )).values(position_index=Task.position_index - 1, updated_date=datetime.now(timezone.utc))
         )  # каждое значение в бд которое идёт после удалённого индекса, сдвигаем к нулю на одно значение (-1)
 
     await db.commit()
@@ -459,24 +654,21 @@ async def delete_task(
     return new_delete_task
 
 
-@router.post('/recover_project', response_model=ProjectResponse)
+@router.post('/recover_project', response_model=Union[RecoverProjectResponse, JobResponse])
 async def recover_project(
+        response: Response,
         project_id: int = Query(..., description="ID проекта"),
-        current_user: User = Depends(get_current_user),
+        tasks_limit: int = Query(0, ge=0, le=PAGE_SIZE_MAX, description="Вернуть первые задачи проекта (0 - не возвращать)"),
+        background: bool = Query(False, description="Восстановить в фоновом задании (ответ 202 с заданием)"),
+        current_user: Principal = Depends(get_current_principal),
         db: AsyncSession = Depends(get_db)
 ):
-    result = await db.execute(select(Project).where(cast(
-        (Project.project_id == project_id) &
-        (Project.user_id == current_user.user_id),Boolean
-    )))
-
-    project = result.scalar_one_or_none()
-
-    if project is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Проект с ID {project_id} не найдена"
-        )
+    """
+    Восстанавливает проект и все его задачи. В ответе количество задач по статусам и, если tasks_limit > 0,
+    первая страница задач (следующие - /get_tasks/?project_id=... с курсором из заголовка X-Next-Cursor).
+    При background проект остаётся в архиве, пока задание (GET /jobs/) не восстановит все задачи
+    """
+    project = await project_for_change(db, current_user.user_id, project_id)
 
     if project.status_id != 4:  # если не является удалённым
         raise HTTPException(
@@ -484,65 +676,39 @@ async def recover_project(
             detail=f"Проект с ID {project_id} не является удалённым (текущий статус {project.status_id})"
         )
 
-    # Находим максимальный position_index среди активных проектов пользователя
-    max_pos_result = await db.execute(
-        select(func.max(Project.position_index)).where(cast(
-            (Project.user_id == current_user.user_id) &
-            (Project.status_id != 4), Boolean  # Только не удалённые проекты
-        ))
-    )
-    max_position = max_pos_result.scalar_one_or_none() or 0
-
-    # Обновляем проект
-    project.status_id = 1  # Возвращаем в статус "активный"
-    project.position_index = max_position + 1  # Ставим в конец списка
-    project.updated_date = datetime.now(timezone.utc)
-
-    result = await db.execute(select(Task).where(cast((Task.project_id == project_id), Boolean)))
-    # Нет необходимости проверять на удалённые задачи т.к. в удалённом проекте все задачи удалены
-    tasks = result.scalars().all()
-
-    task_counter = 0
-    task_ids = []
-    for task in tasks:
-        # Устанавливаем базовый статус
-        task.status_id = 1  # Временный статус "активный"
-        task.position_index = task_counter
-        task.updated_date = datetime.now(timezone.utc)
-
-        # Если есть actual_completion_date - задача завершена
-        if task.actual_completion_date:
-            task.status_id = 2
-
-        task_counter += 1
-        task_ids.append(task.task_id)
+    if background:
+        job = await enqueue_job(db, current_user.user_id, 'recover_project', project_id)
+        await db.commit()
+        job_workers.notify()
+        response.status_code = status.HTTP_202_ACCEPTED
+        return job_response(job)
 
+    now = datetime.now(timezone.utc)
+    await restore_project(db, project, now)
+    counts = build_stats(await recover_project_tasks(db, project_id, now))['totals']
     await db.commit()
 
-    # проверяем просроченность у задач
-    await check_overdue_tasks(current_user.user_id, task_ids, db)
-
-
-    if project.actual_completion_date: # если есть дата завершения
-        project.status_id = 2  # Проект завершен
-
-    # Проверяем просроченность проекта (автоматически обновит статус на 3 если просрочено)
-    new_project = await check_overdue_projects(current_user.user_id, [project_id], db)
+    tasks = None
+    if tasks_limit:
+        sort_column = Task.rank if rank_mode() else Task.position_index
+        result = await db.execute(keyset_page(
+            select(*response_columns(Task, TaskResponse)).where(Task.project_id == project_id),
+            sort_column, Task.task_id, None, tasks_limit
+        ))
+        rows, next_cursor = split_page(result.all(), tasks_limit, 'task_id', sort_column.key)
+        if next_cursor is not None:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
+        tasks = rows_with_status(rows)
 
-    return new_project[0]
+    return {**response_with_status(ProjectResponse, project).model_dump(), 'recovered_tasks': counts, 'tasks': tasks}
 
 @router.post('/recover_task', response_model=TaskResponse)
 async def recover_task(
         task_id: int = Query(..., description="ID задачи"),
-        current_user: User = Depends(get_current_user),
+        current_user: Principal = Depends(get_current_principal),
         db: AsyncSession = Depends(get_db)
 ):
-    result = await db.execute(select(Task).where(cast(
-        (Task.task_id == task_id) &
-        (Task.user_id == current_user.user_id), Boolean
-    )))
-
-    task = result.scalar_one_or_none()
+    task = await task_for_change(db, (Task.task_id == task_id) & (Task.user_id == current_user.user_id))
 
     if task is None:
         raise HTTPException(
@@ -566,15 +732,210 @@ async def recover_task(
     max_position = max_pos_result.scalar_one_or_none() or 0
 
     task.position_index = max_position + 1
+    task.rank = key_after(await last_rank(db, Task, Task.project_id == task.project_id)) if rank_mode() else None
 
-    if task.actual_completion_date: # если есть дата завершения
-        task.status_id = 2  # статус "завершённый"
-    else:
-        task.status_id = 1
+    now = datetime.now(timezone.utc)
+    task.status_id = restored_status(task, now)  # по датам, как при восстановлении проекта
+    task.updated_date = now
+    await db.commit()
 
-    new_task = await check_overdue_tasks(current_user.user_id, [task_id], db) # проверка на просроченность
+    return response_with_status(TaskResponse, task)
 
-    task.updated_date = datetime.now(timezone.utc)
-    await db.commit()
 
-    return new_task[0]
\ No newline at end of file
+def bulk_response(results: list[BulkTaskResult]) -> BulkTaskResponse:
+    succeeded = sum(1 for result in results if result.success)
+    return BulkTaskResponse(succeeded=succeeded, failed=len(results) - succeeded, results=results)
+
+@router.post('/create_tasks_bulk', response_model=BulkTaskResponse)
+async def create_tasks_bulk(
+    data: TaskBulkCreate,
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Создаёт несколько задач одной транзакцией.
+    Задачи в несуществующих (или удалённых) проектах не создаются, остальные создаются
+    """
+    project_ids = {task_data.project_id for task_data in data.tasks}
+
+    # все проекты проверяются одним запросом
+    result = await db.execute(select(Project.project_id).where(
+        (Project.user_id == current_user.user_id) &
+        (Project.project_id.in_(project_ids)) &
+        (Project.status_id != 4)
+    ))
+    existing_projects = set(result.scalars().all())
+
+    # последние позиции во всех проектах одним запросом
+    result = await db.execute(
+        select(Task.project_id, func.max(Task.position_index))
+        .where(
+            (Task.user_id == current_user.user_id) &
+            (Task.status_id != 4) &
+            (Task.project_id.in_(existing_projects))
+        ).group_by(Task.project_id)
+    )
+    last_position = {project_id: -1 for project_id in existing_projects}  # -1 если в проекте ещё нет задач
+    last_position.update({project_id: max_position for project_id, max_position in result.all()})
+
+    ranks = {}  # последние ключи сортировки в проектах (режим ORDERING_MODE=rank)
+    if rank_mode():
+        result = await db.execute(
+            select(Task.project_id, func.max(Task.rank))
+            .where((Task.status_id != 4) & (Task.project_id.in_(existing_projects)))
+            .group_by(Task.project_id)
+        )
+        ranks = dict(result.all())
+
+    now = datetime.now(timezone.utc)
+    results: list[BulkTaskResult | None] = [None] * len(data.tasks)
+    rows = []
+    row_indexes = []  # номер элемента запроса для каждой строки rows
+    for index, task_data in enumerate(data.tasks):
+        if task_data.project_id not in existing_projects:
+            results[index] = BulkTaskResult(index=index, success=False,
+                                            error=f"Проект с ID {task_data.project_id} не найден")
+            continue
+
+        last_position[task_data.project_id] += 1
+        if rank_mode():
+            ranks[task_data.project_id] = key_after(ranks.get(task_data.project_id))
+        rows.append({
+            'user_id': current_user.user_id,
+            'project_id': task_data.project_id,
+            'status_id': 1,
+            'position_index': last_position[task_data.project_id],
+            'rank': ranks.get(task_data.project_id),
+            'priority': task_data.priority or 1,  # null в запросе - приоритет по умолчанию
+            'title': task_data.title,
+            'description': task_data.description,
+            'created_date': now,
+            'desired_completion_date': ensure_utc(task_data.desired_completion_date) if task_data.desired_completion_date else None,
+            'updated_date': now,
+        })
+        row_indexes.append(index)
+
+    if rows:
+        # многострочный INSERT ... RETURNING, строки возвращаются в порядке rows
+        inserted = await db.execute(
+            insert(Task).returning(*response_columns(Task, TaskResponse), sort_by_parameter_order=True),
+            rows
+        )
+        await db.commit()
+
+        for index, row in zip(row_indexes, inserted.all()):
+            task = TaskResponse(**row._mapping, status=status_response(row.status_id))
+            results[index] = BulkTaskResult(index=index, success=True, task_id=task.task_id, task=task)
+
+    return bulk_response(results)
+
+@router.post('/update_tasks_bulk', response_model=BulkTaskResponse)
+async def update_tasks_bulk(
+    data: TaskBulkUpdate,
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Изменяет несколько задач одной транзакцией (правила те же что и у /update_task).
+    Не найденные задачи пропускаются, остальные изменяются
+    """
+    result = await db.execute(select(Task, project_has_pending_job(Task.project_id)).where(
+        (Task.status_id != 4) &    # если не удалён
+        (Task.user_id == current_user.user_id) &
+        (Task.task_id.in_({task_data.task_id for task_data in data.tasks}))
+    ))
+    tasks, busy = {}, set()  # busy - задачи проектов, над которыми выполняется фоновое задание
+    for task, has_job in result.all():
+        tasks[task.task_id] = task
+        if has_job:
+            busy.add(task.task_id)
+
+    max_index = None
+    if any(task_data.position_index is not None for task_data in data.tasks):
+        max_index = await max_task_position(db, current_user.user_id)
+
+    updated = []
+    results: list[BulkTaskResult | None] = [None] * len(data.tasks)
+    for index, task_data in enumerate(data.tasks):
+        task = tasks.get(task_data.task_id)
+        if task is None:
+            results[index] = BulkTaskResult(index=index, success=False, task_id=task_data.task_id,
+                                            error=f"Задача с ID {task_data.task_id} не найдена")
+            continue
+        if task.task_id in busy:
+            results[index] = BulkTaskResult(index=index, success=False, task_id=task_data.task_id,
+                                            error=f"Над проектом с ID {task.project_id} выполняется фоновое задание")
+            continue
+
+        if task_data.position_index is not None:
+            task_data.position_index = min(task_data.position_index, max_index)
+            await move_task_position(db, current_user.user_id, task, task_data.position_index)
+
+        apply_task_changes(task, task_data)
+        updated.append((index, task))
+
+    await db.commit()  # все изменения одним flush и одной транзакцией
+
+    for index, task in updated:
+        results[index] = BulkTaskResult(index=index, success=True, task_id=task.task_id,
+                                        task=response_with_status(TaskResponse, task))
+
+    return bulk_response(results)
+
+@router.post('/delete_tasks_bulk', response_model=BulkTaskResponse)
+async def delete_tasks_bulk(
+    data: TaskBulkDelete,
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Архивирует (или полностью удаляет при complete_remove) несколько задач одной транзакцией.
+    Позиции оставшихся задач пересчитываются одним запросом
+    """
+    result = await db.execute(select(Task.task_id, Task.project_id, Task.status_id,
+                                     project_has_pending_job(Task.project_id).label('has_job')).where(
+        (Task.user_id == current_user.user_id) &
+        (Task.task_id.in_(set(data.task_ids)))
+    ))
+    found, busy = {}, {}  # busy - задачи проектов, над которыми выполняется фоновое задание (не изменяются)
+    for row in result.all():
+        (busy if row.has_job else found)[row.task_id] = row
+
+    if found:
+        if data.complete_remove:  # если необходимо полностью удалить (удаляем с БД)
+            await record_deletions(db, current_user.user_id, 'task',
+                                   select(Task.task_id).where(Task.task_id.in_(found)))  # для /sync
+            await db.execute(delete(Task).where(Task.task_id.in_(found)))
+        else:  # Архивация
+            await db.execute(
+                update(Task).where(Task.task_id.in_(found))
+                .values(status_id=4, position_index=-1, updated_date=datetime.now(timezone.utc))  # статус = удалённый
+            )
+
+        # сдвигать позиции нужно только в проектах где были активные задачи (в режиме rank их пересчитает rank_rebalancer)
+        if not rank_mode():
+            await renumber_task_positions(db, current_user.user_id,
+                                          {row.project_id for row in found.values() if row.status_id != 4})
+        await db.commit()
+
+    results = [
+        BulkTaskResult(index=index, success=True, task_id=task_id) if task_id in found else
+        BulkTaskResult(index=index, success=False, task_id=task_id,
+                       error=f"Над проектом с ID {busy[task_id].project_id} выполняется фоновое задание") if task_id in busy else
+        BulkTaskResult(index=index, success=False, task_id=task_id, error=f"Задача с ID {task_id} не найдена")
+        for index, task_id in enumerate(data.task_ids)
+    ]
+    return bulk_response(results)
+
+@router.post('/import', response_model=ImportResponse)
+async def import_data(
+    request: Request,
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Загрузка файла из /export (NDJSON, можно сжатый gzip) в теле запроса. Проекты и задачи создаются заново
+    после существующих, файл читается по мере получения и записывается пачками по IMPORT_BATCH_SIZE строк
+    (каждая пачка - отдельная транзакция). Задачи, проект которых не встречается в файле раньше них, пропускаются
+    """
+    return await UserImport(db, current_user.user_id).run(read_lines(request.stream()))
@@ -1,10 +1,42 @@
 import uvicorn
 import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from routers import get_router, post_router
-from app.data_base.data_base import create_database
+from app.data_base.data_base import create_database, init_engine, dispose_engine
+from app.background import (overdue_sweeper, rank_rebalancer, rebalance_ranks, tombstone_cleaner,
+                            refresh_token_cleaner, job_cleaner, BackgroundLeader)
+from app.jobs import job_workers
+from app.ranking import rank_mode
+from app.search import load_search_features
+from app.middleware import QueryMetricsMiddleware, RateLimitMiddleware
+import app.dependencies as dependencies
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    init_engine()  # один пул соединений на весь процесс
+    await dependencies.load_statuses()  # таблица statuses не меняется, далее статусы берутся из памяти
+    await load_search_features()  # нечёткий поиск только если подключено pg_trgm
+    # периодические задачи выполняет один процесс из всех (тот, что взял advisory lock)
+    jobs = [overdue_sweeper, tombstone_cleaner, refresh_token_cleaner, job_cleaner]
+    if rank_mode():
+        jobs.append(rank_rebalancer)
+    # в режиме rank сначала заполняются ключи сортировки по position_index (переход с режима index)
+    background_leader = BackgroundLeader(jobs, on_start=rebalance_ranks if rank_mode() else None)
+    background_leader.start()
+    # воркеры заданий есть в каждом процессе: задания распределяются между ними через SKIP LOCKED.
+    # Они продолжают и задания, оставшиеся после остановки или падения процесса
+    job_workers.start()
+    yield
+    await job_workers.stop()  # незавершённые задания возвращаются в очередь
+    await background_leader.stop()
+    dependencies.password_hasher.shutdown()
+    await dispose_engine()
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(QueryMetricsMiddleware)  # Server-Timing и лог количества запросов к БД
+app.add_middleware(RateLimitMiddleware)  # внешний слой: лимит запросов клиента и одновременных запросов
 
 app.include_router(get_router)
 app.include_router(post_router)
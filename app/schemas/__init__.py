@@ -1,9 +1,15 @@
-from .request import UserCreate, TokenData, ProjectCreate, TaskCreate, UpdateProject, UpdateTask, RefreshTokenRequest
-from .response import Token, Status, UserResponse, ProjectResponse, TaskResponse, DeleteProjectResponse, DeleteTaskResponse
+from .request import (UserCreate, TokenData, ProjectCreate, TaskCreate, UpdateProject, UpdateTask, RefreshTokenRequest,
+                      TaskBulkCreate, TaskBulkUpdate, TaskBulkDelete, ProjectExport, TaskExport)
+from .response import (Token, Status, UserResponse, ProjectResponse, TaskResponse, DeleteProjectResponse, DeleteTaskResponse,
+                       PoolMetricsResponse, CacheMetricsResponse, BulkTaskResult, BulkTaskResponse, ImportResponse,
+                       SyncResponse, StatusCounts, TaskCounts, ProjectStats, StatsResponse, RecoverProjectResponse, JobResponse)
 
 __all__ = [
     'Token', 'Status', 'RefreshTokenRequest',
     'UserCreate', 'TokenData', 'ProjectCreate', 'TaskCreate',
     'UpdateProject', 'UpdateTask', 'UserResponse', 'ProjectResponse',
-    'TaskResponse', 'DeleteProjectResponse', 'DeleteTaskResponse'
+    'TaskResponse', 'DeleteProjectResponse', 'DeleteTaskResponse', 'PoolMetricsResponse',
+    'CacheMetricsResponse', 'TaskBulkCreate', 'TaskBulkUpdate', 'TaskBulkDelete', 'BulkTaskResult', 'BulkTaskResponse',
+    'ProjectExport', 'TaskExport', 'ImportResponse', 'SyncResponse',
+    'StatusCounts', 'TaskCounts', 'ProjectStats', 'StatsResponse', 'RecoverProjectResponse', 'JobResponse'
 ]
\ No newline at end of file
@@ -1,6 +1,8 @@
 from pydantic import BaseModel, EmailStr, Field
 from datetime import datetime
-from typing import Optional
+from typing import Literal, Optional, List
+
+BULK_MAX_ITEMS = 1000  # максимальное количество элементов в одном пакетном запросе
 
 class UserCreate(BaseModel):
     login: str
@@ -44,3 +46,40 @@ class UpdateTask(BaseModel):
     desired_completion_date: Optional[datetime] = None
     actual_completion_date: Optional[datetime] = None
 
+class TaskBulkCreate(BaseModel):
+    tasks: List[TaskCreate] = Field(..., min_length=1, max_length=BULK_MAX_ITEMS)
+
+class TaskBulkUpdate(BaseModel):
+    tasks: List[UpdateTask] = Field(..., min_length=1, max_length=BULK_MAX_ITEMS)
+
+class TaskBulkDelete(BaseModel):
+    task_ids: List[int] = Field(..., min_length=1, max_length=BULK_MAX_ITEMS)
+    complete_remove: bool = False # флаг полного удаления с БД
+
+# Строки файла экспорта (GET /export) и импорта (POST /import) в формате NDJSON: сначала все проекты, затем все задачи
+
+class ProjectExport(BaseModel):
+    type: Literal['project'] = 'project'
+    project_id: int  # при импорте создаётся новый проект, ID из файла связывает с ним задачи
+    position_index: int
+    title: str = Field(..., max_length=100)
+    description: Optional[str] = Field(None, max_length=500)
+    status_id: int = Field(1, ge=1, le=4)
+    created_date: datetime
+    desired_completion_date: Optional[datetime] = None
+    actual_completion_date: Optional[datetime] = None
+    updated_date: Optional[datetime] = None
+
+class TaskExport(BaseModel):
+    type: Literal['task'] = 'task'
+    task_id: int
+    project_id: int  # ID проекта из этого же файла
+    position_index: int
+    priority: int = Field(1, ge=1, le=3)
+    title: str = Field(..., max_length=200)
+    description: Optional[str] = Field(None, max_length=1000)
+    status_id: int = Field(1, ge=1, le=4)
+    created_date: datetime
+    desired_completion_date: Optional[datetime] = None
+    actual_completion_date: Optional[datetime] = None
+    updated_date: Optional[datetime] = None
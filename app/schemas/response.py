@@ -1,10 +1,11 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from datetime import datetime
 from typing import Annotated, Optional
 
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
 
 class UserResponse(BaseModel):
     user_id: int
@@ -14,6 +15,8 @@ class UserResponse(BaseModel):
     last_login: datetime
 
 class Status(BaseModel):
+    model_config = ConfigDict(frozen=True)  # один объект на статус используется во всех ответах
+
     status_id: int
     name: str
 
@@ -23,6 +26,7 @@ class TaskResponse(BaseModel):
     status: Status
     project_id: int
     position_index: int
+    rank: Optional[str] = None  # ключ сортировки (ORDERING_MODE=rank)
     priority: int
     title: str
     description: str
@@ -35,6 +39,7 @@ class ProjectResponse(BaseModel):
     project_id: int
     user_id: int
     position_index: int
+    rank: Optional[str] = None  # ключ сортировки (ORDERING_MODE=rank)
     title: str
     description: str
     status: Status
@@ -56,7 +61,79 @@ class DeleteTaskResponse(BaseModel):
     deleted_at: datetime
     affected_tasks_count: int
 
+class BulkTaskResult(BaseModel):
+    index: Annotated[int, Field(..., title="Номер элемента в запросе")]
+    success: bool
+    task_id: Optional[int] = None
+    task: Optional[TaskResponse] = None # нет при удалении и при ошибке
+    error: Optional[str] = None
+
+class BulkTaskResponse(BaseModel):
+    succeeded: int
+    failed: int
+    results: list[BulkTaskResult]
+
+class SyncResponse(BaseModel):
+    projects: list[ProjectResponse]  # созданные, изменённые и архивированные после курсора
+    tasks: list[TaskResponse]
+    deleted_project_ids: Annotated[list[int], Field(..., title="Полностью удалённые проекты")]
+    deleted_task_ids: Annotated[list[int], Field(..., title="Полностью удалённые задачи")]
+    cursor: Annotated[str, Field(..., title="Курсор для следующей синхронизации")]
+    has_more: Annotated[bool, Field(..., title="Есть ещё изменения (сразу повторить запрос с cursor)")]
 
+class ImportResponse(BaseModel):
+    projects: Annotated[int, Field(..., title="Создано проектов")]
+    tasks: Annotated[int, Field(..., title="Создано задач")]
+    skipped_tasks: Annotated[int, Field(..., title="Задачи без проекта в файле (не созданы)")]
 
+class PoolMetricsResponse(BaseModel):
+    checkouts: int
+    timeouts: int
+    wait_time_total: Annotated[float, Field(..., title="Суммарное время ожидания соединения (сек)")]
+    wait_time_avg: Annotated[float, Field(..., title="Среднее время ожидания соединения (сек)")]
+    wait_time_max: Annotated[float, Field(..., title="Максимальное время ожидания соединения (сек)")]
+    overflow_peak: Annotated[int, Field(..., title="Максимум соединений сверх pool_size")]
+    pool_size: Optional[int] = None
+    checked_out: Optional[int] = None
+    checked_in: Optional[int] = None
+    overflow: Optional[int] = None
 
+class CacheMetricsResponse(BaseModel):
+    hits: int
+    misses: int
+    hit_ratio: Annotated[float, Field(..., title="Доля попаданий в кэш")]
 
+class StatusCounts(BaseModel):
+    in_progress: int = 0
+    completed: int = 0
+    overdue: int = 0   # с учётом просроченности, которую фоновая задача ещё не записала в БД
+    archived: int = 0
+
+class TaskCounts(BaseModel):
+    total: Annotated[int, Field(0, title="Все задачи (включая архивированные)")]
+    by_status: StatusCounts = StatusCounts()
+    by_priority: Annotated[dict[int, int], Field(default_factory=dict, title="Приоритет -> количество не архивированных задач")]
+
+class ProjectStats(TaskCounts):
+    project_id: int
+
+class StatsResponse(BaseModel):
+    projects: list[ProjectStats]  # только проекты, в которых есть задачи
+    totals: TaskCounts
+
+class RecoverProjectResponse(ProjectResponse):
+    recovered_tasks: TaskCounts  # статусы пересчитаны по датам завершения
+    tasks: Optional[list[TaskResponse]] = None  # первая страница задач (если запрошена tasks_limit)
+
+class JobResponse(BaseModel):
+    job_id: int
+    kind: str   # delete_project или recover_project
+    project_id: int
+    state: Annotated[str, Field(..., title="queued, running, done или failed")]
+    total: Annotated[int, Field(..., title="Задач на момент постановки в очередь")]
+    processed: Annotated[int, Field(..., title="Обработано задач")]
+    result: Optional[dict] = None  # итог выполненного задания (deleted_tasks или recovered_tasks)
+    error: Optional[str] = None
+    created_date: datetime
+    started_date: Optional[datetime] = None
+    finished_date: Optional[datetime] = None
@@ -0,0 +1,88 @@
+import os
+import re
+from typing import Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import select, func, literal, text, REAL
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.data_base.data_base import new_session
+from app.dependencies import response_columns
+from app.jobs import project_pending_deletion
+from app.models.models import Project, Task, SEARCH_TEXT_CONFIG
+from app.pagination import keyset_page, split_page
+from app.schemas.response import ProjectResponse, TaskResponse
+
+load_dotenv()  # Загружает переменные из .env
+# нечёткое совпадение по title (опечатки, часть слова), работает только если подключено расширение pg_trgm
+SEARCH_FUZZY = os.getenv('SEARCH_FUZZY', 'true').lower() == 'true'
+SEARCH_MAX_TERMS = int(os.getenv('SEARCH_MAX_TERMS', 10))  # слова запроса после этого количества не учитываются
+
+# вид поиска -> (таблица, схема ответа, первичный ключ)
+SEARCH_KINDS = {
+    'projects': (Project, ProjectResponse, Project.project_id),
+    'tasks': (Task, TaskResponse, Task.task_id),
+}
+
+# True если pg_trgm подключено и SEARCH_FUZZY (определяется при запуске в load_search_features)
+fuzzy_enabled = False
+
+
+async def load_search_features():
+    """Проверяет, подключено ли в БД расширение pg_trgm (create_database подключает его, если оно доступно)"""
+    global fuzzy_enabled
+    async with new_session() as db:
+        installed = (await db.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"))).scalar()
+    fuzzy_enabled = SEARCH_FUZZY and installed is not None
+
+def search_terms(q: str) -> list[str]:
+    """:return: слова запроса (только буквы и цифры, поэтому их можно безопасно подставить в to_tsquery)"""
+    return re.findall(r'\w+', q.lower())[:SEARCH_MAX_TERMS]
+
+def prefix_tsquery(terms: list[str]):
+    """:return: tsquery, в котором все слова обязательны и каждое может быть началом слова ("прое" найдёт "проект")"""
+    return func.to_tsquery(SEARCH_TEXT_CONFIG, ' & '.join(f'{term}:*' for term in terms))
+
+def search_query(kind: str, user_id: int, q: str, project_id: Optional[int], limit: int, cursor: Optional[str]):
+    """
+    Запрос страницы проектов или задач пользователя (кроме удалённых), подходящих под q, по убыванию релевантности.
+    Кандидаты находятся по GIN индексу search_vector (и триграммному индексу title при fuzzy_enabled),
+    релевантность вычисляется только для них: ts_rank_cd (совпадение в title весит больше, чем в description)
+    плюс word_similarity запроса и title при нечётком поиске
+    :param kind: projects или tasks
+    :param project_id: искать только задачи этого проекта
+    :return: select или None, если в q нет ни одного слова
+    """
+    model, schema, primary_key = SEARCH_KINDS[kind]
+    terms = search_terms(q)
+    if not terms:
+        return None
+
+    tsquery = prefix_tsquery(terms)
+    match = model.search_vector.bool_op('@@')(tsquery)
+    score = func.ts_rank_cd(model.search_vector, tsquery, type_=REAL)
+    if fuzzy_enabled:
+        phrase = ' '.join(terms)
+        match |= literal(phrase).bool_op('<%')(model.title)
+        score = score + func.word_similarity(phrase, model.title, type_=REAL)
+
+    # keyset_page сортирует по возрастанию, поэтому ключ - релевантность со знаком минус
+    relevance_key = (-score).label('relevance_key')
+    query = (
+        select(*response_columns(model, schema), relevance_key)
+        .where((model.user_id == user_id) & (model.status_id != 4) & match)
+    )
+    if kind == 'tasks':
+        query = query.where(~project_pending_deletion(Task.project_id))  # проект удаляется фоновым заданием
+    if project_id is not None:
+        query = query.where(Task.project_id == project_id)
+    return keyset_page(query, relevance_key, primary_key, cursor, limit)
+
+async def search_page(db: AsyncSession, kind: str, user_id: int, q: str, project_id: Optional[int],
+                      limit: int, cursor: Optional[str]) -> tuple[list, Optional[str]]:
+    """:return: (строки страницы search_query, курсор следующей страницы или None)"""
+    query = search_query(kind, user_id, q, project_id, limit, cursor)
+    if query is None:
+        return [], None
+    result = await db.execute(query)
+    return split_page(result.all(), limit, SEARCH_KINDS[kind][2].key, 'relevance_key')
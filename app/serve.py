@@ -0,0 +1,87 @@
+"""
+Запуск приложения в production: несколько процессов uvicorn без reload.
+Создание БД и таблиц (и заполнение ключей сортировки в режиме ORDERING_MODE=rank) выполняется один раз
+в главном процессе до запуска рабочих процессов.
+
+Запуск из корня проекта: python -m app.serve [--workers 4] [--port 8000]
+"""
+import argparse
+import asyncio
+import importlib.util
+import logging
+import os
+import sys
+
+import uvicorn
+from dotenv import load_dotenv
+
+# run.py импортирует роутеры относительно папки app (как и в pytest.ini)
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, 'app')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from app.data_base.data_base import create_database, dispose_engine, DB_POOL_SIZE, DB_MAX_OVERFLOW
+from app.background import rebalance_ranks
+from app.ranking import rank_mode
+
+load_dotenv()  # Загружает переменные из .env
+SERVER_HOST = os.getenv('SERVER_HOST', '0.0.0.0')
+SERVER_PORT = int(os.getenv('SERVER_PORT', 8000))
+SERVER_WORKERS = int(os.getenv('SERVER_WORKERS', os.cpu_count() or 1))      # количество процессов
+SERVER_KEEP_ALIVE = int(os.getenv('SERVER_KEEP_ALIVE', 5))                  # сколько секунд держать простаивающее соединение
+SERVER_BACKLOG = int(os.getenv('SERVER_BACKLOG', 2048))                     # очередь ещё не принятых соединений
+SERVER_GRACEFUL_TIMEOUT = int(os.getenv('SERVER_GRACEFUL_TIMEOUT', 30))     # сколько секунд дожидаться запросов после SIGTERM
+
+
+def event_loop() -> str:
+    """:return: uvloop если он установлен, иначе стандартный asyncio"""
+    return 'uvloop' if importlib.util.find_spec('uvloop') else 'asyncio'
+
+def http_protocol() -> str:
+    """:return: httptools если он установлен, иначе h11"""
+    return 'httptools' if importlib.util.find_spec('httptools') else 'h11'
+
+async def bootstrap():
+    """Подготовка БД, которую не нужно повторять в каждом процессе"""
+    await create_database()
+    if rank_mode():
+        await rebalance_ranks()  # рабочим процессам при старте останется только проверить, что ключи заполнены
+    await dispose_engine()  # соединения привязаны к циклу событий главного процесса
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default=SERVER_HOST)
+    parser.add_argument('--port', type=int, default=SERVER_PORT)
+    parser.add_argument('--workers', type=int, default=SERVER_WORKERS, help='количество процессов')
+    parser.add_argument('--keep-alive', type=int, default=SERVER_KEEP_ALIVE, help='секунд держать простаивающее соединение')
+    parser.add_argument('--backlog', type=int, default=SERVER_BACKLOG, help='очередь ещё не принятых соединений')
+    parser.add_argument('--graceful-timeout', type=int, default=SERVER_GRACEFUL_TIMEOUT,
+                        help='секунд дожидаться выполняющихся запросов после SIGTERM')
+    parser.add_argument('--skip-bootstrap', action='store_true', help='не создавать БД и таблицы')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if not args.skip_bootstrap:
+        asyncio.run(bootstrap())
+
+    logging.info(f"Starting {args.workers} workers ({event_loop()}, {http_protocol()}), "
+                 f"up to {args.workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW)} DB connections in total")
+
+    # при SIGTERM uvicorn перестаёт принимать соединения и ждёт выполняющиеся запросы до graceful_timeout
+    uvicorn.run(
+        "app.run:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        loop=event_loop(),
+        http=http_protocol(),
+        backlog=args.backlog,
+        timeout_keep_alive=args.keep_alive,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        proxy_headers=True,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from sqlalchemy import select, func, literal, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import app.data_base.counters as counters
+from app.dependencies import effective_status, overdue_condition
+from app.models.models import Task, TaskCounter
+
+# статус -> поле StatusCounts
+STATUS_FIELDS = {1: 'in_progress', 2: 'completed', 3: 'overdue', 4: 'archived'}
+
+
+def grouped_counts_query(user_id: int, now: datetime):
+    """Количество задач пользователя по (проект, статус с учётом просроченности, приоритет) одним GROUP BY по tasks"""
+    status = effective_status(Task, now).label('status_id')
+    priority = func.coalesce(Task.priority, 1).label('priority')
+    return (
+        select(Task.project_id, status, priority, func.count().label('task_count'))
+        .where(Task.user_id == user_id)
+        .group_by(Task.project_id, status, priority)
+    )
+
+def counters_query(user_id: int, now: datetime):
+    """
+    То же по task_counters (O(проектов)): к сохранённым статусам добавляется поправка на задачи, просроченные
+    после последнего запуска фоновой задачи (их мало, находятся по индексу ix_tasks_overdue_candidates)
+    """
+    priority = func.coalesce(Task.priority, 1)
+    pending = (
+        select(Task.project_id, Task.status_id, priority.label('priority'), func.count().label('task_count'))
+        .where((Task.user_id == user_id) & overdue_condition(Task, now))
+        .group_by(Task.project_id, Task.status_id, priority)
+        .cte('pending_overdue')
+    )
+    return union_all(
+        select(TaskCounter.project_id, TaskCounter.status_id, TaskCounter.priority, TaskCounter.task_count)
+        .where(TaskCounter.user_id == user_id),
+        # из сохранённого статуса вычитаются, к просроченным добавляются
+        select(pending.c.project_id, pending.c.status_id, pending.c.priority, -pending.c.task_count),
+        select(pending.c.project_id, literal(3), pending.c.priority, pending.c.task_count),
+    )
+
+def build_stats(rows) -> dict:
+    """
+    :param rows: строки (project_id, status_id, priority, task_count), ключи могут повторяться (поправки)
+    :return: dict с полями StatsResponse
+    """
+    counts = defaultdict(int)
+    for project_id, status_id, priority, task_count in rows:
+        counts[project_id, status_id, priority] += task_count
+
+    projects = {}
+    totals = {'total': 0, 'by_status': defaultdict(int), 'by_priority': defaultdict(int)}
+    for (project_id, status_id, priority), task_count in sorted(counts.items()):
+        if task_count <= 0:
+            continue
+        project = projects.setdefault(project_id, {'project_id': project_id, 'total': 0,
+                                                   'by_status': defaultdict(int), 'by_priority': defaultdict(int)})
+        for target in (project, totals):
+            target['total'] += task_count
+            target['by_status'][STATUS_FIELDS[status_id]] += task_count
+            if status_id != 4:
+                target['by_priority'][priority] += task_count
+
+    return {'projects': list(projects.values()), 'totals': totals}
+
+async def collect_stats(db: AsyncSession, user_id: int) -> dict:
+    """
+    Статистика задач пользователя одним запросом: по task_counters при STATS_COUNTERS, иначе GROUP BY по tasks
+    :return: dict с полями StatsResponse
+    """
+    now = datetime.now(timezone.utc)
+    query = counters_query(user_id, now) if counters.STATS_COUNTERS else grouped_counts_query(user_id, now)
+    result = await db.execute(query)
+    return build_stats(result.all())
@@ -0,0 +1,161 @@
+import base64
+import binascii
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from dotenv import load_dotenv
+from fastapi import HTTPException, status
+from sqlalchemy import select, insert, literal, tuple_, DateTime
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.dependencies import response_columns, rows_with_status
+from app.models.models import Project, Task, DeletedItem
+from app.schemas.response import ProjectResponse, TaskResponse
+
+load_dotenv()  # Загружает переменные из .env
+# изменения моложе SYNC_LAG_SECONDS не отдаются: транзакция с более ранним updated_date может зафиксироваться позже
+SYNC_LAG_SECONDS = float(os.getenv('SYNC_LAG_SECONDS', 2))
+SYNC_TOMBSTONE_TTL_DAYS = float(os.getenv('SYNC_TOMBSTONE_TTL_DAYS', 30))  # сколько хранить записи об удалении
+
+# виды изменений: (таблица, столбец времени изменения, первичный ключ)
+SYNC_KINDS = {
+    'projects': (Project, Project.updated_date, Project.project_id),
+    'tasks': (Task, Task.updated_date, Task.task_id),
+    'deleted': (DeletedItem, DeletedItem.deleted_date, DeletedItem.deleted_item_id),
+}
+
+# позиция курсора по одному виду изменений: (время изменения, id) последней отданной строки
+Position = tuple[datetime, int]
+
+
+def encode_sync_cursor(positions: dict[str, Position]) -> str:
+    """:return: непрозрачная для клиента строка с позициями по всем видам изменений"""
+    raw = json.dumps({kind: [moment.isoformat(), item_id] for kind, (moment, item_id) in positions.items()},
+                     separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_sync_cursor(cursor: str) -> dict[str, Position]:
+    """:raise HTTPException: 400 если курсор повреждён"""
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        positions = {}
+        for kind in SYNC_KINDS:
+            moment, item_id = raw[kind]
+            moment = datetime.fromisoformat(moment)
+            if type(item_id) is not int or moment.tzinfo is None:
+                raise ValueError
+            positions[kind] = (moment, item_id)
+        return positions
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Некорректный cursor"
+        )
+
+def start_positions(cursor: Optional[str], since: Optional[datetime], upper: datetime) -> dict[str, Position]:
+    """
+    :param cursor: курсор из предыдущего ответа
+    :param since: время, с которого нужны изменения (если курсора нет)
+    :param upper: до какого времени отдаются изменения в этом запросе
+    :raise HTTPException: 410 если записи об удалениях после этой позиции уже очищены (нужна полная синхронизация)
+    """
+    if cursor is not None:
+        positions = decode_sync_cursor(cursor)
+    elif since is not None:
+        since = since.astimezone(timezone.utc)
+        positions = {kind: (since, 0) for kind in SYNC_KINDS}
+    else:  # первая синхронизация: все строки, удалений у клиента ещё нет
+        beginning = datetime.min.replace(tzinfo=timezone.utc)
+        return {'projects': (beginning, 0), 'tasks': (beginning, 0), 'deleted': (upper, 0)}
+
+    if positions['deleted'][0] < upper - timedelta(days=SYNC_TOMBSTONE_TTL_DAYS):
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail="Курсор устарел, необходима полная синхронизация (запрос без cursor и since)"
+        )
+    return positions
+
+async def changes_after(db: AsyncSession, kind: str, user_id: int, position: Position, upper: datetime,
+                        limit: int) -> tuple[list, Position, bool]:
+    """
+    Строки одного вида, изменённые после позиции (по индексу (user_id, время изменения, id),
+    поэтому стоимость зависит от количества изменений, а не от количества строк)
+    :return: (строки, новая позиция, есть ли ещё строки)
+    """
+    model, changed_column, primary_key = SYNC_KINDS[kind]
+    if kind == 'deleted':
+        columns = (DeletedItem.item_type, DeletedItem.item_id, changed_column, primary_key)
+    else:
+        columns = response_columns(model, ProjectResponse if model is Project else TaskResponse)
+
+    result = await db.execute(
+        select(*columns)
+        .where(
+            (model.user_id == user_id) &
+            (tuple_(changed_column, primary_key) > tuple_(*position)) &
+            (changed_column <= upper)
+        )
+        .order_by(changed_column, primary_key)
+        .limit(limit + 1)
+    )
+    rows = result.all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    if rows:
+        last = rows[-1]._mapping
+        position = (last[changed_column.key], last[primary_key.key])
+    if not has_more:
+        position = max(position, (upper, 0))  # дальше изменений до upper нет
+    return rows, position, has_more
+
+async def collect_changes(db: AsyncSession, user_id: int, cursor: Optional[str], since: Optional[datetime],
+                          limit: int) -> dict:
+    """
+    Изменённые (созданные, обновлённые, архивированные) и полностью удалённые проекты и задачи пользователя
+    после курсора. Каждого вида возвращается не больше limit, если есть ещё - has_more
+    :return: dict с полями SyncResponse
+    """
+    upper = datetime.now(timezone.utc) - timedelta(seconds=SYNC_LAG_SECONDS)
+    positions = start_positions(cursor, since, upper)
+
+    changes = {}
+    has_more = False
+    for kind in SYNC_KINDS:
+        changes[kind], positions[kind], kind_has_more = await changes_after(
+            db, kind, user_id, positions[kind], upper, limit
+        )
+        has_more |= kind_has_more
+
+    return {
+        'projects': rows_with_status(changes['projects']),
+        'tasks': rows_with_status(changes['tasks']),
+        'deleted_project_ids': [row.item_id for row in changes['deleted'] if row.item_type == 'project'],
+        'deleted_task_ids': [row.item_id for row in changes['deleted'] if row.item_type == 'task'],
+        'cursor': encode_sync_cursor(positions),
+        'has_more': has_more,
+    }
+
+
+def deletions_insert(user_id: int, item_type: str, ids_query):
+    """
+    :param item_type: project или task
+    :param ids_query: select с одним столбцом - id удаляемых (или удалённых в CTE этого же запроса) строк
+    :return: insert записей об удалении
+    """
+    ids = ids_query.subquery()
+    return insert(DeletedItem).from_select(
+        ['user_id', 'item_type', 'item_id', 'deleted_date'],
+        select(literal(user_id), literal(item_type), ids.c[0],
+               literal(datetime.now(timezone.utc), DateTime(timezone=True)))
+    )
+
+async def record_deletions(db: AsyncSession, user_id: int, item_type: str, ids_query):
+    """
+    Записывает удаление строк до их удаления (в той же транзакции)
+    :param item_type: project или task
+    :param ids_query: select с одним столбцом - id удаляемых строк
+    """
+    await db.execute(deletions_insert(user_id, item_type, ids_query))
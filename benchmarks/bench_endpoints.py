@@ -0,0 +1,142 @@
+"""
+Нагрузочный тест основных эндпоинтов: задержка (p50/p95/p99), пропускная способность и количество запросов к БД.
+Заполняет БД пользователями с проектами и задачами, затем по очереди нагружает каждый сценарий одновременными
+клиентами. Результат - JSON, который можно сравнивать между версиями.
+
+Запуск: python -m benchmarks.bench_endpoints [--users 20] [--projects 10] [--tasks 50]
+        [--requests 500] [--concurrency 20] [--url http://localhost:8000] [--output result.json]
+Без --url запросы идут в приложение внутри процесса (ASGI), с --url - в запущенный сервер с той же БД и SECRET_KEY
+"""
+import argparse
+import asyncio
+import json
+import platform
+import random
+import subprocess
+from datetime import datetime, timezone
+from typing import Optional
+
+from benchmarks.common import client, run_load, seed_bench_users, ROOT
+
+import app.dependencies as dependencies
+
+PREFIX = 'bench_endpoints'
+PASSWORD = 'bench_password'
+
+# сценарий "mixed": доля каждого эндпоинта среди запросов
+MIXED_WEIGHTS = {'get_tasks': 60, 'create_task': 15, 'update_task': 15, 'token': 10}
+
+
+def endpoint_requests(ac, users: list[dict], tasks_per_project: int, rnd: random.Random) -> dict:
+    """:return: имя сценария -> асинхронная функция (номер запроса) -> ответ"""
+    def user_for(number: int) -> dict:
+        return users[number % len(users)]
+
+    def headers(user: dict) -> dict:
+        return {"Authorization": f"Bearer {user['access_token']}"}
+
+    async def token(number: int):
+        user = user_for(number)
+        return await ac.post("/token", data={"username": user['login'], "password": user['password']})
+
+    async def get_tasks(number: int):
+        user = user_for(number)
+        return await ac.get("/get_tasks/", headers=headers(user))
+
+    async def create_task(number: int):
+        user = user_for(number)
+        return await ac.post("/create_task", headers=headers(user),
+                             json={"project_id": rnd.choice(user['project_ids']),
+                                   "title": f"bench {number}", "description": "bench", "priority": 2})
+
+    async def create_project(number: int):
+        user = user_for(number)
+        return await ac.post("/create_project", headers=headers(user),
+                             json={"title": f"bench {number}", "description": "bench"})
+
+    async def update_task(number: int):
+        user = user_for(number)
+        return await ac.post("/update_task", headers=headers(user),
+                             json={"task_id": rnd.choice(user['task_ids']),
+                                   "position_index": rnd.randrange(tasks_per_project or 1)})
+
+    # каждый запрос архивирует новый проект, проекты пользователей чередуются
+    projects_to_delete = [project_id for column in zip(*(user['project_ids'] for user in users)) for project_id in column]
+    owners = {project_id: user for user in users for project_id in user['project_ids']}
+
+    async def delete_project(number: int):
+        project_id = projects_to_delete[number]
+        return await ac.post("/delete_project", headers=headers(owners[project_id]), params={"project_id": project_id})
+
+    scenarios = {
+        'token': token,
+        'get_tasks': get_tasks,
+        'create_task': create_task,
+        'create_project': create_project,
+        'update_task': update_task,
+    }
+    names, weights = zip(*MIXED_WEIGHTS.items())
+
+    async def mixed(number: int):
+        return await scenarios[rnd.choices(names, weights)[0]](number)
+
+    scenarios['mixed'] = mixed
+    scenarios['delete_project'] = delete_project  # последним: архивирует проекты, нужные остальным сценариям
+    return scenarios
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=20, help='количество пользователей')
+    parser.add_argument('--projects', type=int, default=10, help='проектов у каждого пользователя')
+    parser.add_argument('--tasks', type=int, default=50, help='задач в каждом проекте')
+    parser.add_argument('--requests', type=int, default=500, help='запросов в каждом сценарии')
+    parser.add_argument('--token-requests', type=int, default=50, help='запросов /token')
+    parser.add_argument('--concurrency', type=int, default=20, help='одновременных клиентов')
+    parser.add_argument('--scenarios', nargs='+', help='какие сценарии запускать (по умолчанию все)')
+    parser.add_argument('--url', help='адрес запущенного сервера (по умолчанию приложение внутри процесса)')
+    parser.add_argument('--output', help='файл для результата (по умолчанию stdout)')
+    parser.add_argument('--seed', type=int, default=0, help='seed генератора случайных чисел')
+    args = parser.parse_args()
+
+    users = await seed_bench_users(PREFIX, PASSWORD, args.users, args.projects, args.tasks)
+    rnd = random.Random(args.seed)
+    started_at = datetime.now(timezone.utc)
+    limits = {
+        'token': args.token_requests,  # bcrypt медленный
+        'delete_project': min(args.requests, args.users * args.projects),  # каждый запрос архивирует новый проект
+    }
+
+    results = {}
+    async with client(args.url) as ac:
+        scenarios = endpoint_requests(ac, users, args.tasks, rnd)
+        for name, request in scenarios.items():
+            if args.scenarios and name not in args.scenarios:
+                continue
+            results[name] = await run_load(request, limits.get(name, args.requests), args.concurrency)
+
+    dependencies.password_hasher.shutdown()
+
+    report = {
+        'started_at': started_at.isoformat(),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'target': args.url or 'asgi',
+        'dataset': {'users': args.users, 'projects_per_user': args.projects, 'tasks_per_project': args.tasks},
+        'results': results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output)
+    print(output)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,69 @@
+"""
+Задержка /get_tasks/ пока /token находится под одновременной нагрузкой.
+Сравнивает bcrypt прямо в цикле событий (PASSWORD_HASH_WORKERS=0) и в пуле потоков.
+
+Запуск: python -m benchmarks.bench_password_hashing [--logins 4] [--reads 50]
+"""
+import argparse
+import asyncio
+import json
+
+from benchmarks.common import client, create_bench_user, delete_bench_user, summarize, timed
+
+import app.dependencies as dependencies
+from app.hashing import PasswordHasher
+
+LOGIN = 'bench_password_hashing'
+PASSWORD = 'bench_password'
+
+
+async def run_mode(workers: int, logins: int, reads: int) -> dict:
+    """
+    :param workers: размер пула для bcrypt (0 - считать в цикле событий)
+    :param logins: сколько клиентов одновременно запрашивают /token
+    :param reads: сколько раз последовательно запросить /get_tasks/
+    """
+    dependencies.set_password_hasher(PasswordHasher(max_workers=workers, max_concurrency=max(workers, 1) * 2))
+    user = await create_bench_user(LOGIN, PASSWORD, projects=1, tasks_per_project=20)
+    headers = {"Authorization": f"Bearer {user['access_token']}"}
+    stop = asyncio.Event()
+
+    async with client() as ac:
+        async def login_loop():
+            while not stop.is_set():
+                response = await ac.post("/token", data={"username": LOGIN, "password": PASSWORD})
+                assert response.status_code == 200
+
+        login_tasks = [asyncio.create_task(login_loop()) for _ in range(logins)]
+        await asyncio.sleep(0.2)  # даём нагрузке на /token разогнаться
+
+        latencies = []
+        for _ in range(reads):
+            elapsed, response = await timed(ac.get("/get_tasks/", headers=headers))
+            assert response.status_code == 200
+            latencies.append(elapsed)
+
+        stop.set()
+        await asyncio.gather(*login_tasks)
+
+    await delete_bench_user(LOGIN)
+    return {'password_hash_workers': workers, 'concurrent_logins': logins, 'get_tasks': summarize(latencies)}
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--logins', type=int, default=4, help='одновременных клиентов /token')
+    parser.add_argument('--reads', type=int, default=50, help='количество замеров /get_tasks/')
+    parser.add_argument('--workers', type=int, default=dependencies.PASSWORD_HASH_WORKERS,
+                        help='размер пула для режима с пулом')
+    args = parser.parse_args()
+
+    results = [
+        await run_mode(0, args.logins, args.reads),
+        await run_mode(args.workers, args.logins, args.reads),
+    ]
+    dependencies.password_hasher.shutdown()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
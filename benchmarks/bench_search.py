@@ -0,0 +1,125 @@
+"""
+Поиск задач по словам (/search/) на большом наборе данных против прежнего способа клиента - загрузить все задачи
+через /get_tasks/ и отфильтровать их у себя.
+Задачи заполняются одним INSERT ... SELECT generate_series (миллионы строк за минуты), слова выбираются из словаря
+с неравномерной частотой: есть частые слова (совпадают у многих задач) и редкие.
+Для каждого запроса выводятся задержка (p50/p95/p99) и индексы из плана.
+
+Запуск: python -m benchmarks.bench_search [--users 20] [--tasks 2000000] [--requests 200] [--concurrency 10]
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from sqlalchemy import text
+
+from benchmarks.common import client, run_load, seed_bench_users, session, summarize
+
+import app.dependencies as dependencies
+import app.search as search
+from app.data_base.explain import explain, used_indexes
+
+PREFIX = 'bench_search'
+PASSWORD = 'bench_password'
+
+COMMON_WORDS = ['report', 'meeting', 'review', 'budget', 'release', 'design', 'client', 'invoice', 'deploy', 'test',
+                'plan', 'call', 'email', 'update', 'fix', 'draft', 'order', 'team', 'sprint', 'backup']
+RARE_WORDS = [f'code{index}' for index in range(20000)]
+VOCABULARY = COMMON_WORDS + RARE_WORDS
+
+# имя -> строка поиска
+QUERIES = {
+    'common_word': 'report',
+    'two_words': 'budget review',
+    'prefix': 'depl',
+    'rare_word': 'code12345',
+}
+
+
+async def seed_tasks(users: list[dict], total_tasks: int, seed: int):
+    """Заполняет задачи пользователей (поровну) случайными названиями и описаниями из VOCABULARY"""
+    per_user = total_tasks // len(users)
+    # power(random(), 4) - чем меньше индекс слова, тем чаще оно встречается
+    word = "(CAST(:words AS text[]))[1 + floor(power(random(), 4) * :count)::int]"
+    async with session() as db:
+        await db.execute(text('SELECT setseed(:seed)'), {'seed': seed / 2 ** 31})
+        for user in users:
+            await db.execute(text(
+                "INSERT INTO tasks (user_id, project_id, status_id, position_index, priority, title, description, "
+                "created_date, updated_date) "
+                f"SELECT :user_id, :project_id, 1, g, g % 3 + 1, concat_ws(' ', {word}, {word}, {word}), "
+                f"concat_ws(' ', {word}, {word}, {word}, {word}, {word}, {word}), now(), now() "
+                "FROM generate_series(0, :per_user - 1) g"
+            ), {'user_id': user['user_id'], 'project_id': user['project_ids'][0], 'per_user': per_user,
+                'words': VOCABULARY, 'count': len(VOCABULARY)})
+            await db.commit()
+        await db.execute(text('ANALYZE tasks'))
+        await db.commit()
+
+async def query_plans(user_id: int, limit: int) -> dict:
+    """:return: имя запроса -> индексы из плана"""
+    plans = {}
+    async with session() as db:
+        for name, q in QUERIES.items():
+            plan = await explain(db, search.search_query('tasks', user_id, q, None, limit, None))
+            plans[name] = sorted(used_indexes(plan))
+    return plans
+
+async def client_filter(ac, user: dict, q: str) -> float:
+    """Прежний способ: все страницы /get_tasks/ и поиск подстроки у клиента. :return: время в секундах"""
+    headers = {"Authorization": f"Bearer {user['access_token']}"}
+    start = time.perf_counter()
+    cursor, found = None, 0
+    while True:
+        response = await ac.get("/get_tasks/", params={'limit': 1000, **({'cursor': cursor} if cursor else {})},
+                                headers=headers)
+        found += sum(q in f"{task['title']} {task['description']}" for task in response.json())
+        cursor = response.headers.get('X-Next-Cursor')
+        if cursor is None:
+            return time.perf_counter() - start
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=20, help='количество пользователей')
+    parser.add_argument('--tasks', type=int, default=2_000_000, help='всего задач (поровну у каждого пользователя)')
+    parser.add_argument('--requests', type=int, default=200, help='запросов поиска каждого вида')
+    parser.add_argument('--baseline-requests', type=int, default=3, help='полных загрузок /get_tasks/ (медленно)')
+    parser.add_argument('--concurrency', type=int, default=10, help='одновременных клиентов')
+    parser.add_argument('--limit', type=int, default=20, help='размер страницы поиска')
+    parser.add_argument('--seed', type=int, default=0, help='seed генератора случайных чисел')
+    args = parser.parse_args()
+
+    users = await seed_bench_users(PREFIX, PASSWORD, args.users, projects=1, tasks_per_project=0)
+    start = time.perf_counter()
+    await seed_tasks(users, args.tasks, args.seed)
+    seed_seconds = time.perf_counter() - start
+    await search.load_search_features()
+    rnd = random.Random(args.seed)
+
+    results = {}
+    async with client() as ac:
+        for name, q in QUERIES.items():
+            async def request(number: int, q=q):
+                user = rnd.choice(users)
+                return await ac.get("/search/", params={'q': q, 'limit': args.limit},
+                                    headers={"Authorization": f"Bearer {user['access_token']}"})
+            results[name] = await run_load(request, args.requests, args.concurrency)
+
+        results['client_filter'] = summarize([
+            await client_filter(ac, users[number % len(users)], QUERIES['common_word'])
+            for number in range(args.baseline_requests)
+        ])
+
+    dependencies.password_hasher.shutdown()
+    print(json.dumps({
+        'dataset': {'users': args.users, 'tasks': args.tasks, 'seed_seconds': seed_seconds},
+        'fuzzy_enabled': search.fuzzy_enabled,
+        'plans': await query_plans(users[0]['user_id'], args.limit),
+        'results': results,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
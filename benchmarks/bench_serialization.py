@@ -0,0 +1,119 @@
+"""
+Формирование ответа /get_tasks/ для большой страницы: прежний путь против текущего.
+- orm: select(Task) с joinedload(Task.status), model_validate каждого объекта, затем проверка и сериализация
+  через response_model FastAPI (serialize_response) и JSONResponse
+- rows: select только нужных ответу столбцов (строки-кортежи без identity map), статус из statuses,
+  проверка всего списка TypeAdapter и dump_json (pydantic-core)
+Для каждого пути измеряется время и пик выделенной памяти (tracemalloc) на один ответ.
+
+Запуск: python -m benchmarks.bench_serialization [--tasks 1000] [--repeat 30]
+"""
+import argparse
+import asyncio
+import json
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import List
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
+
+from benchmarks.common import create_bench_user, delete_bench_user, session, summarize
+
+from app.dependencies import rows_with_status, response_columns, is_overdue, status_response
+from app.models.models import Task
+from app.responses import list_json_response, task_list_adapter
+from app.schemas.response import TaskResponse
+
+LOGIN = 'bench_serialization'
+PASSWORD = 'bench_password'
+
+response_field = create_model_field(name='Response_get_tasks', type_=List[TaskResponse], mode='serialization')
+
+
+def apply_overdue_status(items: list, schema) -> list:
+    """Прежнее формирование ответа из ORM объектов: model_validate каждого объекта"""
+    now = datetime.now(timezone.utc)
+    result = []
+    for item in items:
+        response = schema.model_validate(item, from_attributes=True)
+        if is_overdue(item, now):
+            response.status = status_response(3)
+        result.append(response)
+    return result
+
+
+async def orm_path(db, user_id: int, limit: int) -> tuple[bytes, float]:
+    """:return: (тело ответа, время без запроса к БД)"""
+    result = await db.execute(
+        select(Task).where((Task.user_id == user_id) & (Task.status_id != 4))
+        .order_by(Task.position_index, Task.task_id).limit(limit)
+        .options(joinedload(Task.status))
+    )
+    tasks = result.scalars().all()
+
+    start = time.perf_counter()
+    content = await serialize_response(field=response_field, response_content=apply_overdue_status(tasks, TaskResponse))
+    body = JSONResponse(content).body
+    return body, time.perf_counter() - start
+
+async def rows_path(db, user_id: int, limit: int) -> tuple[bytes, float]:
+    """:return: (тело ответа, время без запроса к БД)"""
+    result = await db.execute(
+        select(*response_columns(Task, TaskResponse)).where((Task.user_id == user_id) & (Task.status_id != 4))
+        .order_by(Task.position_index, Task.task_id).limit(limit)
+    )
+    rows = result.all()
+
+    start = time.perf_counter()
+    body = list_json_response(task_list_adapter, rows_with_status(rows)).body
+    return body, time.perf_counter() - start
+
+async def measure(path, user_id: int, limit: int, repeat: int) -> dict:
+    totals, serialization = [], []
+    for _ in range(repeat):
+        async with session() as db:  # новая сессия: identity map не переиспользуется между замерами
+            start = time.perf_counter()
+            body, serialize_time = await path(db, user_id, limit)
+            totals.append(time.perf_counter() - start)
+            serialization.append(serialize_time)
+
+    # память отдельным проходом: tracemalloc замедляет выполнение
+    async with session() as db:
+        tracemalloc.start()
+        await path(db, user_id, limit)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return {'total': summarize(totals), 'serialization': summarize(serialization), 'body_bytes': len(body),
+            'peak_memory_kb': peak / 1024}
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tasks', type=int, default=1000, help='количество задач на странице')
+    parser.add_argument('--repeat', type=int, default=30, help='количество замеров')
+    args = parser.parse_args()
+
+    user = await create_bench_user(LOGIN, PASSWORD, projects=1, tasks_per_project=args.tasks)
+
+    # ответы обоих путей должны совпадать
+    async with session() as db:
+        orm_body, _ = await orm_path(db, user['user_id'], args.tasks)
+        rows_body, _ = await rows_path(db, user['user_id'], args.tasks)
+    assert json.loads(orm_body) == json.loads(rows_body)
+
+    results = {
+        'tasks': args.tasks,
+        'orm': await measure(orm_path, user['user_id'], args.tasks, args.repeat),
+        'rows': await measure(rows_path, user['user_id'], args.tasks, args.repeat),
+    }
+    await delete_bench_user(LOGIN)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
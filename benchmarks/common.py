@@ -0,0 +1,238 @@
+"""Общие функции для бенчмарков. Бенчмарки запускаются из корня проекта: python -m benchmarks.<имя_файла>"""
+import asyncio
+import math
+import os
+import re
+import sys
+import time
+from collections import Counter
+from contextlib import asynccontextmanager, redirect_stdout
+from datetime import datetime, timezone, timedelta
+from typing import Awaitable, Callable, Optional
+
+# как и в pytest.ini: run.py импортирует роутеры относительно папки app
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, 'app')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy import delete, select, insert
+
+from app.data_base.data_base import get_db, create_database
+from app.dependencies import hash_password, create_access_token, token_claims, invalidate_cached_user
+from app.models.models import User, Project, Task, DeletedItem, RefreshToken, Job, DataVersion
+
+
+def percentile(values: list[float], percent: float) -> float:
+    """
+    :param values: замеры
+    :param percent: перцентиль от 0 до 100
+    :return: значение перцентиля (ближайший ранг)
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(math.ceil(percent / 100 * len(ordered)) - 1, 0)
+    return ordered[index]
+
+def summarize(latencies: list[float]) -> dict:
+    """:return: статистика по задержкам в миллисекундах"""
+    return {
+        'count': len(latencies),
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'max_ms': max(latencies, default=0.0) * 1000,
+    }
+
+async def timed(coro) -> tuple[float, object]:
+    """:return: (время выполнения в секундах, результат)"""
+    start = time.perf_counter()
+    result = await coro
+    return time.perf_counter() - start, result
+
+@asynccontextmanager
+async def client(url: Optional[str] = None):
+    """
+    HTTP клиент который обращается к приложению внутри процесса
+    :param url: адрес запущенного сервера (например http://localhost:8000), тогда запросы идут по сети
+    """
+    if url is not None:
+        async with AsyncClient(base_url=url, timeout=60) as ac:
+            yield ac
+        return
+
+    from app.run import app
+    import app.rate_limit as rate_limit
+    rate_limit.RATE_LIMIT_ENABLED = False  # все запросы идут с одного адреса, измеряются эндпоинты, а не лимит
+    async with AsyncClient(transport=ASGITransport(app), base_url="http://bench", timeout=60) as ac:
+        yield ac
+
+_QUERIES_RE = re.compile(r'desc="(\d+) queries')
+
+async def run_load(request: Callable[[int], Awaitable], total: int, concurrency: int) -> dict:
+    """
+    Выполняет total запросов из concurrency одновременных клиентов
+    :param request: асинхронная функция (номер запроса) -> httpx.Response
+    :return: summarize() + длительность, пропускная способность, коды ответов и среднее количество запросов к БД
+    """
+    latencies = []
+    statuses = Counter()
+    queries = []
+    numbers = iter(range(total))  # общий для всех клиентов
+
+    async def worker():
+        for number in numbers:
+            elapsed, response = await timed(request(number))
+            latencies.append(elapsed)
+            statuses[response.status_code] += 1
+            match = _QUERIES_RE.search(response.headers.get('Server-Timing', ''))
+            if match:
+                queries.append(int(match.group(1)))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    duration = time.perf_counter() - start
+
+    return {
+        **summarize(latencies),
+        'concurrency': concurrency,
+        'duration_s': duration,
+        'throughput_rps': len(latencies) / duration if duration else 0.0,
+        'errors': sum(count for status_code, count in statuses.items() if status_code >= 400),
+        'statuses': {str(status_code): count for status_code, count in sorted(statuses.items())},
+        'db_queries_avg': sum(queries) / len(queries) if queries else None,
+    }
+
+@asynccontextmanager
+async def session():
+    db_gen = get_db()
+    db = await db_gen.__anext__()
+    try:
+        yield db
+    finally:
+        await db.close()
+
+async def bootstrap_database():
+    """create_database() печатает имя БД, а stdout бенчмарков занят JSON с результатом"""
+    with redirect_stdout(sys.stderr):
+        await create_database()
+
+async def create_bench_user(login: str, password: str, projects: int = 1, tasks_per_project: int = 0) -> dict:
+    """
+    Создаёт пользователя с проектами и задачами (прошлые данные этого пользователя удаляются)
+    :return: dict{'user_id', 'login', 'password', 'access_token', 'project_ids'}
+    """
+    await bootstrap_database()
+    await delete_bench_user(login)
+
+    now = datetime.now(timezone.utc)
+    async with session() as db:
+        user = User(login=login, password=hash_password(password), email=f'{login}@bench.local',
+                    created_date=now, last_login=now)
+        db.add(user)
+        await db.flush()
+
+        project_ids = []
+        for project_index in range(projects):
+            project = Project(user_id=user.user_id, status_id=1, position_index=project_index,
+                              title=f'bench project {project_index}', description='bench',
+                              created_date=now, desired_completion_date=now + timedelta(days=30), updated_date=now)
+            db.add(project)
+            await db.flush()
+            project_ids.append(project.project_id)
+
+            db.add_all([
+                Task(user_id=user.user_id, project_id=project.project_id, status_id=1, position_index=task_index,
+                     priority=task_index % 3 + 1, title=f'bench task {task_index}', description='bench',
+                     created_date=now, desired_completion_date=now + timedelta(days=30), updated_date=now)
+                for task_index in range(tasks_per_project)
+            ])
+        await db.commit()
+
+        return {'user_id': user.user_id,
+                'login': login,
+                'password': password,
+                'access_token': create_access_token(data=token_claims(user.user_id, login, user.token_version)),
+                'project_ids': project_ids}
+
+async def delete_bench_user(login: str):
+    """Удаляет пользователя и все его данные"""
+    await invalidate_cached_user(login)
+    async with session() as db:
+        user_id = (await db.execute(select(User.user_id).where(User.login == login))).scalar_one_or_none()
+        if user_id is None:
+            return
+        # строки, ссылающиеся на пользователя (версия после задач и проектов: их удаление её увеличивает)
+        for model in (Task, Project, DeletedItem, RefreshToken, Job, DataVersion):
+            await db.execute(delete(model).where(model.user_id == user_id))
+        await db.execute(delete(User).where(User.user_id == user_id))
+        await db.commit()
+
+async def seed_bench_users(prefix: str, password: str, users: int, projects: int, tasks_per_project: int) -> list[dict]:
+    """
+    Создаёт пользователей prefix_0 ... prefix_{users-1} (существующие переиспользуются, чтобы их id не менялись
+    и закэшированные сервером пользователи оставались верными) и заново заполняет их проекты и задачи
+    :return: [dict{'user_id', 'login', 'password', 'access_token', 'project_ids', 'task_ids'}]
+    """
+    await bootstrap_database()
+    now = datetime.now(timezone.utc)
+    logins = [f'{prefix}_{index}' for index in range(users)]
+
+    async with session() as db:
+        existing = (await db.execute(
+            select(User.login, User.user_id, User.token_version).where(User.login.in_(logins))
+        )).all()
+        user_ids = {row.login: row.user_id for row in existing}
+        token_versions = {row.login: row.token_version for row in existing}  # у новых пользователей версия 0
+        missing = [login for login in logins if login not in user_ids]
+        if missing:
+            hashed_password = hash_password(password)  # bcrypt один раз на всех
+            inserted = await db.execute(
+                insert(User).returning(User.login, User.user_id),
+                [{'login': login, 'password': hashed_password, 'email': f'{login}@bench.local',
+                  'created_date': now, 'last_login': now} for login in missing]
+            )
+            user_ids.update(inserted.all())
+
+        # прошлый прогон: данные, записи об удалении, refresh токены и задания
+        for model in (Task, Project, DeletedItem, RefreshToken, Job):
+            await db.execute(delete(model).where(model.user_id.in_(user_ids.values())))
+
+        inserted = await db.execute(
+            insert(Project).returning(Project.user_id, Project.project_id, sort_by_parameter_order=True),
+            [{'user_id': user_ids[login], 'status_id': 1, 'position_index': project_index,
+              'title': f'bench project {project_index}', 'description': 'bench', 'created_date': now,
+              'desired_completion_date': now + timedelta(days=30), 'updated_date': now}
+             for login in logins for project_index in range(projects)]
+        )
+        project_rows = inserted.all()
+
+        task_rows = []
+        if tasks_per_project:
+            inserted = await db.execute(
+                insert(Task).returning(Task.user_id, Task.task_id, sort_by_parameter_order=True),
+                [{'user_id': user_id, 'project_id': project_id, 'status_id': 1, 'position_index': task_index,
+                  'priority': task_index % 3 + 1, 'title': f'bench task {task_index}', 'description': 'bench',
+                  'created_date': now, 'desired_completion_date': now + timedelta(days=30), 'updated_date': now}
+                 for user_id, project_id in project_rows for task_index in range(tasks_per_project)]
+            )
+            task_rows = inserted.all()
+        await db.commit()
+
+    for login in logins:
+        await invalidate_cached_user(login)
+
+    result = {user_ids[login]: {'user_id': user_ids[login],
+                                'login': login,
+                                'password': password,
+                                'access_token': create_access_token(
+                                    data=token_claims(user_ids[login], login, token_versions.get(login))),
+                                'project_ids': [],
+                                'task_ids': []} for login in logins}
+    for user_id, project_id in project_rows:
+        result[user_id]['project_ids'].append(project_id)
+    for user_id, task_id in task_rows:
+        result[user_id]['task_ids'].append(task_id)
+    return list(result.values())
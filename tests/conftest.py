@@ -1,20 +1,26 @@
 import os
 
+from contextlib import contextmanager
+
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import delete, select, cast, func, Boolean
 from datetime import datetime, timezone, timedelta
 from dotenv import load_dotenv
 
-from app.dependencies import hash_password
-from app.models.models import User, Project, Status, Task
+from app.dependencies import hash_password, user_cache, token_versions
+from app.models.models import User, Project, Status, Task, DeletedItem, RefreshToken, TaskCounter, Job, DataVersion
+from app.refresh_tokens import revoked_refresh_tokens, revoked_families
+import app.rate_limit as rate_limit
 from app.dependencies import create_access_token
 from app.data_base.data_base import get_db, create_database
+from app.data_base.queries import collect_queries
 
 load_dotenv()  # Загружает переменные из .env
 ACCESS_TOKEN_EXPIRE_MINUTES = float(os.getenv('ACCESS_TOKEN_EXPIRE_MINUTES'))
 MODE = os.getenv('MODE')
 
 # эти импорты необходимо указывать именно тут для загрузки .test.env
+import pytest
 import pytest_asyncio
 
 @pytest_asyncio.fixture(scope='session', autouse=True)
@@ -40,8 +46,34 @@ async def clearing_db(db_session: AsyncSession):
 
     await db_session.execute(delete(Task))
     await db_session.execute(delete(Project))
+    await db_session.execute(delete(DeletedItem))
+    await db_session.execute(delete(RefreshToken))
+    await db_session.execute(delete(TaskCounter))
+    await db_session.execute(delete(Job))
+    await db_session.execute(delete(DataVersion))  # после задач и проектов: их удаление увеличивает версии
     await db_session.execute(delete(User))
     await db_session.commit()
+    await user_cache.clear()  # пользователи удалены в обход API
+    await token_versions.clear()
+    await revoked_refresh_tokens.clear()
+    await revoked_families.clear()
+    await rate_limit.rate_limit_store.clear()  # корзины не переходят между тестами
+
+
+@pytest.fixture
+def assert_max_queries():
+    """
+    Проверяет, что внутри блока выполнено не больше max_queries запросов к БД:
+    with assert_max_queries(3) as stats:
+        await ac.post(...)
+    """
+    @contextmanager
+    def check(max_queries: int):
+        with collect_queries(keep_statements=True) as stats:
+            yield stats
+        assert stats.count <= max_queries, \
+            f"{stats.count} запросов вместо {max_queries}:\n" + "\n".join(stats.statements)
+    return check
 
 
 @pytest_asyncio.fixture(scope="function") # будет вызываться для каждого метода
@@ -0,0 +1,128 @@
+import pytest
+from httpx import AsyncClient, ASGITransport
+
+import app.dependencies as dependencies
+import app.refresh_tokens as refresh_tokens
+from app.run import app
+
+
+async def login_tokens(ac, create_user) -> dict:
+    """:return: ответ /token (access_token и refresh_token)"""
+    response = await ac.post("/token", data={"username": create_user['user_name'], "password": create_user['password']})
+    return response.json()
+
+async def login(ac, create_user) -> dict:
+    """:return: заголовки с токеном из /token (в нём есть uid и ver)"""
+    return {"Authorization": f"Bearer {(await login_tokens(ac, create_user))['access_token']}"}
+
+
+class TestStatelessAuth:
+    @pytest.fixture(autouse=True)
+    def stateless(self, monkeypatch):
+        monkeypatch.setattr(dependencies, 'AUTH_MODE', 'stateless')
+
+    @pytest.mark.asyncio
+    async def test_no_user_lookup(self, create_project, assert_max_queries):
+        async with AsyncClient(transport=ASGITransport(app), base_url="http://test") as ac:
+            headers = await login(ac, create_project['data_user'])
+            await ac.get("/get_projects/", headers=headers)  # версия токенов попадает в память
+            await dependencies.user_cache.clear()
+
+            with assert_max_queries(2) as stats:  # версия проектов (ETag) и страница
+                response = await ac.get("/get_projects/", headers=headers)
+            assert response.status_code == 200
+            assert not any('FROM users' in statement for statement in stats.statements)
+
+            # полная строка пользователя загружается только там, где она нужна
+            response = await ac.get("/user_me/", headers=headers)
+            assert response.json()['login'] == create_project['data_user']['user_name']
+
+    @pytest.mark.asyncio
+    async def test_token_without_version(self, create_user):
+        # токены выданные до появления uid и ver проверяются по БД
+        async with AsyncClient(transport=ASGITransport(app), base_url="http://test") as ac:
+            response = await ac.get("/get_projects/", headers={"Authorization": f"Bearer {create_user['access_token']}"})
+        assert response.status_code == 200
+
+    @pytest.mark.asyncio
+    async def test_revoke_tokens(self, create_user):
+        async with AsyncClient(transport=ASGITransport(app), base_url="http://test") as ac:
+            tokens = await login_tokens(ac, create_user)
+            headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+
+            response = await ac.post("/revoke_tokens", headers=headers)
+            assert response.status_code == 204
+
+            assert (await ac.get("/get_projects/", headers=headers)).status_code == 401
+            assert (await ac.get("/user_me/", headers=headers)).status_code == 401
+            response = await ac.post("/refresh_token", json={"refresh_token": tokens['refresh_token']})
+            assert response.status_code == 401
+
+            # новый вход выдаёт токен с новой версией
+            headers = await login(ac, create_user)
+            assert (await ac.get("/get_projects/", headers=headers)).status_code == 200
+
+
+class TestLookupAuth:
+    @pytest.mark.asyncio
+    async def test_revoke_tokens(self, create_user):
+        async with AsyncClient(transport=ASGITransport(app), base_url="http://test") as ac:
+            headers = await login(ac, create_user)
+            assert (await ac.get("/get_projects/", headers=headers)).status_code == 200  # пользователь в кэше
+
+            assert (await ac.post("/revoke_tokens", headers=headers)).status_code == 204
+            assert (await ac.get("/get_projects/", headers=headers)).status_code == 401
+
+
+class TestRefreshTokens:
+    @pytest.mark.asyncio
+    async def test_rotation(self, create_user, assert_max_queries):
+        async with AsyncClient(transport=ASGITransport(app), base_url="http://test") as ac:
+            tokens = await login_tokens(ac, create_user)
+            with assert_max_queries(1):  # версия токенов уже в памяти: старый помечается и новый записывается вместе
+                response = await ac.post("/refresh_token", json={"refresh_token": tokens['refresh_token']})
+            assert response.status_code == 200
+            rotated = response.json()
+
+            headers = {"Authorization": f"Bearer {rotated['access_token']}"}
+            assert (await ac.get("/get_projects/", headers=headers)).status_code == 200
+            # refresh token не принимается вместо access токена
+            headers = {"Authorization": f"Bearer {rotated['refresh_token']}"}
+            assert (await ac.get("/get_projects/", headers=headers)).status_code == 401
+
+            response = await ac.post("/refresh_token", json={"refresh_token": rotated['refresh_token']})
+            assert response.status_code == 200
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize('forget_revoked', [False, True])
+    async def test_reuse_revokes_login(self, forget_revoked, create_user, assert_max_queries):
+        async with AsyncClient(transport=ASGITransport(app), base_url="http://test") as ac:
+            stolen = (await login_tokens(ac, create_user))['refresh_token']
+            other_login = (await login_tokens(ac, create_user))['refresh_token']
+            rotated = (await ac.post("/refresh_token", json={"refresh_token": stolen})).json()['refresh_token']
+
+            if forget_revoked:  # повтор в другом воркере (или вытеснен из памяти) находит запрос ротации
+                await refresh_tokens.revoked_refresh_tokens.clear()
+                response = await ac.post("/refresh_token", json={"refresh_token": stolen})
+            else:
+                with assert_max_queries(1):  # только отзыв входа
+                    response = await ac.post("/refresh_token", json={"refresh_token": stolen})
+            assert response.status_code == 401
+
+            # токены этого входа отозваны, даже ещё не использованные
+            await refresh_tokens.revoked_families.clear()
+            response = await ac.post("/refresh_token", json={"refresh_token": rotated})
+            assert response.status_code == 401
+            # другой вход не затронут
+            response = await ac.post("/refresh_token", json={"refresh_token": other_login})
+            assert response.status_code == 200
+
+    @pytest.mark.asyncio
+    async def test_logout(self, create_user):
+        async with AsyncClient(transport=ASGITransport(app), base_url="http://test") as ac:
+            tokens = await login_tokens(ac, create_user)
+            response = await ac.post("/logout", json={"refresh_token": tokens['refresh_token']})
+            assert response.status_code == 204
+
+            response = await ac.post("/refresh_token", json={"refresh_token": tokens['refresh_token']})
+            assert response.status_code == 401
@@ -0,0 +1,112 @@
+import asyncio
+from datetime import datetime, timezone, timedelta
+
+import pytest
+from sqlalchemy import select, update
+
+from app.background import sweep_overdue, cleanup_tombstones, cleanup_refresh_tokens, PeriodicJob, BackgroundLeader
+from app.models.models import Project, Task, DeletedItem, RefreshToken
+from app.sync import SYNC_TOMBSTONE_TTL_DAYS
+
+
+class TestOverdueSweeper:
+    @pytest.mark.asyncio
+    async def test_sweep_overdue(self, db_session, create_task):
+        past = datetime.now(timezone.utc) - timedelta(days=1)
+        await db_session.execute(update(Project).where(Project.project_id == create_task['project_id'])
+                                 .values(desired_completion_date=past))
+        await db_session.execute(update(Task).where(Task.task_id == create_task['task_id'])
+                                 .values(desired_completion_date=past))
+        await db_session.commit()
+
+        result = await sweep_overdue(batch_size=1)  # пачка из одной строки, чтобы пройти несколько итераций
+        assert result == {'projects': 1, 'tasks': 1}
+
+        project_status = (await db_session.execute(
+            select(Project.status_id).where(Project.project_id == create_task['project_id']))).scalar_one()
+        task_status = (await db_session.execute(
+            select(Task.status_id).where(Task.task_id == create_task['task_id']))).scalar_one()
+        assert project_status == 3  # просрочен
+        assert task_status == 3
+
+        # повторный запуск ничего не меняет
+        assert await sweep_overdue() == {'projects': 0, 'tasks': 0}
+
+    @pytest.mark.asyncio
+    async def test_sweep_overdue_skips_deleted(self, db_session, create_task):
+        past = datetime.now(timezone.utc) - timedelta(days=1)
+        await db_session.execute(update(Task).where(Task.task_id == create_task['task_id'])
+                                 .values(desired_completion_date=past, status_id=4, position_index=-1))
+        await db_session.commit()
+
+        assert (await sweep_overdue())['tasks'] == 0
+
+
+class TestTombstoneCleaner:
+    @pytest.mark.asyncio
+    async def test_cleanup_tombstones(self, db_session, create_user):
+        now = datetime.now(timezone.utc)
+        db_session.add_all([
+            DeletedItem(user_id=create_user['user_id'], item_type='task', item_id=1,
+                        deleted_date=now - timedelta(days=SYNC_TOMBSTONE_TTL_DAYS + 1)),
+            DeletedItem(user_id=create_user['user_id'], item_type='task', item_id=2, deleted_date=now),
+        ])
+        await db_session.commit()
+
+        assert await cleanup_tombstones() == 1
+        remaining = (await db_session.execute(select(DeletedItem.item_id))).scalars().all()
+        assert remaining == [2]
+
+
+class TestRefreshTokenCleaner:
+    @pytest.mark.asyncio
+    async def test_cleanup_refresh_tokens(self, db_session, create_user):
+        now = datetime.now(timezone.utc)
+        db_session.add_all([
+            RefreshToken(token_hash='expired', user_id=create_user['user_id'], family_id='family',
+                         created_date=now - timedelta(days=2), expires_date=now - timedelta(days=1)),
+            RefreshToken(token_hash='revoked', user_id=create_user['user_id'], family_id='family',
+                         created_date=now, expires_date=now + timedelta(days=1), revoked_date=now),
+        ])
+        await db_session.commit()
+
+        assert await cleanup_refresh_tokens() == 1
+        remaining = (await db_session.execute(select(RefreshToken.token_hash))).scalars().all()
+        assert remaining == ['revoked']  # отозванный хранится до истечения для распознавания повтора
+
+
+async def wait_for(condition) -> bool:
+    for _ in range(100):
+        if condition():
+            return True
+        await asyncio.sleep(0.02)
+    return False
+
+
+class TestBackgroundLeader:
+    @pytest.mark.asyncio
+    async def test_one_process_runs_jobs(self):
+        runs = {'first': 0, 'second': 0}
+
+        def counter(name: str):
+            async def run():
+                runs[name] += 1
+            return run
+
+        # два процесса приложения: задачи запускает только тот, что взял блокировку
+        first = BackgroundLeader([PeriodicJob('first', counter('first'), 0.01)], interval=0.05)
+        second = BackgroundLeader([PeriodicJob('second', counter('second'), 0.01)], interval=0.05)
+        first.start()
+        try:
+            assert await wait_for(lambda: runs['first'] > 0)
+            second.start()
+            await asyncio.sleep(0.2)
+            assert first.is_leader and not second.is_leader
+            assert runs['second'] == 0
+
+            await first.stop()  # процесс остановился - задачи продолжает другой
+            assert await wait_for(lambda: runs['second'] > 0)
+            assert second.is_leader
+        finally:
+            await first.stop()
+            await second.stop()
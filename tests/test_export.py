@@ -0,0 +1,124 @@
+import gzip
+import json
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy import select
+
+import app.export as export
+import app.sync as sync
+from app.models.models import Project, Task
+from app.run import app
+
+
+def parse_lines(body: bytes) -> list[dict]:
+    return [json.loads(line) for line in body.splitlines()]
+
+
+class TestExport:
+    @pytest.mark.asyncio
+    async def test_export_ndjson(self, create_task):
+        headers = {"Authorization": f"Bearer {create_task['data_user']['access_token']}"}
+        async with AsyncClient(transport=ASGITransport(app), base_url="http://test") as ac:
+            response = await ac.get("/export", headers=headers)
+
+        assert response.status_code == 200
+        assert response.headers['content-type'] == 'application/x-ndjson'
+        project, task = parse_lines(response.content)
+        assert project['type'] == 'project'
+        assert project['project_id'] == create_task['project_id']
+        assert project['status_id'] == 1
+        assert task['type'] == 'task'
+        assert task['task_id'] == create_task['task_id']
+        assert task['project_id'] == create_task['project_id']
+
+    @pytest.mark.asyncio
+    async def test_export_gzip_in_batches(self, create_task, monkeypatch):
+        monkeypatch.setattr(export, 'EXPORT_BATCH_SIZE', 1)
+        headers = {"Authorization": f"Bearer {create_task['data_user']['access_token']}"}
+        async with AsyncClient(transport=ASGITransport(app), base_url="http://test") as ac:
+            await ac.post("/create_task", headers=headers, json={
+                "project_id": create_task['project_id'], "title": "second", "description": "second"
+            })
+            response = await ac.get("/export", params={'compress': True}, headers=headers)
+
+        assert response.status_code == 200
+        assert response.headers['content-type'] == 'application/gzip'
+        lines = parse_lines(gzip.decompress(response.content))
+        assert [line['type'] for line in lines] == ['project', 'task', 'task']
+        assert [line['position_index'] for line in lines[1:]] == [0, 1]
+
+
+class TestImport:
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize('compress', [False, True])
+    async def test_import_round_trip(self, compress, create_task, db_session, monkeypatch):
+        monkeypatch.setattr(export, 'IMPORT_BATCH_SIZE', 2)  # проект и задачи попадают в разные транзакции
+        headers = {"Authorization": f"Bearer {create_task['data_user']['access_token']}"}
+        async with AsyncClient(transport=ASGITransport(app), base_url="http://test") as ac:
+            await ac.post("/create_task", headers=headers, json={
+                "project_id": create_task['project_id'], "title": "second", "description": "second"
+            })
+            body = (await ac.get("/export", params={'compress': compress}, headers=headers)).content
+            response = await ac.post("/import", content=body, headers=headers)
+
+        assert response.status_code == 200
+        assert response.json() == {'projects': 1, 'tasks': 2, 'skipped_tasks': 0}
+
+        projects = (await db_session.execute(
+            select(Project).order_by(Project.position_index)
+        )).scalars().all()
+        assert [project.position_index for project in projects] == [0, 1]
+        new_project = projects[1]
+        assert new_project.project_id != create_task['project_id']
+        assert new_project.title == create_task['title']
+
+        tasks = (await db_session.execute(
+            select(Task).where(Task.project_id == new_project.project_id).order_by(Task.position_index)
+        )).scalars().all()
+        assert [task.title for task in tasks] == [create_task['title'], 'second']
+        assert [task.position_index for task in tasks] == [0, 1]
+
+    @pytest.mark.asyncio
+    async def test_import_reaches_sync(self, create_task, monkeypatch):
+        monkeypatch.setattr(sync, 'SYNC_LAG_SECONDS', 0)  # изменения видны сразу
+        headers = {"Authorization": f"Bearer {create_task['data_user']['access_token']}"}
+        body = b'\n'.join([
+            json.dumps({'type': 'project', 'project_id': 1, 'position_index': 0, 'title': 'old', 'description': '',
+                        'created_date': '2020-01-01T00:00:00Z', 'updated_date': '2020-01-01T00:00:00Z'}).encode(),
+            json.dumps({'type': 'task', 'task_id': 1, 'project_id': 1, 'position_index': 0, 'title': 'null_date',
+                        'description': '', 'created_date': '2020-01-01T00:00:00Z', 'updated_date': None}).encode(),
+        ])
+        async with AsyncClient(transport=ASGITransport(app), base_url="http://test") as ac:
+            cursor = (await ac.get("/sync", headers=headers)).json()['cursor']  # клиент уже синхронизирован
+            response = await ac.post("/import", content=body, headers=headers)
+            assert response.status_code == 200
+
+            data = (await ac.get("/sync", params={'cursor': cursor}, headers=headers)).json()
+        assert [project['title'] for project in data['projects']] == ['old']
+        assert [task['title'] for task in data['tasks']] == ['null_date']
+
+    @pytest.mark.asyncio
+    async def test_import_skips_tasks_without_project(self, create_user):
+        headers = {"Authorization": f"Bearer {create_user['access_token']}"}
+        body = json.dumps({'type': 'task', 'task_id': 1, 'project_id': 1, 'position_index': 0, 'title': 'task',
+                           'created_date': '2025-01-01T00:00:00Z'})
+        async with AsyncClient(transport=ASGITransport(app), base_url="http://test") as ac:
+            response = await ac.post("/import", content=body, headers=headers)
+
+        assert response.status_code == 200
+        assert response.json() == {'projects': 0, 'tasks': 0, 'skipped_tasks': 1}
+
+    @pytest.mark.asyncio
+    async def test_import_invalid_line(self, create_user):
+        headers = {"Authorization": f"Bearer {create_user['access_token']}"}
+        body = b'\n'.join([
+            json.dumps({'type': 'project', 'project_id': 1, 'position_index': 0, 'title': 'project',
+                        'created_date': '2025-01-01T00:00:00Z'}).encode(),
+            b'{"type": "user"}',
+        ])
+        async with AsyncClient(transport=ASGITransport(app), base_url="http://test") as ac:
+            response = await ac.post("/import", content=body, headers=headers)
+
+        assert response.status_code == 422
+        assert response.json()['detail'].startswith('Некорректная строка 2')
@@ -3,8 +3,13 @@ from datetime import datetime, timedelta
 
 import pytest
 from httpx import AsyncClient, ASGITransport
+from sqlalchemy import select, update
+
+from app.models.models import User, Project, Task
+from app.pagination import NEXT_CURSOR_HEADER
 
 from app.run import app
+from app.dependencies import user_cache_stats
 
 
 def compare_dates(api_date_str, expected_dt):
@@ -106,3 +111,168 @@ class TestGetRequest:
             assert compare_dates(data_second[0]['desired_completion_date'], create_task['desired_completion_date'])
             assert not data_second[0]['actual_completion_date']
             assert compare_dates(data_second[0]['updated_date'], create_task['created_date'])
+
+    @pytest.mark.asyncio
+    async def test_db_pool_metrics(self, db_session, create_user):
+        async with AsyncClient(
+                transport=ASGITransport(app),
+                base_url="http://test",
+        ) as ac:
+            response = await ac.get("/db_pool_metrics/", headers={"Authorization": f"Bearer {create_user['access_token']}"})
+            assert response.status_code == 200
+            data = response.json()
+
+            assert data['checkouts'] > 0
+            assert data['pool_size'] > 0
+            assert data['checked_out'] >= 1  # соединение текущего запроса ещё не возвращено в пул
+            assert data['timeouts'] == 0
+
+    @pytest.mark.asyncio
+    async def test_user_cache(self, db_session, create_task):
+        async with AsyncClient(
+                transport=ASGITransport(app),
+                base_url="http://test",
+        ) as ac:
+            headers = {"Authorization": f"Bearer {create_task['data_user']['access_token']}"}
+            user_cache_stats.reset()
+
+            # только первый запрос должен сходить в БД за пользователем
+            for url in ("/get_tasks/", "/get_tasks/", "/get_projects/"):
+                response = await ac.get(url, headers=headers)
+                assert response.status_code == 200
+
+            stats = user_cache_stats.snapshot()
+            assert stats['misses'] == 1
+            assert stats['hits'] == 2
+
+            response = await ac.get("/user_me/", headers=headers)
+            assert response.status_code == 200
+            assert response.json()['user_id'] == create_task['data_user']['user_id']
+
+    @pytest.mark.asyncio
+    async def test_get_tasks_overdue_read_only(self, db_session, create_task):
+        async with AsyncClient(
+                transport=ASGITransport(app),
+                base_url="http://test",
+        ) as ac:
+            await db_session.execute(update(Task).where(Task.task_id == create_task['task_id'])
+                                     .values(desired_completion_date=datetime.now().astimezone() - timedelta(days=1)))
+            await db_session.commit()
+
+            response = await ac.get("/get_tasks/",
+                                    params={'task_id': create_task['task_id']},
+                                    headers={"Authorization": f"Bearer {create_task['data_user']['access_token']}"}
+                                    )
+            assert response.status_code == 200
+            assert response.json()[0]['status']['status_id'] == 3  # просрочена
+            assert response.json()[0]['status']['name'] == 'overdue'
+
+            # чтение ничего не записывает в БД
+            status_id = (await db_session.execute(
+                select(Task.status_id).where(Task.task_id == create_task['task_id']))).scalar_one()
+            assert status_id == 1
+
+    @pytest.mark.asyncio
+    async def test_get_tasks_pagination(self, db_session, create_task):
+        now = datetime.now().astimezone()
+        for index in range(1, 5):  # ещё 4 задачи (всего 5) с разным приоритетом
+            db_session.add(Task(user_id=create_task['data_user']['user_id'], project_id=create_task['project_id'],
+                                status_id=1, position_index=index, priority=index % 3 + 1, title=f'task {index}',
+                                description='', created_date=now, updated_date=now))
+        await db_session.commit()
+
+        async with AsyncClient(
+                transport=ASGITransport(app),
+                base_url="http://test",
+        ) as ac:
+            headers = {"Authorization": f"Bearer {create_task['data_user']['access_token']}"}
+
+            positions = []
+            cursor = None
+            for _ in range(3):  # страницы 2 + 2 + 1
+                params = {'project_id': create_task['project_id'], 'limit': 2}
+                if cursor:
+                    params['cursor'] = cursor
+                response = await ac.get("/get_tasks/", params=params, headers=headers)
+                assert response.status_code == 200
+                positions += [task['position_index'] for task in response.json()]
+                cursor = response.headers.get(NEXT_CURSOR_HEADER)
+
+            assert positions == [0, 1, 2, 3, 4]
+            assert cursor is None  # страница была последней
+
+            response = await ac.get("/get_tasks/", params={'priority': [1, 3]}, headers=headers)
+            assert response.status_code == 200
+            assert {task['priority'] for task in response.json()} == {1, 3}
+
+            response = await ac.get("/get_tasks/", params={'cursor': 'broken'}, headers=headers)
+            assert response.status_code == 400
+
+
+class TestConditionalGet:
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize('url', ['/get_projects/', '/get_tasks/'])
+    async def test_not_modified(self, url, create_task):
+        async with AsyncClient(transport=ASGITransport(app), base_url="http://test") as ac:
+            headers = {"Authorization": f"Bearer {create_task['data_user']['access_token']}"}
+            response = await ac.get(url, headers=headers)
+            assert response.status_code == 200
+            etag = response.headers['ETag']
+            assert 'Last-Modified' in response.headers
+
+            response = await ac.get(url, headers={**headers, 'If-None-Match': etag})
+            assert response.status_code == 304
+            assert response.content == b''
+            assert response.headers['ETag'] == etag
+
+            # другая страница или фильтр - другой ETag
+            response = await ac.get(url, params={'limit': 1}, headers={**headers, 'If-None-Match': etag})
+            assert response.status_code == 200
+
+    @pytest.mark.asyncio
+    async def test_etag_changes(self, db_session, create_task):
+        async with AsyncClient(transport=ASGITransport(app), base_url="http://test") as ac:
+            headers = {"Authorization": f"Bearer {create_task['data_user']['access_token']}"}
+            etags = [(await ac.get("/get_tasks/", headers=headers)).headers['ETag']]
+
+            await ac.post("/update_task", json={'task_id': create_task['task_id'], 'title': 'new'}, headers=headers)
+            etags.append((await ac.get("/get_tasks/", headers=headers)).headers['ETag'])
+
+            # просроченность без изменения updated_date
+            await db_session.execute(update(Task).where(Task.task_id == create_task['task_id'])
+                                     .values(desired_completion_date=datetime.now().astimezone() - timedelta(days=1)))
+            await db_session.commit()
+            etags.append((await ac.get("/get_tasks/", headers=headers)).headers['ETag'])
+
+            # архивация тоже не изменяет updated_date
+            await ac.post("/delete_task", params={'task_id': create_task['task_id']}, headers=headers)
+            response = await ac.get("/get_tasks/", headers={**headers, 'If-None-Match': etags[-1]})
+            assert response.status_code == 200
+            etags.append(response.headers['ETag'])
+
+        assert len(set(etags)) == 4
+
+    @pytest.mark.asyncio
+    async def test_etag_per_user(self, db_session, create_task):
+        async with AsyncClient(transport=ASGITransport(app), base_url="http://test") as ac:
+            headers = {"Authorization": f"Bearer {create_task['data_user']['access_token']}"}
+            etag = (await ac.get("/get_tasks/", headers=headers)).headers['ETag']
+
+            # запись другого пользователя не меняет версию
+            other = User(login='other_user_test', password='x', email='other_email_test@gmail.com',
+                         created_date=datetime.now(), last_login=datetime.now())
+            db_session.add(other)
+            await db_session.flush()
+            project = Project(user_id=other.user_id, title='other', description='other', position_index=0,
+                              created_date=datetime.now().astimezone())
+            db_session.add(project)
+            await db_session.commit()
+            response = await ac.get("/get_tasks/", headers={**headers, 'If-None-Match': etag})
+            assert response.status_code == 304
+
+            # запись в обход роутеров (как у фоновых задач) учитывается триггером
+            await db_session.execute(update(Task).where(Task.user_id == create_task['data_user']['user_id'])
+                                     .values(position_index=Task.position_index + 1))
+            await db_session.commit()
+            response = await ac.get("/get_tasks/", headers={**headers, 'If-None-Match': etag})
+            assert response.status_code == 200
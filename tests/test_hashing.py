@@ -0,0 +1,42 @@
+import threading
+
+import pytest
+
+from app.dependencies import hash_password, verify_password
+from app.hashing import PasswordHasher
+
+
+def current_thread_name() -> str:
+    return threading.current_thread().name
+
+
+class TestPasswordHasher:
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize('use_processes', [False, True])
+    async def test_round_trip(self, use_processes):
+        hasher = PasswordHasher(max_workers=2, max_concurrency=2, use_processes=use_processes)
+        try:
+            hashed = await hasher.run(hash_password, 'secret_password')
+            assert hashed != 'secret_password'
+            assert await hasher.run(verify_password, 'secret_password', hashed)
+            assert hasher._executor is not None  # вычисления шли через пул
+        finally:
+            hasher.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_wrong_password(self):
+        hasher = PasswordHasher(max_workers=1, max_concurrency=1)
+        try:
+            hashed = await hasher.run(hash_password, 'secret_password')
+            assert not await hasher.run(verify_password, 'wrong_password', hashed)
+            assert await hasher.run(current_thread_name) != current_thread_name()  # не в цикле событий
+        finally:
+            hasher.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_inline(self):
+        hasher = PasswordHasher(max_workers=0, max_concurrency=1)
+        hashed = await hasher.run(hash_password, 'secret_password')
+        assert await hasher.run(verify_password, 'secret_password', hashed)
+        assert await hasher.run(current_thread_name) == current_thread_name()
+        assert hasher._executor is None  # пул не создавался
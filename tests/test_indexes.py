@@ -0,0 +1,133 @@
+from datetime import datetime, timezone
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import select, update, func, text, tuple_
+
+from app.data_base.explain import explain, used_indexes, seq_scanned_tables
+from app.dependencies import overdue_condition
+from app.models.models import Project, Task, DeletedItem, SEARCH_TEXT_CONFIG
+
+USERS = 50
+PROJECTS_PER_USER = 10
+TASKS_PER_PROJECT = 50
+
+
+@pytest_asyncio.fixture
+async def seeded_db(db_session) -> dict:
+    """Заполняет БД данными, на которых планировщик выбирает индексы, и возвращает id одного проекта"""
+    await db_session.execute(text(
+        "INSERT INTO users (login, password, email, created_date, last_login) "
+        "SELECT 'explain_user_' || g, 'hash', 'explain_' || g || '@test.com', now(), now() "
+        "FROM generate_series(1, :users) g"
+    ), {'users': USERS})
+    await db_session.execute(text(
+        "INSERT INTO projects (user_id, position_index, title, status_id, created_date, desired_completion_date, updated_date) "
+        "SELECT u.user_id, p, 'project', CASE WHEN p = 0 THEN 4 ELSE 1 END, now(), now() + interval '1 day', now() "
+        "FROM users u, generate_series(0, :projects - 1) p"
+    ), {'projects': PROJECTS_PER_USER})
+    await db_session.execute(text(
+        "INSERT INTO tasks (user_id, project_id, position_index, priority, title, status_id, created_date, "
+        "desired_completion_date, updated_date) "
+        "SELECT pr.user_id, pr.project_id, t, t % 3 + 1, 'task', CASE WHEN t % 10 = 0 THEN 4 ELSE 1 END, now(), "
+        "now() + (t - 25) * interval '1 day', now() "
+        "FROM projects pr, generate_series(0, :tasks - 1) t"
+    ), {'tasks': TASKS_PER_PROJECT})
+    await db_session.commit()
+
+    for table in ('users', 'projects', 'tasks'):
+        await db_session.execute(text(f'ANALYZE {table}'))
+
+    project = (await db_session.execute(select(Project.user_id, Project.project_id).limit(1))).one()
+    return {'user_id': project.user_id, 'project_id': project.project_id}
+
+
+def query_shapes(user_id: int, project_id: int) -> dict:
+    """Запросы такой же формы как в app/routers (имя -> запрос)"""
+    now = datetime.now(timezone.utc)
+    return {
+        'active_projects': select(Project).where((Project.user_id == user_id) & (Project.status_id != 4)),
+        'max_project_position': select(func.max(Project.position_index))
+            .where((Project.user_id == user_id) & (Project.status_id != 4)),
+        'shift_projects': update(Project)
+            .where((Project.user_id == user_id) & (Project.status_id != 4) &
+                   (Project.position_index > 2) & (Project.position_index <= 5))
+            .values(position_index=Project.position_index - 1),
+        'all_tasks': select(Task).where(Task.user_id == user_id),
+        'tasks_page': select(Task)
+            .where((Task.user_id == user_id) & (Task.status_id != 4) &
+                   (tuple_(Task.position_index, Task.task_id) > tuple_(10, 0)))
+            .order_by(Task.position_index, Task.task_id).limit(101),
+        'project_tasks': select(Task)
+            .where((Task.user_id == user_id) & (Task.project_id == project_id) & (Task.status_id != 4)),
+        'max_task_position_in_project': select(func.max(Task.position_index))
+            .where((Task.user_id == user_id) & (Task.status_id != 4) & (Task.project_id == project_id)),
+        'max_task_position': select(func.max(Task.position_index))
+            .where((Task.user_id == user_id) & (Task.status_id != 4)),
+        'shift_tasks': update(Task)
+            .where((Task.user_id == user_id) & (Task.status_id != 4) &
+                   (Task.position_index >= 2) & (Task.position_index < 5))
+            .values(position_index=Task.position_index + 1),
+        'shift_tasks_after_delete': update(Task)
+            .where((Task.user_id == user_id) & (Task.project_id == project_id) & (Task.position_index > 3))
+            .values(position_index=Task.position_index - 1),
+        'task_rank_neighbours': select(Task.rank)
+            .where((Task.project_id == project_id) & (Task.task_id != 0) & (Task.status_id != 4))
+            .order_by(Task.rank, Task.task_id).offset(5).limit(2),
+        'tasks_rank_page': select(Task)
+            .where((Task.user_id == user_id) & (Task.status_id != 4) &
+                   (tuple_(Task.rank, Task.task_id) > tuple_('0', 0)))
+            .order_by(Task.rank, Task.task_id).limit(101),
+        'sync_tasks': select(Task)
+            .where((Task.user_id == user_id) & (tuple_(Task.updated_date, Task.task_id) > tuple_(now, 0)) &
+                   (Task.updated_date <= now))
+            .order_by(Task.updated_date, Task.task_id).limit(101),
+        'sync_projects': select(Project)
+            .where((Project.user_id == user_id) & (tuple_(Project.updated_date, Project.project_id) > tuple_(now, 0)) &
+                   (Project.updated_date <= now))
+            .order_by(Project.updated_date, Project.project_id).limit(101),
+        'sync_deleted': select(DeletedItem.item_type, DeletedItem.item_id)
+            .where((DeletedItem.user_id == user_id) &
+                   (tuple_(DeletedItem.deleted_date, DeletedItem.deleted_item_id) > tuple_(now, 0)) &
+                   (DeletedItem.deleted_date <= now))
+            .order_by(DeletedItem.deleted_date, DeletedItem.deleted_item_id).limit(101),
+        'archive_project_tasks': update(Task).where(Task.project_id == project_id).values(status_id=4),
+        'overdue_tasks': select(Task.task_id).where(overdue_condition(Task, now))
+            .order_by(Task.desired_completion_date).limit(1000),
+        'overdue_projects': select(Project.project_id).where(overdue_condition(Project, now))
+            .order_by(Project.desired_completion_date).limit(1000),
+    }
+
+
+class TestIndexes:
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize('shape', list(query_shapes(0, 0)))
+    async def test_query_uses_index(self, shape, db_session, seeded_db):
+        statement = query_shapes(seeded_db['user_id'], seeded_db['project_id'])[shape]
+
+        # запрещаем последовательное сканирование: если подходящего индекса нет, в плане всё равно останется Seq Scan
+        await db_session.execute(text('SET LOCAL enable_seqscan = off'))
+        plan = await explain(db_session, statement)
+        await db_session.rollback()
+
+        assert not seq_scanned_tables(plan) & {'projects', 'tasks', 'deleted_items'}, plan
+        assert used_indexes(plan), plan
+
+
+class TestSearchIndexes:
+    @pytest.mark.asyncio
+    async def test_search_uses_gin(self, db_session, seeded_db):
+        # у пользователя много задач: фильтр по user_id без GIN индекса читал бы их все
+        await db_session.execute(update(Task).values(user_id=seeded_db['user_id']))
+        await db_session.execute(
+            update(Task).where(Task.project_id == seeded_db['project_id']).values(title='unique')
+        )
+        await db_session.execute(text('ANALYZE tasks'))
+        statement = select(Task.task_id).where(
+            (Task.user_id == seeded_db['user_id']) &
+            Task.search_vector.bool_op('@@')(func.to_tsquery(SEARCH_TEXT_CONFIG, 'unique'))
+        )
+        plan = await explain(db_session, statement)
+        await db_session.rollback()
+
+        assert 'ix_tasks_search' in used_indexes(plan), plan
@@ -0,0 +1,180 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy import select, update, insert, func
+
+import app.jobs as jobs
+from app.jobs import claim_job, job_step, process_jobs
+from app.models.models import Project, Task, Job, DeletedItem
+from app.ranking import evenly_spaced_keys
+from app.run import app
+
+
+async def add_tasks(db_session, create_task, count: int):
+    """Добавляет в проект фикстуры count задач (всего задач станет count + 1)"""
+    now = datetime.now(timezone.utc)
+    await db_session.execute(insert(Task), [
+        {'user_id': create_task['data_user']['user_id'], 'project_id': create_task['project_id'], 'status_id': 1,
+         'position_index': index + 1, 'priority': 1, 'title': 'task', 'description': 'task',
+         'created_date': now, 'updated_date': now}
+        for index in range(count)
+    ])
+    await db_session.commit()
+
+
+class TestJobs:
+    @pytest.mark.asyncio
+    async def test_delete_project_background(self, db_session, create_task, monkeypatch):
+        monkeypatch.setattr(jobs, 'JOB_BATCH_SIZE', 2)
+        await add_tasks(db_session, create_task, 4)
+        project_id = create_task['project_id']
+        headers = {"Authorization": f"Bearer {create_task['data_user']['access_token']}"}
+
+        async with AsyncClient(transport=ASGITransport(app), base_url="http://test") as ac:
+            response = await ac.post("/delete_project", headers=headers,
+                                     params={"project_id": project_id, "complete_remove": True, "background": True})
+            assert response.status_code == 202
+            job = response.json()
+            assert (job['state'], job['total'], job['processed']) == ('queued', 5, 0)
+
+            # до выполнения задания проект скрыт и его нельзя менять
+            assert (await ac.get("/get_projects/", headers=headers)).json() == []
+            response = await ac.post("/recover_project", params={"project_id": project_id}, headers=headers)
+            assert response.status_code == 409
+
+            assert await process_jobs('test_worker') == 1
+            response = await ac.get("/jobs/", params={"job_id": job['job_id']}, headers=headers)
+            assert response.status_code == 200
+            assert response.json()['state'] == 'done'
+            assert response.json()['result'] == {'deleted_tasks': 5}
+
+        assert await db_session.get(Project, project_id) is None
+        assert (await db_session.execute(select(func.count()).where(Task.project_id == project_id))).scalar_one() == 0
+        deleted = await db_session.execute(select(func.count()).select_from(DeletedItem))
+        assert deleted.scalar_one() == 6  # задачи и проект для /sync
+
+    @pytest.mark.asyncio
+    async def test_tasks_of_deleted_project_hidden(self, create_task):
+        project_id, task_id = create_task['project_id'], create_task['task_id']
+        headers = {"Authorization": f"Bearer {create_task['data_user']['access_token']}"}
+
+        async with AsyncClient(transport=ASGITransport(app), base_url="http://test") as ac:
+            etag = (await ac.get("/get_tasks/", headers=headers)).headers['ETag']
+            response = await ac.get("/search/", params={"q": create_task['title']}, headers=headers)
+            assert [task['task_id'] for task in response.json()] == [task_id]
+            response = await ac.post("/delete_project", headers=headers,
+                                     params={"project_id": project_id, "complete_remove": True, "background": True})
+            assert response.status_code == 202
+
+            # задачи ещё в БД, но до выполнения задания не видны
+            response = await ac.get("/get_tasks/", headers={**headers, 'If-None-Match': etag})
+            assert (response.status_code, response.json()) == (200, [])
+            response = await ac.get("/get_tasks/", params={"task_id": task_id}, headers=headers)
+            assert response.status_code == 404
+            response = await ac.get("/search/", params={"q": create_task['title']}, headers=headers)
+            assert response.json() == []
+
+            # и не изменяются
+            response = await ac.post("/create_task", headers=headers,
+                                     json={"project_id": project_id, "title": "late", "description": "late"})
+            assert response.status_code == 409
+            response = await ac.post("/update_task", json={"task_id": task_id, "title": "new"}, headers=headers)
+            assert response.status_code == 409
+            response = await ac.post("/delete_task", params={"task_id": task_id}, headers=headers)
+            assert response.status_code == 409
+            response = await ac.post("/update_tasks_bulk", json={"tasks": [{"task_id": task_id, "title": "new"}]},
+                                     headers=headers)
+            assert response.json()['failed'] == 1
+            response = await ac.post("/delete_tasks_bulk", json={"task_ids": [task_id]}, headers=headers)
+            assert response.json()['failed'] == 1
+
+            assert await process_jobs('test_worker') == 1
+            response = await ac.get("/get_tasks/", params={"task_id": task_id}, headers=headers)
+            assert response.status_code == 404
+
+    @pytest.mark.asyncio
+    async def test_recover_resumes_after_crash(self, db_session, create_task, monkeypatch):
+        monkeypatch.setattr(jobs, 'JOB_BATCH_SIZE', 5)
+        await add_tasks(db_session, create_task, 11)
+        project_id = create_task['project_id']
+        headers = {"Authorization": f"Bearer {create_task['data_user']['access_token']}"}
+
+        async with AsyncClient(transport=ASGITransport(app), base_url="http://test") as ac:
+            await ac.post("/delete_project", params={"project_id": project_id}, headers=headers)
+            response = await ac.post("/recover_project", headers=headers,
+                                     params={"project_id": project_id, "background": True})
+            assert response.status_code == 202
+            job_id = response.json()['job_id']
+
+            # воркер выполнил одну пачку и упал
+            assert await claim_job('crashed_worker') == job_id
+            assert await job_step(job_id, 'crashed_worker')
+            assert await claim_job('test_worker') is None  # задание ещё не считается брошенным
+            await db_session.execute(update(Job).where(Job.job_id == job_id)
+                                     .values(heartbeat_date=datetime.now(timezone.utc) - timedelta(hours=1)))
+            await db_session.commit()
+
+            assert await process_jobs('test_worker') == 1
+            job = (await ac.get("/jobs/", params={"job_id": job_id}, headers=headers)).json()
+
+        assert (job['state'], job['processed']) == ('done', 12)
+        assert job['result']['recovered_tasks']['by_status']['in_progress'] == 12
+        result = await db_session.execute(
+            select(Task.position_index, Task.rank).where(Task.project_id == project_id)
+            .order_by(Task.position_index).execution_options(populate_existing=True)
+        )
+        assert [tuple(row) for row in result.all()] == list(zip(range(12), evenly_spaced_keys(12)))
+        project = await db_session.get(Project, project_id, populate_existing=True)
+        assert project.status_id == 1  # проект восстановлен последней пачкой
+
+    @pytest.mark.asyncio
+    async def test_failed_job(self, db_session, create_task, monkeypatch):
+        async def broken_step(db, job, now):
+            raise RuntimeError("broken")
+        monkeypatch.setitem(jobs.JOB_KINDS, 'delete_project', broken_step)
+        monkeypatch.setattr(jobs, 'JOB_MAX_ATTEMPTS', 2)
+        headers = {"Authorization": f"Bearer {create_task['data_user']['access_token']}"}
+
+        async with AsyncClient(transport=ASGITransport(app), base_url="http://test") as ac:
+            response = await ac.post("/delete_project", headers=headers, params={
+                "project_id": create_task['project_id'], "complete_remove": True, "background": True})
+            job_id = response.json()['job_id']
+
+            assert await process_jobs('test_worker') == 2  # вторая попытка после возврата в очередь
+            job = (await ac.get("/jobs/", params={"job_id": job_id}, headers=headers)).json()
+        assert (job['state'], job['error']) == ('failed', 'broken')
+
+    @pytest.mark.asyncio
+    async def test_background_requires_complete_remove(self, create_project):
+        headers = {"Authorization": f"Bearer {create_project['data_user']['access_token']}"}
+        async with AsyncClient(transport=ASGITransport(app), base_url="http://test") as ac:
+            response = await ac.post("/delete_project", headers=headers,
+                                     params={"project_id": create_project['project_id'], "background": True})
+        assert response.status_code == 400
+
+    @pytest.mark.asyncio
+    async def test_worker_pool(self, create_task, monkeypatch):
+        pool = jobs.job_workers  # его будят эндпоинты
+        monkeypatch.setattr(pool, 'workers', 2)
+        monkeypatch.setattr(pool, 'poll_interval', 60)
+        headers = {"Authorization": f"Bearer {create_task['data_user']['access_token']}"}
+        pool.start()
+        try:
+            async with AsyncClient(transport=ASGITransport(app), base_url="http://test") as ac:
+                response = await ac.post("/delete_project", headers=headers, params={
+                    "project_id": create_task['project_id'], "complete_remove": True, "background": True})
+                job_id = response.json()['job_id']
+
+                for _ in range(50):  # notify будит воркер сразу, не дожидаясь poll_interval
+                    job = (await ac.get("/jobs/", params={"job_id": job_id}, headers=headers)).json()
+                    if job['state'] == 'done':
+                        break
+                    await asyncio.sleep(0.05)
+                assert job['state'] == 'done'
+
+                other = await ac.get("/jobs/", params={"job_id": job_id + 1}, headers=headers)
+                assert other.status_code == 404
+        finally:
+            await pool.stop()
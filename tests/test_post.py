@@ -1,11 +1,12 @@
 import datetime
-
 import pytest
 from httpx import AsyncClient, ASGITransport
 
 from pyasn1.type.univ import Boolean
-from sqlalchemy import select, update, cast, Boolean
+from sqlalchemy import select, update, insert, cast, Boolean
+from app.dependencies import load_statuses, status_response
 from app.models.models import User, Project, Task
+from app.ranking import evenly_spaced_keys
 from app.run import app
 
 class TestPostGeneral:
@@ -87,10 +88,17 @@ class TestPostGeneral:
                 transport=ASGITransport(app),
                 base_url="http://test",
         ) as ac:
-            response = await ac.post("/refresh_token", json={"refresh_token": create_user['access_token']})
+            tokens = (await ac.post("/token", data={"username": create_user['user_name'],
+                                                    "password": create_user['password']})).json()
+            response = await ac.post("/refresh_token", json={"refresh_token": tokens['refresh_token']})
             assert response.status_code == 200
             data = response.json()
             assert data['access_token']
+            assert data['refresh_token'] != tokens['refresh_token']
+
+            # access token не является refresh токеном
+            response = await ac.post("/refresh_token", json={"refresh_token": create_user['access_token']})
+            assert response.status_code == 401
 
 
 class TestPostProject:
@@ -117,6 +125,37 @@ class TestPostProject:
             assert result_db.desired_completion_date == datetime.datetime.fromisoformat(
                 "2025-06-26T19:00:30.164").replace(tzinfo=datetime.timezone.utc)
 
+    @pytest.mark.asyncio
+    async def test_create_task_positions(self, db_session, create_task):
+        headers = {"Authorization": f"Bearer {create_task['data_user']['access_token']}"}
+        async with AsyncClient(transport=ASGITransport(app), base_url="http://test") as ac:
+            created = [(await ac.post("/create_task", headers=headers, json={
+                "project_id": create_task['project_id'], 'title': 'test', 'description': 'test', 'priority': 3
+            })).json() for _ in range(2)]
+            assert [task['position_index'] for task in created] == [1, 2]  # после задачи из фикстуры
+            assert [task['priority'] for task in created] == [3, 3]
+            assert created[0]['status']['status_id'] == 1
+
+            response = await ac.post("/create_task", headers=headers, json={
+                "project_id": create_task['project_id'] + 1, 'title': 'test', 'description': 'test'})
+            assert response.status_code == 404  # такого проекта нет, задача не создана
+
+        result = await db_session.execute(select(Task.task_id).where(Task.project_id == create_task['project_id']))
+        assert len(result.all()) == 3
+
+    @pytest.mark.asyncio
+    async def test_create_task_null_priority(self, create_task):
+        headers = {"Authorization": f"Bearer {create_task['data_user']['access_token']}"}
+        async with AsyncClient(transport=ASGITransport(app), base_url="http://test") as ac:
+            response = await ac.post("/create_task", headers=headers, json={
+                "project_id": create_task['project_id'], 'title': 'test', 'description': 'test', 'priority': None})
+            assert response.status_code == 200
+            assert response.json()['priority'] == 1
+
+            response = await ac.get("/get_tasks/", headers=headers)  # строка читается обратно
+            assert response.status_code == 200
+            assert [task['priority'] for task in response.json()] == [1, 1]
+
 
 
     @pytest.mark.asyncio
@@ -204,6 +243,61 @@ class TestPostProject:
             assert result_db
             assert result_db.status_id != 4 # не равен "удалён"
 
+    @pytest.mark.asyncio
+    async def test_recover_project_statuses(self, db_session, create_task):
+        past = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=1)
+        await db_session.execute(update(Project).where(Project.project_id == create_task['project_id'])
+                                 .values(status_id=4, position_index=-1, actual_completion_date=past))
+        await db_session.execute(update(Task).where(Task.task_id == create_task['task_id'])
+                                 .values(status_id=4, position_index=-1, desired_completion_date=past))
+        await db_session.commit()
+
+        async with AsyncClient(transport=ASGITransport(app), base_url="http://test") as ac:
+            response = await ac.post("/recover_project",
+                                     params={"project_id": create_task['project_id']},
+                                     headers={"Authorization": f"Bearer {create_task['data_user']['access_token']}"})
+            assert response.status_code == 200
+            assert response.json()['status']['status_id'] == 2  # завершён (есть дата завершения)
+
+        result = await db_session.execute(select(Project.status_id, Task.status_id)
+                                          .join(Task, Task.project_id == Project.project_id)
+                                          .where(Project.project_id == create_task['project_id']))
+        assert result.one() == (2, 3)  # задача просрочена
+
+    @pytest.mark.asyncio
+    async def test_recover_project_many_tasks(self, db_session, create_task):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        past = now - datetime.timedelta(days=1)
+        await db_session.execute(insert(Task), [
+            {'user_id': create_task['data_user']['user_id'], 'project_id': create_task['project_id'], 'status_id': 1,
+             'position_index': index + 1, 'priority': 1, 'title': 'task', 'description': 'task',
+             'created_date': now, 'updated_date': now,
+             'actual_completion_date': now if index % 3 == 0 else None, 'desired_completion_date': past}
+            for index in range(24)
+        ])
+        await db_session.commit()
+        headers = {"Authorization": f"Bearer {create_task['data_user']['access_token']}"}
+
+        async with AsyncClient(transport=ASGITransport(app), base_url="http://test") as ac:
+            await ac.post("/delete_project", params={"project_id": create_task['project_id']}, headers=headers)
+            response = await ac.post("/recover_project", headers=headers,
+                                     params={"project_id": create_task['project_id'], "tasks_limit": 10})
+            assert response.status_code == 200
+            data = response.json()
+            assert data['recovered_tasks']['total'] == 25
+            assert data['recovered_tasks']['by_status'] == {'in_progress': 1, 'completed': 8, 'overdue': 16, 'archived': 0}
+            assert [task['position_index'] for task in data['tasks']] == list(range(10))
+
+            # следующая страница - через /get_tasks/ по курсору из ответа
+            next_page = await ac.get("/get_tasks/", headers=headers, params={
+                "project_id": create_task['project_id'], "cursor": response.headers['X-Next-Cursor']})
+            assert [task['position_index'] for task in next_page.json()] == list(range(10, 25))
+
+        result = await db_session.execute(select(Task.rank).where(Task.project_id == create_task['project_id'])
+                                          .order_by(Task.position_index)
+                                          .execution_options(populate_existing=True))
+        assert result.scalars().all() == evenly_spaced_keys(25)  # ключи из SQL совпадают с ключами из Python
+
 
 
 class TestPostTask:
@@ -321,4 +415,122 @@ class TestPostTask:
             result_db = query.scalar_one_or_none()
 
             assert result_db
-            assert result_db.status_id != 4  # не равен "удалён"
\ No newline at end of file
+            assert result_db.status_id != 4  # не равен "удалён"
+
+    @pytest.mark.asyncio
+    async def test_recover_overdue_task(self, db_session, create_task):
+        async with AsyncClient(transport=ASGITransport(app), base_url="http://test") as ac:
+            await db_session.execute(update(Task).where(Task.task_id == create_task['task_id']).values(
+                status_id=4, position_index=-1,
+                desired_completion_date=datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=1)
+            ))
+            await db_session.commit()
+
+            response = await ac.post("/recover_task", params={"task_id": create_task['task_id']},
+                                     headers={"Authorization": f"Bearer {create_task['data_user']['access_token']}"})
+            assert response.status_code == 200
+            assert response.json()['status']['status_id'] == 3  # статус по датам, как при восстановлении проекта
+
+        result_db = await db_session.get(Task, create_task['task_id'], populate_existing=True)
+        assert result_db.status_id == 3
+
+class TestPostTaskBulk:
+    @pytest.mark.asyncio
+    async def test_tasks_bulk(self, db_session, create_task):
+        async with AsyncClient(
+                transport=ASGITransport(app),
+                base_url="http://test",
+        ) as ac:
+            headers = {"Authorization": f"Bearer {create_task['data_user']['access_token']}",
+                       "Content-Type": "application/json"}
+
+            response = await ac.post("/create_tasks_bulk",
+                                     json={"tasks": [
+                                         {"project_id": create_task['project_id'], "title": "bulk_1", "description": "d", "priority": 2},
+                                         {"project_id": -1, "title": "bulk_bad", "description": "d"},
+                                         {"project_id": create_task['project_id'], "title": "bulk_2", "description": "d"},
+                                     ]},
+                                     headers=headers)
+            assert response.status_code == 200
+            data = response.json()
+            assert data['succeeded'] == 2
+            assert data['failed'] == 1
+            assert not data['results'][1]['success']
+            created = [data['results'][0]['task'], data['results'][2]['task']]
+            assert [task['position_index'] for task in created] == [1, 2]  # после задачи из фикстуры
+            assert created[0]['priority'] == 2
+            assert created[0]['status']['name'] == 'in_progress'
+
+            response = await ac.post("/update_tasks_bulk",
+                                     json={"tasks": [
+                                         {"task_id": created[0]['task_id'], "title": "bulk_1_new", "priority": 3},
+                                         {"task_id": -1, "title": "missing"},
+                                         {"task_id": created[1]['task_id'], "actual_completion_date": "2025-06-28T07:45:39.971Z"},
+                                     ]},
+                                     headers=headers)
+            assert response.status_code == 200
+            data = response.json()
+            assert data['succeeded'] == 2
+            assert data['results'][0]['task']['title'] == 'bulk_1_new'
+            assert data['results'][0]['task']['priority'] == 3
+            assert data['results'][2]['task']['status']['status_id'] == 2  # завершена
+
+            response = await ac.post("/delete_tasks_bulk",
+                                     json={"task_ids": [create_task['task_id'], created[0]['task_id'], -1]},
+                                     headers=headers)
+            assert response.status_code == 200
+            data = response.json()
+            assert data['succeeded'] == 2
+            assert data['failed'] == 1
+
+            # оставшаяся задача переместилась на первую позицию
+            query = await db_session.execute(select(Task).where(cast(Task.task_id == created[1]['task_id'], Boolean)))
+            remaining = query.scalar_one()
+            await db_session.refresh(remaining)
+            assert remaining.position_index == 0
+
+            query = await db_session.execute(select(Task).where(cast(Task.task_id == created[0]['task_id'], Boolean)))
+            archived = query.scalar_one()
+            await db_session.refresh(archived)
+            assert archived.status_id == 4
+
+    @pytest.mark.asyncio
+    async def test_create_tasks_bulk_null_priority(self, create_task):
+        headers = {"Authorization": f"Bearer {create_task['data_user']['access_token']}"}
+        async with AsyncClient(transport=ASGITransport(app), base_url="http://test") as ac:
+            response = await ac.post("/create_tasks_bulk", headers=headers, json={"tasks": [
+                {"project_id": create_task['project_id'], "title": "bulk", "description": "d", "priority": None}]})
+            assert response.status_code == 200
+            assert response.json()['results'][0]['task']['priority'] == 1
+
+            response = await ac.get("/get_tasks/", headers=headers)  # строка читается обратно
+            assert response.status_code == 200
+            assert [task['priority'] for task in response.json()] == [1, 1]
+
+
+class TestStatusLookup:
+    @pytest.mark.asyncio
+    async def test_load_statuses(self):
+        await load_statuses()
+        assert status_response(1).name == 'in_progress'
+        assert status_response(4).name == 'deleted'
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize('url, body, max_queries', [
+        ('/create_project', lambda task: {'title': 'new', 'description': 'new'}, 3),
+        ('/create_task', lambda task: {'project_id': task['project_id'], 'title': 'new', 'description': 'new'}, 4),
+        ('/update_project', lambda task: {'project_id': task['project_id'], 'title': 'new'}, 3),
+        ('/update_task', lambda task: {'task_id': task['task_id'], 'title': 'new'}, 3),
+    ])
+    async def test_write_endpoints_skip_statuses(self, url, body, max_queries, create_task, assert_max_queries):
+        headers = {"Authorization": f"Bearer {create_task['data_user']['access_token']}"}
+        async with AsyncClient(transport=ASGITransport(app), base_url="http://test") as ac:
+            await ac.get("/get_projects/", headers=headers)  # пользователь попадает в кэш
+
+            # раньше каждый из этих эндпоинтов делал ещё и SELECT из statuses
+            with assert_max_queries(max_queries) as stats:
+                response = await ac.post(url, json=body(create_task), headers=headers)
+            assert response.status_code == 200
+            assert response.json()['status']['name'] == 'in_progress'
+
+        assert not [statement for statement in stats.statements if 'statuses' in statement]
@@ -0,0 +1,80 @@
+import json
+import logging
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+
+from app.run import app
+
+
+class TestQueryMetrics:
+    @pytest.mark.asyncio
+    async def test_server_timing_header(self, create_task, caplog):
+        headers = {"Authorization": f"Bearer {create_task['data_user']['access_token']}"}
+        async with AsyncClient(transport=ASGITransport(app), base_url="http://test") as ac:
+            await ac.get("/get_tasks/", headers=headers)  # пользователь попадает в кэш
+
+            with caplog.at_level(logging.INFO, logger='app.queries'):
+                response = await ac.get("/get_tasks/", headers=headers)
+
+        assert response.status_code == 200
+        # версия задач (ETag) и страница задач
+        assert 'desc="2 queries, 2 rows"' in response.headers['Server-Timing']
+        assert 'db-slowest;dur=' in response.headers['Server-Timing']
+
+        record = json.loads(caplog.records[-1].getMessage())
+        assert record['path'] == '/get_tasks/'
+        assert record['status'] == 200
+        assert record['queries'] == 2
+        assert record['rows'] == 2
+        assert record['slowest_statement'].startswith('SELECT')
+
+
+class TestQueryBudget:
+    """Максимальное количество запросов к БД у эндпоинтов (пользователь уже в кэше)"""
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize('method, url, request_args, max_queries', [
+        ('get', '/get_projects/', lambda task: {}, 2),
+        ('get', '/get_tasks/', lambda task: {}, 2),
+        ('post', '/update_task', lambda task: {'json': {'task_id': task['task_id'], 'position_index': 0}}, 4),
+        ('post', '/delete_task', lambda task: {'params': {'task_id': task['task_id']}}, 3),
+        ('post', '/delete_project', lambda task: {'params': {'project_id': task['project_id']}}, 4),
+        # INSERT ... RETURNING: позиция и проверка проекта в том же запросе, без refresh после commit
+        ('post', '/create_project', lambda task: {'json': {'title': 'new', 'description': 'new'}}, 1),
+        ('post', '/create_task', lambda task: {'json': {'project_id': task['project_id'], 'title': 'new',
+                                                        'description': 'new'}}, 1),
+    ])
+    async def test_query_budget(self, method, url, request_args, max_queries, create_task, assert_max_queries):
+        headers = {"Authorization": f"Bearer {create_task['data_user']['access_token']}"}
+        async with AsyncClient(transport=ASGITransport(app), base_url="http://test") as ac:
+            await ac.get("/get_projects/", headers=headers)
+
+            with assert_max_queries(max_queries):
+                response = await getattr(ac, method)(url, headers=headers, **request_args(create_task))
+            assert response.status_code == 200
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize('url', ['/get_projects/', '/get_tasks/'])
+    async def test_not_modified_budget(self, url, create_task, assert_max_queries):
+        headers = {"Authorization": f"Bearer {create_task['data_user']['access_token']}"}
+        async with AsyncClient(transport=ASGITransport(app), base_url="http://test") as ac:
+            etag = (await ac.get(url, headers=headers)).headers['ETag']
+
+            with assert_max_queries(1):  # только версия, строки не загружаются
+                response = await ac.get(url, headers={**headers, 'If-None-Match': etag})
+            assert response.status_code == 304
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize('url, params, max_queries', [
+        ('/recover_task', lambda task: {'task_id': task['task_id']}, 3),
+        ('/recover_project', lambda task: {'project_id': task['project_id']}, 4),
+    ])
+    async def test_recover_budget(self, url, params, max_queries, create_task, assert_max_queries):
+        headers = {"Authorization": f"Bearer {create_task['data_user']['access_token']}"}
+        async with AsyncClient(transport=ASGITransport(app), base_url="http://test") as ac:
+            await ac.post("/delete_project", params={'project_id': create_task['project_id']}, headers=headers)
+
+            with assert_max_queries(max_queries):
+                response = await ac.post(url, params=params(create_task), headers=headers)
+            assert response.status_code == 200
@@ -0,0 +1,170 @@
+import random
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy import select
+
+import app.ranking as ranking
+from app.background import rebalance_ranks
+from app.models.models import Project, Task
+from app.ranking import key_between, key_after, evenly_spaced_keys, RANK_MAX_LENGTH
+from app.run import app
+
+
+class TestRankKeys:
+    def test_key_between(self):
+        keys = [key_after(None)]
+        for _ in range(500):  # вставки в случайные места списка
+            position = random.randint(0, len(keys))
+            before = keys[position - 1] if position > 0 else None
+            after = keys[position] if position < len(keys) else None
+            keys.insert(position, key_between(before, after))
+        assert keys == sorted(keys)
+        assert len(set(keys)) == len(keys)
+
+    def test_key_after_keeps_length(self):
+        key = None
+        for _ in range(1000):
+            new_key = key_after(key)
+            assert key is None or new_key > key
+            key = new_key
+        assert len(key) <= RANK_MAX_LENGTH
+
+    def test_evenly_spaced_keys(self):
+        keys = evenly_spaced_keys(10000)
+        assert keys == sorted(keys)
+        assert len(set(keys)) == len(keys)
+        assert key_between(keys[0], keys[1]) < keys[1]
+
+
+class TestRankMode:
+    @pytest.fixture
+    def rank_mode(self, monkeypatch):
+        monkeypatch.setattr(ranking, 'ORDERING_MODE', 'rank')
+
+    async def task_ranks(self, db_session, project_id: int) -> dict:
+        result = await db_session.execute(
+            select(Task.task_id, Task.rank, Task.position_index)
+            .where(Task.project_id == project_id)
+            .execution_options(populate_existing=True)
+        )
+        return {row.task_id: (row.rank, row.position_index) for row in result.all()}
+
+    @pytest.mark.asyncio
+    async def test_move_task_changes_one_row(self, db_session, create_project, rank_mode):
+        headers = {"Authorization": f"Bearer {create_project['data_user']['access_token']}"}
+        await rebalance_ranks()  # проект создан фикстурой без ключа
+        project_rank = (await db_session.execute(
+            select(Project.rank).where(Project.project_id == create_project['project_id']))).scalar_one()
+        assert project_rank is not None
+
+        async with AsyncClient(transport=ASGITransport(app), base_url="http://test") as ac:
+            response = await ac.post("/create_tasks_bulk",
+                                     json={"tasks": [{"project_id": create_project['project_id'], "title": f"task_{i}",
+                                                      "description": "rank"} for i in range(5)]},
+                                     headers=headers)
+            assert response.status_code == 200
+            task_ids = [result['task_id'] for result in response.json()['results']]
+
+            before = await self.task_ranks(db_session, create_project['project_id'])
+            assert [before[task_id][0] for task_id in task_ids] == sorted(before[task_id][0] for task_id in task_ids)
+
+            # последняя задача становится второй
+            response = await ac.post("/update_task", json={"task_id": task_ids[4], "position_index": 1},
+                                     headers=headers)
+            assert response.status_code == 200
+
+            after = await self.task_ranks(db_session, create_project['project_id'])
+            changed = [task_id for task_id in task_ids if before[task_id] != after[task_id]]
+            assert changed == [task_ids[4]]  # остальные строки не изменились
+
+            expected = [task_ids[0], task_ids[4], task_ids[1], task_ids[2], task_ids[3]]
+            response = await ac.get("/get_tasks/", params={"project_id": create_project['project_id']},
+                                    headers=headers)
+            assert [task['task_id'] for task in response.json()] == expected
+
+        # фоновая задача пересчитывает position_index по ключам
+        result = await rebalance_ranks()
+        assert result['positions'] > 0
+        synced = await self.task_ranks(db_session, create_project['project_id'])
+        assert [synced[task_id][1] for task_id in expected] == list(range(5))
+
+    @pytest.mark.asyncio
+    async def test_repeated_moves_to_front(self, db_session, create_project, rank_mode):
+        headers = {"Authorization": f"Bearer {create_project['data_user']['access_token']}"}
+        async with AsyncClient(transport=ASGITransport(app), base_url="http://test") as ac:
+            response = await ac.post("/create_tasks_bulk",
+                                     json={"tasks": [{"project_id": create_project['project_id'], "title": f"task_{i}",
+                                                      "description": "rank"} for i in range(3)]},
+                                     headers=headers)
+            task_ids = [result['task_id'] for result in response.json()['results']]
+
+            # каждый раз в начало переносится последняя задача: ключ первой позиции всё время укорачивает промежуток
+            moves = [{"task_id": task_ids[index % 3], "position_index": 0} for index in range(2, 302)]
+            response = await ac.post("/update_tasks_bulk", json={"tasks": moves}, headers=headers)
+            assert response.json()['succeeded'] == 300
+
+            response = await ac.get("/get_tasks/", params={"project_id": create_project['project_id']},
+                                    headers=headers)
+            assert [task['task_id'] for task in response.json()] == [task_ids[1], task_ids[0], task_ids[2]]
+
+        ranks = await self.task_ranks(db_session, create_project['project_id'])
+        assert max(len(rank) for rank, _ in ranks.values()) <= RANK_MAX_LENGTH
+
+    @pytest.mark.asyncio
+    async def test_rebalance_skips_locked_and_keeps_updated_date(self, db_session, create_project, rank_mode):
+        headers = {"Authorization": f"Bearer {create_project['data_user']['access_token']}"}
+        await rebalance_ranks()
+        async with AsyncClient(transport=ASGITransport(app), base_url="http://test") as ac:
+            response = await ac.post("/create_tasks_bulk",
+                                     json={"tasks": [{"project_id": create_project['project_id'], "title": f"task_{i}",
+                                                      "description": "rank"} for i in range(3)]},
+                                     headers=headers)
+            task_ids = [result['task_id'] for result in response.json()['results']]
+            await ac.post("/update_task", json={"task_id": task_ids[2], "position_index": 0}, headers=headers)
+
+        updated = select(Task.task_id, Task.updated_date).where(Task.project_id == create_project['project_id'])
+        before = dict((await db_session.execute(updated)).all())
+        await db_session.commit()
+
+        # строка группы заблокирована другой транзакцией - группа пропускается целиком
+        await db_session.execute(select(Task.task_id).where(Task.task_id == task_ids[0]).with_for_update())
+        assert await rebalance_ranks() == {'projects': 0, 'tasks': 0, 'positions': 0}
+        await db_session.rollback()
+
+        result = await rebalance_ranks()
+        assert (result['tasks'], result['positions']) == (0, 2)  # ключи не перестраивались, сдвинулись две позиции
+        synced = await self.task_ranks(db_session, create_project['project_id'])
+        assert [synced[task_id][1] for task_id in (task_ids[2], task_ids[0], task_ids[1])] == [0, 1, 2]
+        after = dict((await db_session.execute(updated.execution_options(populate_existing=True))).all())
+        assert after == before  # пересчёт position_index не сбрасывает курсоры /sync
+        assert await rebalance_ranks() == {'projects': 0, 'tasks': 0, 'positions': 0}
+
+    @pytest.mark.asyncio
+    async def test_rebalance_fills_ranks_from_positions(self, db_session, create_task):
+        await rebalance_ranks()
+
+        task = await self.task_ranks(db_session, create_task['project_id'])
+        assert task[create_task['task_id']][0] is not None
+        assert await rebalance_ranks() == {'projects': 0, 'tasks': 0, 'positions': 0}
+
+    @pytest.mark.asyncio
+    async def test_bulk_moves_in_one_request(self, db_session, create_project, rank_mode):
+        headers = {"Authorization": f"Bearer {create_project['data_user']['access_token']}"}
+        async with AsyncClient(transport=ASGITransport(app), base_url="http://test") as ac:
+            response = await ac.post("/create_tasks_bulk",
+                                     json={"tasks": [{"project_id": create_project['project_id'], "title": f"task_{i}",
+                                                      "description": "rank"} for i in range(3)]},
+                                     headers=headers)
+            task_ids = [result['task_id'] for result in response.json()['results']]
+
+            # обе задачи перемещаются в начало: вторая должна учитывать уже перемещённую первую
+            response = await ac.post("/update_tasks_bulk",
+                                     json={"tasks": [{"task_id": task_ids[1], "position_index": 0},
+                                                     {"task_id": task_ids[2], "position_index": 0}]},
+                                     headers=headers)
+            assert response.json()['succeeded'] == 2
+
+            response = await ac.get("/get_tasks/", params={"project_id": create_project['project_id']},
+                                    headers=headers)
+            assert [task['task_id'] for task in response.json()] == [task_ids[2], task_ids[1], task_ids[0]]
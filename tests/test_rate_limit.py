@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+
+import app.rate_limit as rate_limit
+from app.middleware import RateLimitMiddleware
+from app.rate_limit import LocalRateLimitStore
+from app.run import app
+
+
+class TestTokenBucket:
+    @pytest.mark.asyncio
+    async def test_consume_and_refill(self):
+        now = [0.0]
+        store = LocalRateLimitStore(max_keys=10, clock=lambda: now[0])
+
+        assert await store.consume('a', 6, capacity=10, refill_rate=2) == 0
+        assert await store.consume('a', 6, capacity=10, refill_rate=2) == 1  # осталось 4, не хватает 2 жетонов
+        assert await store.consume('b', 6, capacity=10, refill_rate=2) == 0  # у другого ключа своя корзина
+
+        now[0] = 1.0
+        assert await store.consume('a', 6, capacity=10, refill_rate=2) == 0
+        now[0] = 100.0  # корзина не наполняется больше capacity
+        assert await store.consume('a', 10, capacity=10, refill_rate=2) == 0
+        assert await store.consume('a', 1, capacity=10, refill_rate=2) == 0.5
+
+    @pytest.mark.asyncio
+    async def test_cost_above_capacity(self):
+        now = [0.0]
+        store = LocalRateLimitStore(max_keys=10, clock=lambda: now[0])
+
+        # стоимость больше размера корзины ограничивается capacity: запрос проходит с полной корзиной
+        assert await store.consume('a', 20, capacity=10, refill_rate=2) == 0
+        assert await store.consume('a', 20, capacity=10, refill_rate=2) == 5  # через 5 секунд корзина снова полная
+        now[0] = 5.0
+        assert await store.consume('a', 20, capacity=10, refill_rate=2) == 0
+
+    @pytest.mark.asyncio
+    async def test_refund(self):
+        store = LocalRateLimitStore(max_keys=10, clock=lambda: 0.0)
+
+        assert await store.consume('a', 8, capacity=10, refill_rate=1) == 0
+        await store.refund('a', 8, capacity=10)
+        assert await store.consume('a', 10, capacity=10, refill_rate=1) == 0
+        await store.refund('a', 20, capacity=10)  # не больше capacity
+        assert await store.consume('a', 11, capacity=10, refill_rate=1) == 0
+        assert await store.consume('a', 1, capacity=10, refill_rate=1) == 1
+
+    @pytest.mark.asyncio
+    async def test_evicts_least_recent(self):
+        store = LocalRateLimitStore(max_keys=2)
+        for key in ('a', 'b', 'c'):
+            await store.consume(key, 1, capacity=10, refill_rate=1)
+        assert len(store) == 2
+
+
+    def test_route_costs_match_routes(self):
+        paths = {route.path for route in app.routes}
+        assert set(rate_limit.ROUTE_COSTS) <= paths  # опечатка в пути делала запрос дешёвым
+
+
+class TestRateLimitMiddleware:
+    @pytest.mark.asyncio
+    async def test_route_cost_per_client(self, create_user, monkeypatch):
+        monkeypatch.setattr(rate_limit, 'RATE_LIMIT_CAPACITY', 20)
+        monkeypatch.setattr(rate_limit, 'RATE_LIMIT_REFILL_RATE', 0.01)
+        login = {"username": create_user['user_name'], "password": "wrong"}
+        async with AsyncClient(transport=ASGITransport(app), base_url="http://test") as ac:
+            # /token стоит 10 жетонов: третья попытка подбора пароля с одного IP отклоняется без bcrypt
+            assert (await ac.post("/token", data=login)).status_code == 401
+            assert (await ac.post("/token", data=login)).status_code == 401
+            response = await ac.post("/token", data=login)
+            assert response.status_code == 429
+            assert int(response.headers['Retry-After']) > 0
+
+            # у пользователя с токеном своя корзина
+            headers = {"Authorization": f"Bearer {create_user['access_token']}"}
+            assert (await ac.get("/get_projects/", headers=headers)).status_code == 200
+
+    @pytest.mark.asyncio
+    async def test_concurrency_cap(self, monkeypatch):
+        monkeypatch.setattr(rate_limit, 'MAX_CONCURRENT_REQUESTS', 1)
+        monkeypatch.setattr(rate_limit, 'ADMISSION_TIMEOUT', 0.05)
+        store = LocalRateLimitStore(max_keys=10, clock=lambda: 0.0)
+        monkeypatch.setattr(rate_limit, 'rate_limit_store', store)
+        started, release = asyncio.Event(), asyncio.Event()
+
+        async def slow_app(scope, receive, send):
+            started.set()
+            await release.wait()
+            await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+            await send({'type': 'http.response.body', 'body': b''})
+
+        async with AsyncClient(transport=ASGITransport(RateLimitMiddleware(slow_app)), base_url="http://test") as ac:
+            first = asyncio.create_task(ac.get("/"))
+            await started.wait()
+            response = await ac.get("/")  # место занято дольше ADMISSION_TIMEOUT
+            assert response.status_code == 503
+            assert response.headers['Retry-After'] == '1'
+            # жетоны отклонённого запроса вернулись: из полной корзины списан только первый запрос
+            assert store._buckets['ip:127.0.0.1'][0] == rate_limit.RATE_LIMIT_CAPACITY - 1
+
+            release.set()
+            assert (await first).status_code == 200
+            assert (await ac.get("/")).status_code == 200  # место освободилось
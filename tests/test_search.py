@@ -0,0 +1,103 @@
+import pytest
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy import update
+
+import app.search as search
+from app.models.models import Task
+from app.pagination import NEXT_CURSOR_HEADER
+from app.run import app
+
+
+async def create_tasks(ac, headers: dict, project_id: int, tasks: list[tuple[str, str]]) -> list[int]:
+    """:return: id созданных задач (название, описание)"""
+    ids = []
+    for title, description in tasks:
+        response = await ac.post("/create_task", headers=headers, json={
+            "project_id": project_id, "title": title, "description": description
+        })
+        ids.append(response.json()['task_id'])
+    return ids
+
+
+class TestSearch:
+    @pytest.mark.asyncio
+    async def test_ranked_by_relevance(self, create_project):
+        headers = {"Authorization": f"Bearer {create_project['data_user']['access_token']}"}
+        async with AsyncClient(transport=ASGITransport(app), base_url="http://test") as ac:
+            in_description, in_title, other = await create_tasks(ac, headers, create_project['project_id'], [
+                ("Buy milk", "prepare the report for accounting"),
+                ("Quarterly report", "collect numbers"),
+                ("Call mom", "evening"),
+            ])
+            response = await ac.get("/search/", params={'q': 'reports'}, headers=headers)  # стемминг: reports -> report
+
+        assert response.status_code == 200
+        assert [task['task_id'] for task in response.json()] == [in_title, in_description]
+        assert response.json()[0]['status']['name'] == 'in_progress'
+
+    @pytest.mark.asyncio
+    async def test_prefix_and_all_terms(self, create_project):
+        headers = {"Authorization": f"Bearer {create_project['data_user']['access_token']}"}
+        async with AsyncClient(transport=ASGITransport(app), base_url="http://test") as ac:
+            report, _ = await create_tasks(ac, headers, create_project['project_id'], [
+                ("Quarterly report", "finance"),
+                ("Quarterly review", "team"),
+            ])
+            prefix = await ac.get("/search/", params={'q': 'quart rep'}, headers=headers)
+            empty = await ac.get("/search/", params={'q': '!!!'}, headers=headers)
+
+        assert [task['task_id'] for task in prefix.json()] == [report]
+        assert empty.json() == []
+
+    @pytest.mark.asyncio
+    async def test_scope_and_pagination(self, create_project, db_session):
+        headers = {"Authorization": f"Bearer {create_project['data_user']['access_token']}"}
+        async with AsyncClient(transport=ASGITransport(app), base_url="http://test") as ac:
+            await ac.post("/new_user", json={"login": "second_user", "password": "second_password",
+                                             "email": "second@gmail.com"})
+            token = (await ac.post("/token", data={"username": "second_user",
+                                                   "password": "second_password"})).json()['access_token']
+            other_headers = {"Authorization": f"Bearer {token}"}
+            other_project = (await ac.post("/create_project", headers=other_headers,
+                                           json={"title": "other", "description": "project"})).json()['project_id']
+            await create_tasks(ac, other_headers, other_project, [("Report of another user", "other")])
+
+            ids = await create_tasks(ac, headers, create_project['project_id'],
+                                     [(f"Report {number}", "description") for number in range(5)])
+            await db_session.execute(update(Task).where(Task.task_id == ids[0]).values(status_id=4))
+            await db_session.commit()
+
+            found, cursor = [], None
+            while True:
+                params = {'q': 'report', 'limit': 2, **({'cursor': cursor} if cursor else {})}
+                response = await ac.get("/search/", params=params, headers=headers)
+                found += [task['task_id'] for task in response.json()]
+                cursor = response.headers.get(NEXT_CURSOR_HEADER)
+                if cursor is None:
+                    break
+
+        assert sorted(found) == sorted(ids[1:])  # без удалённой и без задач другого пользователя
+        assert len(found) == len(set(found))
+
+    @pytest.mark.asyncio
+    async def test_projects(self, create_task):
+        headers = {"Authorization": f"Bearer {create_task['data_user']['access_token']}"}
+        async with AsyncClient(transport=ASGITransport(app), base_url="http://test") as ac:
+            response = await ac.get("/search/", params={'q': 'test_title', 'kind': 'projects'}, headers=headers)
+            assert [project['project_id'] for project in response.json()] == [create_task['project_id']]
+
+            response = await ac.get("/search/", params={'q': 'test', 'kind': 'projects', 'project_id': 1},
+                                    headers=headers)
+            assert response.status_code == 400
+
+    @pytest.mark.asyncio
+    async def test_fuzzy(self, create_project, monkeypatch):
+        await search.load_search_features()
+        if not search.fuzzy_enabled:
+            pytest.skip('расширение pg_trgm не подключено')
+        headers = {"Authorization": f"Bearer {create_project['data_user']['access_token']}"}
+        async with AsyncClient(transport=ASGITransport(app), base_url="http://test") as ac:
+            task_id, = await create_tasks(ac, headers, create_project['project_id'], [("Quarterly report", "numbers")])
+            response = await ac.get("/search/", params={'q': 'quartrly reprt'}, headers=headers)  # опечатка
+        search.fuzzy_enabled = False
+        assert [task['task_id'] for task in response.json()] == [task_id]
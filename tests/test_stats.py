@@ -0,0 +1,87 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy import update
+
+import app.data_base.counters as counters
+from app.data_base.counters import install_counters, remove_counters
+from app.models.models import Task
+from app.run import app
+
+
+async def create_task(ac, headers: dict, project_id: int, **changes) -> int:
+    """Создаёт задачу и применяет к ней changes через /update_task. :return: id задачи"""
+    response = await ac.post("/create_task", headers=headers, json={
+        "project_id": project_id, "title": "task", "description": "task"
+    })
+    task_id = response.json()['task_id']
+    if changes:
+        response = await ac.post("/update_task", headers=headers, json={"task_id": task_id, **changes})
+        assert response.status_code == 200
+    return task_id
+
+
+class TestStats:
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize('use_counters', [False, True])
+    async def test_stats(self, use_counters, create_task, db_session, monkeypatch, assert_max_queries):
+        if use_counters:
+            monkeypatch.setattr(counters, 'STATS_COUNTERS', True)
+            # задача из фикстуры попадает в счётчики пересчётом, остальные - через триггер
+            await db_session.run_sync(lambda session: install_counters(session.connection()))
+            await db_session.commit()
+
+        project_id = create_task['project_id']
+        headers = {"Authorization": f"Bearer {create_task['data_user']['access_token']}"}
+        try:
+            async with AsyncClient(transport=ASGITransport(app), base_url="http://test") as ac:
+                await seed_project(ac, headers, project_id, db_session)
+                other_project = (await ac.post("/create_project", headers=headers, json={
+                    "title": "other", "description": "other"
+                })).json()['project_id']
+                await seed_project(ac, headers, other_project, db_session, full=False)
+
+                with assert_max_queries(1):
+                    response = await ac.get("/stats/", headers=headers)
+        finally:
+            if use_counters:
+                await db_session.run_sync(lambda session: remove_counters(session.connection()))
+                await db_session.commit()
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data['projects'] == [
+            {'project_id': project_id, 'total': 6,
+             'by_status': {'in_progress': 3, 'completed': 1, 'overdue': 1, 'archived': 1},
+             'by_priority': {'1': 3, '2': 1, '3': 1}},
+            {'project_id': other_project, 'total': 1,
+             'by_status': {'in_progress': 1, 'completed': 0, 'overdue': 0, 'archived': 0},
+             'by_priority': {'1': 1}},
+        ]
+        assert data['totals'] == {'total': 7,
+                                  'by_status': {'in_progress': 4, 'completed': 1, 'overdue': 1, 'archived': 1},
+                                  'by_priority': {'1': 4, '2': 1, '3': 1}}
+
+
+async def seed_project(ac, headers: dict, project_id: int, db_session, full: bool = True):
+    """
+    Задачи проекта: в работе с приоритетом 3, завершённая с приоритетом 2, просроченная (фоновая задача ещё не
+    записала статус), архивированная и восстановленная. (вместе с задачей из фикстуры - три в работе). Если не full - одна задача в работе
+    """
+    if not full:
+        await create_task(ac, headers, project_id)
+        return
+    await create_task(ac, headers, project_id, priority=3)
+    await create_task(ac, headers, project_id, priority=2, actual_completion_date=datetime.now(timezone.utc).isoformat())
+
+    overdue = await create_task(ac, headers, project_id)
+    await db_session.execute(update(Task).where(Task.task_id == overdue)
+                             .values(desired_completion_date=datetime.now(timezone.utc) - timedelta(days=1)))
+    await db_session.commit()
+
+    archived = await create_task(ac, headers, project_id, priority=2)
+    await ac.post("/delete_task", params={"task_id": archived}, headers=headers)
+    recovered = await create_task(ac, headers, project_id)
+    await ac.post("/delete_task", params={"task_id": recovered}, headers=headers)
+    await ac.post("/recover_task", params={"task_id": recovered}, headers=headers)
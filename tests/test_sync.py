@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy import update
+
+import app.sync as sync
+from app.background import sweep_overdue
+from app.models.models import Task
+from app.run import app
+
+
+@pytest.fixture(autouse=True)
+def no_sync_lag(monkeypatch):
+    monkeypatch.setattr(sync, 'SYNC_LAG_SECONDS', 0)  # изменения видны сразу
+
+
+class TestSync:
+    @pytest.mark.asyncio
+    async def test_changes_after_cursor(self, create_task):
+        headers = {"Authorization": f"Bearer {create_task['data_user']['access_token']}"}
+        async with AsyncClient(transport=ASGITransport(app), base_url="http://test") as ac:
+            data = (await ac.get("/sync", headers=headers)).json()  # первая синхронизация: всё
+            assert [project['project_id'] for project in data['projects']] == [create_task['project_id']]
+            assert [task['task_id'] for task in data['tasks']] == [create_task['task_id']]
+            assert data['has_more'] is False
+
+            data = (await ac.get("/sync", params={'cursor': data['cursor']}, headers=headers)).json()
+            assert data['projects'] == [] and data['tasks'] == []
+
+            await ac.post("/update_task", json={'task_id': create_task['task_id'], 'title': 'new'}, headers=headers)
+            data = (await ac.get("/sync", params={'cursor': data['cursor']}, headers=headers)).json()
+            assert data['projects'] == []
+            assert [task['title'] for task in data['tasks']] == ['new']
+
+            # архивация
+            await ac.post("/delete_task", params={'task_id': create_task['task_id']}, headers=headers)
+            data = (await ac.get("/sync", params={'cursor': data['cursor']}, headers=headers)).json()
+            assert [task['status']['status_id'] for task in data['tasks']] == [4]
+
+            # полное удаление
+            await ac.post("/delete_project", params={'project_id': create_task['project_id'], 'complete_remove': True},
+                          headers=headers)
+            data = (await ac.get("/sync", params={'cursor': data['cursor']}, headers=headers)).json()
+            assert data['projects'] == [] and data['tasks'] == []
+            assert data['deleted_project_ids'] == [create_task['project_id']]
+            assert data['deleted_task_ids'] == [create_task['task_id']]
+
+    @pytest.mark.asyncio
+    async def test_sync_pages(self, create_task):
+        headers = {"Authorization": f"Bearer {create_task['data_user']['access_token']}"}
+        async with AsyncClient(transport=ASGITransport(app), base_url="http://test") as ac:
+            since = datetime.now(timezone.utc).isoformat()
+            for title in ('first', 'second', 'third'):
+                await ac.post("/create_task", headers=headers, json={
+                    "project_id": create_task['project_id'], "title": title, "description": ""
+                })
+
+            titles = []
+            params = {'since': since, 'limit': 2}
+            while True:
+                data = (await ac.get("/sync", params=params, headers=headers)).json()
+                titles += [task['title'] for task in data['tasks']]
+                params = {'cursor': data['cursor'], 'limit': 2}
+                if not data['has_more']:
+                    break
+
+        assert titles == ['first', 'second', 'third']
+
+    @pytest.mark.asyncio
+    async def test_overdue_sweep_reaches_sync(self, db_session, create_task):
+        headers = {"Authorization": f"Bearer {create_task['data_user']['access_token']}"}
+        await db_session.execute(update(Task).where(Task.task_id == create_task['task_id']).values(
+            desired_completion_date=datetime.now(timezone.utc) - timedelta(days=1)))
+        await db_session.commit()
+        async with AsyncClient(transport=ASGITransport(app), base_url="http://test") as ac:
+            cursor = (await ac.get("/sync", headers=headers)).json()['cursor']
+
+            await sweep_overdue()  # статус в БД меняет только фоновая задача
+            data = (await ac.get("/sync", params={'cursor': cursor}, headers=headers)).json()
+        assert [(task['task_id'], task['status']['status_id']) for task in data['tasks']] == [(create_task['task_id'], 3)]
+
+    @pytest.mark.asyncio
+    async def test_sync_errors(self, create_user):
+        headers = {"Authorization": f"Bearer {create_user['access_token']}"}
+        async with AsyncClient(transport=ASGITransport(app), base_url="http://test") as ac:
+            response = await ac.get("/sync", params={'cursor': 'broken'}, headers=headers)
+            assert response.status_code == 400
+
+            old = datetime.now(timezone.utc) - timedelta(days=sync.SYNC_TOMBSTONE_TTL_DAYS + 1)
+            response = await ac.get("/sync", params={'since': old.isoformat()}, headers=headers)
+            assert response.status_code == 410